@@ -1,3 +1,3 @@
-from .anovacalc import anovanested, tukeyhsd
+from .anovacalc import anova_multiple, anova_sweep, anovanested, tukey_table, tukeyhsd
 from .workflow import GrowthCurveAnalysis
 from . import grouptools
\ No newline at end of file
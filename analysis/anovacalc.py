@@ -1,12 +1,17 @@
 from typing import *
 
+import numpy
 import pandas
+import patsy
 import statsmodels.api as sm
+from scipy import linalg, stats
 from loguru import logger
 from statsmodels.regression import linear_model
 from statsmodels.sandbox.stats.multicomp import TukeyHSDResults  # Used to add a typing annotation to tukeyhsd()
 from statsmodels.stats.multicomp import MultiComparison
 
+from analysis import tukey
+
 
 def tukeyhsd(statistics_table: pandas.DataFrame, column: str) -> Dict[str, TukeyHSDResults]:
 	"""
@@ -16,20 +21,12 @@ def tukeyhsd(statistics_table: pandas.DataFrame, column: str) -> Dict[str, Tukey
 	statistics_table: A table with each subject as a separate column
 	column: The column with the relevant values. Should be identical to the `y` variable used when generating figures.
 	"""
-	is_nested = statistics_table['condition'].nunique() != 1
-	if is_nested:
-		subjects = ['plate', 'strain', 'condition']
-	else:
-		subjects = ['plate', 'strain']
 	tukey_results = dict()
-	for subject in subjects:
+	for subject in _get_tukey_subjects(statistics_table):
 		logger.debug(f"tukey subject: '{subject}'")
 		logger.debug(f"tukey subject values: {statistics_table[subject].unique()}")
-		# MultiComparison doesn't work when there are only two possible groups, so disable this if we only have 2 categories.
-		number_of_unique_categories = statistics_table[subject].nunique()
-		if number_of_unique_categories > 2:
-			tukey_result = MultiComparison(statistics_table[column], statistics_table[subject]).tukeyhsd()
-			tukey_results[subject] = tukey_result
+		tukey_result = MultiComparison(statistics_table[column], statistics_table[subject]).tukeyhsd()
+		tukey_results[subject] = tukey_result
 
 	statistics_table['condition:strain'] = statistics_table['condition'] + "-" + statistics_table['strain']
 	mc = MultiComparison(statistics_table[column], statistics_table['condition:strain'])
@@ -38,6 +35,67 @@ def tukeyhsd(statistics_table: pandas.DataFrame, column: str) -> Dict[str, Tukey
 	return tukey_results
 
 
+def _get_tukey_subjects(statistics_table: pandas.DataFrame) -> List[str]:
+	""" The subjects compared by `tukeyhsd` and `tukey_table`. Subjects with only two groups are skipped (MultiComparison can't handle them)."""
+	is_nested = statistics_table['condition'].nunique() != 1
+	if is_nested:
+		subjects = ['plate', 'strain', 'condition']
+	else:
+		subjects = ['plate', 'strain']
+	return [subject for subject in subjects if statistics_table[subject].nunique() > 2]
+
+
+def tukey_table(statistics_table: pandas.DataFrame, column: str, alpha: float = 0.05, controls: Optional[Dict[str, str]] = None) -> pandas.DataFrame:
+	"""
+		Runs the same comparisons as `tukeyhsd` with the vectorized `tukey.tukey_hsd`.
+	Parameters
+	----------
+	statistics_table: A table with each subject as a separate column
+	column: The column with the relevant values. Should be identical to the `y` variable used when generating figures.
+	alpha: The family-wise error rate of each subject.
+	controls: Maps subjects to their control group (ex. `Filenames.controls`). Subjects with a control are only compared to the
+		control with `tukey.dunnett` instead of comparing every pair of groups. If both 'condition' and 'strain' have a control,
+		'condition_strain' is compared to the combined control (ex. 'RKS-WT').
+
+	Returns
+	-------
+	The tables from `tukey.tukey_hsd` or `tukey.dunnett` for each subject, combined. The `name` column holds the subject
+	('plate', 'strain', 'condition' or 'condition_strain').
+	"""
+	values = statistics_table[column]
+	subjects = {subject: statistics_table[subject] for subject in _get_tukey_subjects(statistics_table)}
+	subjects['condition_strain'] = statistics_table['condition'] + "-" + statistics_table['strain']
+	group_statistics = {name: tukey.group_statistics(values, groups) for name, groups in subjects.items()}
+	return compare_subjects(group_statistics, alpha, controls)
+
+
+def compare_subjects(group_statistics: Dict[str, pandas.DataFrame], alpha: float = 0.05, controls: Optional[Dict[str, str]] = None) -> pandas.DataFrame:
+	"""
+		Runs the comparisons for `tukey_table` from the `tukey.group_statistics` table of each subject.
+	Parameters
+	----------
+	group_statistics: Maps each subject to its `tukey.group_statistics` table.
+	alpha, controls: See `tukey_table`.
+	"""
+	controls = dict(controls) if controls else dict()
+	if 'condition' in controls and 'strain' in controls:
+		controls.setdefault('condition_strain', f"{controls['condition']}-{controls['strain']}")
+
+	tables = list()
+	for name, statistics in group_statistics.items():
+		control = controls.get(name)
+		if control is not None and control not in statistics.index:
+			logger.warning(f"The control '{control}' is missing from '{name}', so every pair of groups will be compared instead.")
+			control = None
+		if control is None:
+			table = tukey.compare_groups(statistics, alpha)
+		else:
+			table = tukey.compare_to_control(statistics, control, alpha)
+		table['name'] = name
+		tables.append(table)
+	return pandas.concat(tables, ignore_index = True)
+
+
 def anovanested(table: pandas.DataFrame, column: str) -> Tuple[linear_model.RegressionResults, pandas.DataFrame]:
 	"""
 		Calculates ANOVA
@@ -55,11 +113,7 @@ def anovanested(table: pandas.DataFrame, column: str) -> Tuple[linear_model.Regr
 
 	"""
 	# auc_aov <- aov(auc_l ~ condition*strain + plate, data=d_stat)
-	is_nested = table['condition'].nunique() != 1
-	if is_nested:
-		equation = f'{column} ~ condition + plate'
-	else:
-		equation = f'{column} ~ plate'
+	equation = f'{column} ~ {_get_anova_formula(table)}'
 	logger.info(f"The equation used for ANOVA is {equation}")
 	regression = linear_model.OLS.from_formula(equation, data = table).fit()
 
@@ -67,6 +121,149 @@ def anovanested(table: pandas.DataFrame, column: str) -> Tuple[linear_model.Regr
 	return regression, anova_table
 
 
+def _get_anova_formula(table: pandas.DataFrame) -> str:
+	""" The right-hand side of the formula used by `anovanested` and `anova_multiple`."""
+	is_nested = table['condition'].nunique() != 1
+	return 'condition + plate' if is_nested else 'plate'
+
+
+def _solve_responses(X: numpy.ndarray, column_names: List[str], term_slices: Dict[str, slice], responses: numpy.ndarray) \
+		-> Tuple[List[pandas.DataFrame], List[pandas.DataFrame]]:
+	"""
+		Fits the least-squares model for several responses with a single QR factorization of the design matrix.
+	Parameters
+	----------
+	X: numpy.ndarray
+		The design matrix.
+	column_names: List[str]
+		The names of the columns of `X`.
+	term_slices: Dict[str, slice]
+		The columns of `X` belonging to each term of the formula.
+	responses: numpy.ndarray
+		One column for each response. Shape (samples, responses).
+
+	Returns
+	-------
+	The ANOVA tables and the regression tables of the responses, in the same order as the columns of `responses`.
+	"""
+	Q, R = numpy.linalg.qr(X)
+	# Columns which are a combination of the columns before them can't be estimated (ex. a plate which only has one condition).
+	# Their coefficients are left missing and the design matrix is factorized again without them.
+	diagonal = numpy.abs(numpy.diag(R))
+	estimable = diagonal > 1E-10 * diagonal.max()
+	if not estimable.all():
+		Q, R = numpy.linalg.qr(X[:, estimable])
+	rank = estimable.sum()
+	degrees_of_freedom = len(X) - rank
+	# The effects of each column of the design matrix. The sequential (type 1) sum of squares of a term is the sum of its squared effects.
+	effects = numpy.zeros((X.shape[1], responses.shape[1]))
+	effects[estimable] = Q.T @ responses
+
+	coefficients = numpy.full((X.shape[1], responses.shape[1]), numpy.nan)
+	coefficients[estimable] = linalg.solve_triangular(R, effects[estimable])
+	residuals = responses - X[:, estimable] @ coefficients[estimable]
+	residual_sum_of_squares = (residuals ** 2).sum(axis = 0)
+	residual_mean_square = residual_sum_of_squares / degrees_of_freedom
+
+	R_inverse = linalg.solve_triangular(R, numpy.eye(rank))
+	unscaled_variance = numpy.full(X.shape[1], numpy.nan)
+	unscaled_variance[estimable] = (R_inverse ** 2).sum(axis = 1)
+	standard_errors = numpy.sqrt(unscaled_variance[:, numpy.newaxis] * residual_mean_square)
+	t = coefficients / standard_errors
+	t_critical = stats.t.ppf(0.975, degrees_of_freedom)
+
+	terms = list()
+	for term_name, term_slice in term_slices.items():
+		if term_name == 'Intercept':
+			continue
+		term_columns = numpy.zeros(X.shape[1], dtype = bool)
+		term_columns[term_slice] = True
+		term_columns &= estimable
+		sum_of_squares = (effects[term_columns] ** 2).sum(axis = 0)
+		terms.append((term_name, term_columns.sum(), sum_of_squares))
+
+	anova_tables = list()
+	regression_tables = list()
+	for index in range(responses.shape[1]):
+		rows = list()
+		for term_name, term_df, sum_of_squares in terms:
+			mean_square = sum_of_squares[index] / term_df
+			F = mean_square / residual_mean_square[index]
+			rows.append([term_df, sum_of_squares[index], mean_square, F, stats.f.sf(F, term_df, degrees_of_freedom)])
+		rows.append([degrees_of_freedom, residual_sum_of_squares[index], residual_mean_square[index], numpy.nan, numpy.nan])
+		anova_tables.append(pandas.DataFrame(
+			rows, index = [term[0] for term in terms] + ['Residual'], columns = ['df', 'sum_sq', 'mean_sq', 'F', 'PR(>F)']
+		))
+		regression_tables.append(pandas.DataFrame({
+			'coef':    coefficients[:, index],
+			'std err': standard_errors[:, index],
+			't':       t[:, index],
+			'P>|t|':   2 * stats.t.sf(numpy.abs(t[:, index]), degrees_of_freedom),
+			'[0.025':  coefficients[:, index] - t_critical * standard_errors[:, index],
+			'0.975]':  coefficients[:, index] + t_critical * standard_errors[:, index]
+		}, index = column_names))
+	return anova_tables, regression_tables
+
+
+def anova_multiple(table: pandas.DataFrame, columns: List[Any]) -> Dict[Any, Tuple[pandas.DataFrame, pandas.DataFrame]]:
+	"""
+		Runs the same ANOVA as `anovanested` on several response columns at once. The design matrix is built and factorized once
+		and every response is solved against it together. Responses with missing values are solved against the factorization of
+		the rows they do have, which is shared by every response with the same missing rows.
+	Parameters
+	----------
+	table: pandas.DataFrame
+		The `auc_statistics` table. Needs the `condition` and `plate` columns and each of `columns`.
+	columns: List[Any]
+		The response columns (ex. ['auc_e', 'auc_l', 'k', 'r']).
+
+	Returns
+	-------
+	Maps each column to a regression table (the coefficient table from the statsmodels summary) and an ANOVA table
+	(the same as `anovanested`'s `anova_lm` table).
+	"""
+	formula = _get_anova_formula(table)
+	logger.info(f"The equation used for ANOVA is [response] ~ {formula}")
+	design = patsy.dmatrix(formula, table, return_type = 'dataframe', NA_action = 'raise')
+	responses = table[columns].astype(float)
+
+	results = dict()
+	observed = responses.notna()
+	patterns = observed.T.drop_duplicates()
+	for _, pattern in patterns.iterrows():
+		rows = pattern.values
+		selected = [column for column in columns if (observed[column].values == rows).all()]
+		anova_tables, regression_tables = _solve_responses(
+			design.values[rows], list(design.columns), design.design_info.term_name_slices, responses.loc[rows, selected].values
+		)
+		for column, anova_table, regression_table in zip(selected, anova_tables, regression_tables):
+			results[column] = (regression_table, anova_table)
+	return {column: results[column] for column in columns}
+
+
+def anova_sweep(table: pandas.DataFrame, auc_table: pandas.DataFrame) -> pandas.DataFrame:
+	"""
+		Runs the `anovanested` ANOVA for each column of `auc_table` with `anova_multiple`. Used to check how sensitive the ANOVA is to the time limit.
+	Parameters
+	----------
+	table: pandas.DataFrame
+		The sample metadata (at least the `condition` and `plate` columns), indexed by sample.
+	auc_table: pandas.DataFrame
+		The AUC of each sample (rows) at each cutoff (columns). See `growthcurver.calculate_cumulative_auc`.
+
+	Returns
+	-------
+	The combined ANOVA tables, with a `cutoff` and a `term` column.
+	"""
+	data = table[['condition', 'plate']].join(auc_table.loc[table.index])
+	results = anova_multiple(data, list(auc_table.columns))
+	anova_tables = list()
+	for cutoff, (regression, anova_table) in results.items():
+		anova_table = anova_table.rename_axis('term').reset_index()
+		anova_table.insert(0, 'cutoff', cutoff)
+		anova_tables.append(anova_table)
+	return pandas.concat(anova_tables, ignore_index = True)
+
 
 def main():
 	from pathlib import Path
@@ -0,0 +1,171 @@
+"""
+	Fits a growth model to every sample at once.
+	Rather than calling `scipy.optimize.curve_fit` once per sample, the Levenberg-Marquardt
+	iterations are done on arrays with one row per sample so that each step is a handful of numpy calls.
+"""
+from typing import *
+
+import numpy
+
+# Same default tolerances as `scipy.optimize.leastsq`.
+FTOL = 1.49012E-8
+XTOL = 1.49012E-8
+MAX_ITERATIONS = 200
+
+
+def evaluate(function: Callable, t: numpy.ndarray, parameters: numpy.ndarray) -> numpy.ndarray:
+	""" Evaluates `function` for each row of `parameters`. Returns an array of shape (samples, timepoints)."""
+	columns = [parameters[:, [index]] for index in range(parameters.shape[1])]
+	return function(t, *columns)
+
+
+def numerical_jacobian(function: Callable, t: numpy.ndarray, parameters: numpy.ndarray) -> numpy.ndarray:
+	""" Forward-difference jacobian of `function`. Returns an array of shape (samples, timepoints, parameters)."""
+	base = evaluate(function, t, parameters)
+	jacobian = numpy.empty(base.shape + (parameters.shape[1],))
+	for index in range(parameters.shape[1]):
+		step = numpy.sqrt(numpy.finfo(float).eps) * numpy.maximum(numpy.abs(parameters[:, index]), 1E-8)
+		shifted = parameters.copy()
+		shifted[:, index] += step
+		jacobian[..., index] = (evaluate(function, t, shifted) - base) / step[:, numpy.newaxis]
+	return jacobian
+
+
+def _solve(matrix: numpy.ndarray, vector: numpy.ndarray) -> numpy.ndarray:
+	""" Solves a stack of linear systems, falling back to the pseudoinverse if any of them are singular."""
+	try:
+		return numpy.linalg.solve(matrix, vector[..., numpy.newaxis])[..., 0]
+	except numpy.linalg.LinAlgError:
+		return numpy.einsum('wpq,wq->wp', numpy.linalg.pinv(matrix), vector)
+
+
+def levenberg_marquardt(function: Callable, t: numpy.ndarray, y: numpy.ndarray, p0: numpy.ndarray, jacobian: Optional[Callable] = None,
+		max_iterations: int = MAX_ITERATIONS, ftol: float = FTOL, xtol: float = XTOL,
+		lower_bounds: Optional[Sequence[float]] = None) -> Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+	"""
+		Minimizes the sum of squared residuals between `y` and `function(t, *parameters)` for every sample at once.
+	Parameters
+	----------
+	function: Callable
+		The model, called as `function(t, *parameters)`. Must broadcast over a column of parameter values.
+	t: numpy.ndarray
+		The timepoints shared by every sample. Shape (timepoints,)
+	y: numpy.ndarray
+		The observed values. Shape (samples, timepoints). Missing values are ignored.
+	p0: numpy.ndarray
+		The initial guess. Either a single guess of shape (parameters,) or one guess per sample.
+	jacobian: Optional[Callable]
+		Called the same way as `function` and should return an array of shape (samples, timepoints, parameters).
+		A forward-difference approximation is used if not given.
+	max_iterations: int
+		The maximum number of iterations for each sample.
+	ftol, xtol: float
+		A sample has converged once an accepted step changes the sum of squares by less than `ftol` (relative)
+		or changes every parameter by less than `xtol` (relative).
+	lower_bounds: Optional[Sequence[float]]
+		The smallest allowed value of each parameter. Steps which would cross a bound stop at the bound, and parameters
+		which are at their bound and being pushed past it are held there while the others are fit.
+
+	Returns
+	-------
+	parameters: numpy.ndarray
+		The fitted parameters. Shape (samples, parameters)
+	converged: numpy.ndarray
+		Whether each sample converged.
+	iterations: numpy.ndarray
+		The number of iterations used for each sample.
+	messages: numpy.ndarray
+		Why each sample which didn't converge was stopped. Empty for samples which converged.
+	"""
+	t = numpy.asarray(t, dtype = float)
+	y = numpy.atleast_2d(numpy.asarray(y, dtype = float))
+	number_of_samples = y.shape[0]
+	parameters = numpy.array(numpy.broadcast_to(numpy.asarray(p0, dtype = float), (number_of_samples, numpy.shape(p0)[-1])))
+	number_of_parameters = parameters.shape[1]
+
+	if jacobian is None:
+		def jacobian(t_, *columns):
+			return numerical_jacobian(function, t_, numpy.hstack(columns))
+
+	if lower_bounds is not None:
+		lower_bounds = numpy.asarray(lower_bounds, dtype = float)
+		parameters = numpy.maximum(parameters, lower_bounds)
+
+	mask = ~numpy.isnan(y)
+	observed = numpy.where(mask, y, 0)
+
+	def get_residuals(index: numpy.ndarray, values: numpy.ndarray) -> numpy.ndarray:
+		with numpy.errstate(over = 'ignore', invalid = 'ignore', divide = 'ignore'):
+			residuals = observed[index] - evaluate(function, t, values)
+		return numpy.where(mask[index], residuals, 0)
+
+	everything = numpy.arange(number_of_samples)
+	residuals = get_residuals(everything, parameters)
+	cost = (residuals ** 2).sum(axis = 1)
+
+	damping = numpy.full(number_of_samples, 1E-3)
+	converged = numpy.zeros(number_of_samples, dtype = bool)
+	iterations = numpy.zeros(number_of_samples, dtype = int)
+	# Samples with invalid starting values or fewer observations than parameters can't be fit.
+	number_of_observations = mask.sum(axis = 1)
+	messages = numpy.full(number_of_samples, '', dtype = object)
+	messages[~numpy.isfinite(cost)] = "The model can't be evaluated at the initial guess."
+	too_few = number_of_observations < number_of_parameters
+	messages[too_few] = [f"Only {count} observations for {number_of_parameters} parameters." for count in number_of_observations[too_few]]
+	active = numpy.isfinite(cost) & ~too_few
+	identity = numpy.eye(number_of_parameters)
+
+	for _ in range(max_iterations):
+		index = numpy.flatnonzero(active)
+		if len(index) == 0:
+			break
+		current = parameters[index]
+		with numpy.errstate(over = 'ignore', invalid = 'ignore'):
+			current_jacobian = evaluate(jacobian, t, current) * mask[index][..., numpy.newaxis]
+		current_jacobian = numpy.nan_to_num(current_jacobian)
+		jtr = numpy.einsum('wtp,wt->wp', current_jacobian, residuals[index])
+		if lower_bounds is not None:
+			# Hold the parameters which are at their bound and which the gradient would move past it.
+			held = (current <= lower_bounds) & (jtr < 0)
+			current_jacobian = current_jacobian * ~held[:, numpy.newaxis, :]
+			jtr = numpy.where(held, 0, jtr)
+		jtj = numpy.einsum('wtp,wtq->wpq', current_jacobian, current_jacobian)
+
+		# Scale the damping term by the diagonal so the step doesn't depend on the units of each parameter.
+		diagonal = numpy.diagonal(jtj, axis1 = 1, axis2 = 2)
+		scale = numpy.maximum(diagonal, 1E-12 * diagonal.max(axis = 1, keepdims = True) + numpy.finfo(float).tiny)
+		matrix = jtj + damping[index, numpy.newaxis, numpy.newaxis] * identity * scale[:, numpy.newaxis, :]
+		step = _solve(matrix, jtr)
+		if lower_bounds is not None:
+			step = numpy.maximum(current + step, lower_bounds) - current
+
+		candidate = current + step
+		candidate_residuals = get_residuals(index, candidate)
+		candidate_cost = (candidate_residuals ** 2).sum(axis = 1)
+		improved = numpy.isfinite(candidate_cost) & (candidate_cost <= cost[index])
+
+		accepted = index[improved]
+		reduction = cost[accepted] - candidate_cost[improved]
+		small_cost = reduction <= ftol * cost[accepted]
+		small_step = numpy.all(numpy.abs(step[improved]) <= xtol * (numpy.abs(current[improved]) + xtol), axis = 1)
+		parameters[accepted] = candidate[improved]
+		residuals[accepted] = candidate_residuals[improved]
+		cost[accepted] = candidate_cost[improved]
+		iterations[index] += 1
+
+		damping[accepted] = numpy.maximum(damping[accepted] / 10, 1E-12)
+		rejected = index[~improved]
+		damping[rejected] = damping[rejected] * 10
+
+		finished = accepted[small_cost | small_step]
+		converged[finished] = True
+		active[finished] = False
+		# The damping only grows this large if no step can reduce the sum of squares, so the sample is already at a minimum.
+		stalled = rejected[damping[rejected] > 1E16]
+		converged[stalled] = True
+		active[stalled] = False
+
+	# Every other sample which didn't converge ran out of iterations.
+	unfinished = active & ~converged
+	messages[unfinished] = [f"Did not converge after {count} iterations." for count in iterations[unfinished]]
+	return parameters, converged, iterations, messages
@@ -0,0 +1,215 @@
+"""
+	Estimates the uncertainty of the fitted parameters and the AUC for each sample.
+	`calculate_standard_errors` uses the covariance of the fit, which is cheap to calculate but assumes the residuals are
+	normally distributed. `bootstrap_confidence_intervals` refits resampled data instead, fitting every replicate of every sample
+	in a few calls to the batched solver.
+"""
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from typing import *
+
+import numpy
+import pandas
+from scipy.integrate import trapz
+
+from analysis import batchfit
+from analysis.models import get_model
+
+# The values which are given a confidence interval by `bootstrap_confidence_intervals`.
+BOOTSTRAP_COLUMNS = ['k', 'N', 'r', 'auc_l', 'auc_e']
+# The tolerance of the bootstrap fits. Tighter than the default so the spread of the replicates isn't mixed with where each fit stopped.
+REFIT_TOLERANCE = 1E-12
+
+
+def _get_model_names(parameters: pandas.DataFrame) -> pandas.Series:
+	""" Tables from before the model registry only have logistic fits."""
+	if 'model' in parameters.columns:
+		return parameters['model']
+	return pandas.Series('logistic', index = parameters.index)
+
+
+def _was_fit(parameters: pandas.DataFrame) -> numpy.ndarray:
+	""" Samples which skipped the fit (see `growthcurver.screen_samples`) don't have a fit to estimate the uncertainty of."""
+	if 'status' in parameters.columns:
+		return parameters['status'].isin(['converged', 'retried']).values
+	return numpy.ones(len(parameters), dtype = bool)
+
+
+def calculate_standard_errors(table: pandas.DataFrame, parameters: pandas.DataFrame) -> pandas.DataFrame:
+	"""
+		Calculates the standard error of `k`, `N`, `r` and `auc_l` from the covariance of each fit, the same way as `curve_fit`'s `pcov`.
+		The standard error of `auc_l` uses the delta method.
+	Parameters
+	----------
+	table: pandas.DataFrame
+		The normalized growth values. Each row is a sample and each column is a timepoint.
+	parameters: pandas.DataFrame
+		The `summarize_growth` table.
+
+	Returns
+	-------
+	A table indexed by sample with the `k_se`, `N_se`, `r_se`, and `auc_l_se` columns. Failed fits and screened samples are given missing values.
+	"""
+	t = table.columns.values.astype(float)
+	model_names = _get_model_names(parameters).loc[table.index]
+	was_fit = _was_fit(parameters.loc[table.index])
+	result = pandas.DataFrame(numpy.nan, index = table.index, columns = ['k_se', 'N_se', 'r_se', 'auc_l_se'])
+	for name in model_names.unique():
+		model = get_model(name)
+		fitted = parameters.loc[table.index, model.parameters].values.astype(float)
+		selected = (model_names == name).values & was_fit & numpy.isfinite(fitted).all(axis = 1)
+		if not selected.any():
+			continue
+		fitted = fitted[selected]
+		values = table.values[selected].astype(float)
+		observed = ~numpy.isnan(values)
+		columns = [fitted[:, [index]] for index in range(fitted.shape[1])]
+
+		with numpy.errstate(over = 'ignore', invalid = 'ignore', divide = 'ignore'):
+			residuals = numpy.where(observed, values - model.function(t, *columns), 0)
+			jacobian = numpy.nan_to_num(model.jacobian(t, *columns) * observed[..., numpy.newaxis])
+		degrees_of_freedom = numpy.maximum(observed.sum(axis = 1) - fitted.shape[1], 1)
+		variance = (residuals ** 2).sum(axis = 1) / degrees_of_freedom
+		covariance = numpy.linalg.pinv(numpy.einsum('wtp,wtq->wpq', jacobian, jacobian)) * variance[:, numpy.newaxis, numpy.newaxis]
+
+		# The gradient of the area with respect to each parameter.
+		area = model.area_under_curve(t.max(), *columns)[:, 0]
+		gradient = numpy.empty_like(fitted)
+		for index in range(fitted.shape[1]):
+			step = numpy.sqrt(numpy.finfo(float).eps) * numpy.maximum(numpy.abs(fitted[:, index]), 1E-8)
+			shifted = list(columns)
+			shifted[index] = columns[index] + step[:, numpy.newaxis]
+			gradient[:, index] = (model.area_under_curve(t.max(), *shifted)[:, 0] - area) / step
+
+		standard_errors = numpy.sqrt(numpy.abs(numpy.diagonal(covariance, axis1 = 1, axis2 = 2)))
+		rows = numpy.flatnonzero(selected)
+		for index, column in enumerate(['k', 'N', 'r']):
+			result.iloc[rows, result.columns.get_loc(f"{column}_se")] = standard_errors[:, index]
+		result.iloc[rows, result.columns.get_loc('auc_l_se')] = numpy.sqrt(numpy.abs(numpy.einsum('wp,wpq,wq->w', gradient, covariance, gradient)))
+	return result
+
+
+def _bootstrap_chunk(chunk: Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray], t: numpy.ndarray, model: str, replicates: int,
+		batch_size: int, seed: int) -> numpy.ndarray:
+	"""
+		Runs the bootstrap for a group of samples. Defined at the module level so it can be sent to a process pool.
+	Parameters
+	----------
+	chunk: Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+		The position of each sample in the full table (used to seed the random number generator), the normalized values and the fitted parameters.
+
+	Returns
+	-------
+	An array with the bootstrapped `BOOTSTRAP_COLUMNS` for each sample and replicate. Shape (samples, replicates, 5).
+	Replicates which didn't converge are missing.
+	"""
+	model = get_model(model)
+	positions, values, fitted = chunk
+	number_of_samples = len(values)
+	# The replicates are refit to a tight tolerance below, so refine the original fit to the same tolerance first.
+	# Otherwise the replicates are centered on wherever the original fit happened to stop rather than on the best fit.
+	refined, converged, iterations, _ = batchfit.levenberg_marquardt(
+		model.function, t, values, fitted, jacobian = model.jacobian, ftol = REFIT_TOLERANCE, xtol = REFIT_TOLERANCE,
+		lower_bounds = model.lower_bounds
+	)
+	fitted = numpy.where(converged[:, numpy.newaxis], refined, fitted)
+	columns = [fitted[:, [index]] for index in range(fitted.shape[1])]
+	fitted_values = model.function(t, *columns)
+	observed = ~numpy.isnan(values)
+	residuals = values - fitted_values
+	# The residuals of a nonlinear fit don't have to average to 0. Center them so the resampled curves aren't shifted away from the fit.
+	with numpy.errstate(invalid = 'ignore'):
+		residuals = residuals - numpy.nanmean(numpy.where(observed, residuals, numpy.nan), axis = 1, keepdims = True)
+
+	# Each sample gets its own random number generator, so the result doesn't depend on how the samples are split between processes.
+	resampled_residuals = numpy.full((number_of_samples, replicates, len(t)), numpy.nan)
+	for row, position in enumerate(positions):
+		generator = numpy.random.default_rng([seed, int(position)])
+		sample_residuals = residuals[row, observed[row]]
+		if len(sample_residuals) == 0:
+			continue
+		choices = generator.integers(0, len(sample_residuals), size = (replicates, observed[row].sum()))
+		resampled_residuals[row][:, observed[row]] = sample_residuals[choices]
+	resampled_values = fitted_values[:, numpy.newaxis, :] + resampled_residuals
+
+	result = numpy.full((number_of_samples, replicates, len(BOOTSTRAP_COLUMNS)), numpy.nan)
+	for start in range(0, replicates, batch_size):
+		stop = min(start + batch_size, replicates)
+		y = resampled_values[:, start:stop].reshape(-1, len(t))
+		# Start each replicate from the original fit, which is usually very close to the answer.
+		p0 = numpy.repeat(fitted, stop - start, axis = 0)
+		estimates, converged, iterations, _ = batchfit.levenberg_marquardt(
+			model.function, t, y, p0, jacobian = model.jacobian, ftol = REFIT_TOLERANCE, xtol = REFIT_TOLERANCE,
+			lower_bounds = model.lower_bounds
+		)
+		estimates[~converged] = numpy.nan
+
+		area = model.area_under_curve(t.max(), *(estimates[:, [index]] for index in range(estimates.shape[1])))[:, 0]
+		empirical_area = numpy.where(converged, trapz(y, t, axis = 1), numpy.nan)
+		batch = numpy.column_stack([estimates[:, :3], area, empirical_area])
+		result[:, start:stop] = batch.reshape(number_of_samples, stop - start, len(BOOTSTRAP_COLUMNS))
+	return result
+
+
+def bootstrap_confidence_intervals(table: pandas.DataFrame, parameters: pandas.DataFrame, replicates: int = 1000, confidence: float = 0.95,
+		jobs: int = 1, batch_size: int = 100, seed: int = 0) -> pandas.DataFrame:
+	"""
+		Calculates percentile confidence intervals for `BOOTSTRAP_COLUMNS` by resampling the centered residuals of each fit.
+		Each replicate adds resampled residuals to the fitted curve and refits it with `batchfit.levenberg_marquardt`, starting from the original fit.
+	Parameters
+	----------
+	table: pandas.DataFrame
+		The normalized growth values. Each row is a sample and each column is a timepoint.
+	parameters: pandas.DataFrame
+		The `summarize_growth` table.
+	replicates: int
+		The number of bootstrap replicates for each sample.
+	confidence: float
+		The width of the confidence intervals.
+	jobs: int
+		The number of processes to use.
+	batch_size: int
+		The number of replicates of each sample to fit in each call to the solver. Limits how much memory is used.
+	seed: int
+
+	Returns
+	-------
+	A table indexed by sample with `[column]_lower` and `[column]_upper` for each of `BOOTSTRAP_COLUMNS`, and the number of replicates
+	which converged (`bootstrap_replicates`). Failed fits and screened samples are given missing values.
+	"""
+	t = table.columns.values.astype(float)
+	model_names = _get_model_names(parameters).loc[table.index]
+	was_fit = _was_fit(parameters.loc[table.index])
+	alpha = (1 - confidence) / 2
+	column_names = [f"{column}_{bound}" for column in BOOTSTRAP_COLUMNS for bound in ['lower', 'upper']]
+	result = pandas.DataFrame(numpy.nan, index = table.index, columns = column_names + ['bootstrap_replicates'])
+	result['bootstrap_replicates'] = 0
+
+	for name in model_names.unique():
+		model = get_model(name)
+		fitted = parameters.loc[table.index, model.parameters].values.astype(float)
+		selected = numpy.flatnonzero((model_names == name).values & was_fit & numpy.isfinite(fitted).all(axis = 1))
+		if len(selected) == 0:
+			continue
+		values = table.values.astype(float)
+
+		bootstrap_chunk = functools.partial(
+			_bootstrap_chunk, t = t, model = model.name, replicates = replicates, batch_size = batch_size, seed = seed
+		)
+		number_of_chunks = min(len(selected), max(jobs, 1) * 4)
+		chunks = [(positions, values[positions], fitted[positions]) for positions in numpy.array_split(selected, number_of_chunks)]
+		if jobs <= 1:
+			estimates = [bootstrap_chunk(chunk) for chunk in chunks]
+		else:
+			with ProcessPoolExecutor(max_workers = jobs) as executor:
+				estimates = list(executor.map(bootstrap_chunk, chunks))
+		estimates = numpy.concatenate(estimates)
+
+		with numpy.errstate(invalid = 'ignore'):
+			lower = numpy.nanquantile(estimates, alpha, axis = 1)
+			upper = numpy.nanquantile(estimates, 1 - alpha, axis = 1)
+		for index, column in enumerate(BOOTSTRAP_COLUMNS):
+			result.iloc[selected, result.columns.get_loc(f"{column}_lower")] = lower[:, index]
+			result.iloc[selected, result.columns.get_loc(f"{column}_upper")] = upper[:, index]
+		result.iloc[selected, result.columns.get_loc('bootstrap_replicates')] = (~numpy.isnan(estimates[..., 0])).sum(axis = 1)
+	return result
@@ -1,25 +1,282 @@
+import warnings
+from typing import *
+
 import numpy
 from loguru import logger
+from scipy import special
 
 very_small_number = 0
+# The fixed (k, N, r) guess used when the parameters can't be estimated from the data.
+default_guess = [1, .001, .004]
+# The same guess for the other models. The gompertz rate is scaled so that the maximum specific growth rate matches the logistic guess.
+default_guess_gompertz = [1, .001, .004 / numpy.log(1000)]
+default_guess_richards = [1, .001, .004, 1]
+default_guess_baranyi = [1, .001, .004, 0]
+
+
+def _log_add_exp(A, x):
+	"""
+		Calculates log(A + exp(x)) without overflowing when `x` is large. Broadcasts over arrays.
+		`A` can be negative as long as A + exp(x) is still positive.
+	"""
+	A, x = numpy.broadcast_arrays(A, x)
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore', over = 'ignore'):
+		positive = numpy.logaddexp(numpy.log(numpy.maximum(A, 0)), x)
+		negative = x + numpy.log1p(numpy.minimum(A, 0) * numpy.exp(-x))
+	return numpy.where(A >= 0, positive, negative)[()]
 
 
 def logistic_equation(t, k, N, r) -> float:
+	""" k / (1 + A*exp(-r*t)) with A = (k - N) / N. Calculated as k*exp(r*t - log(A + exp(r*t))) so that it can't overflow."""
+	values, integral = logistic_equation_and_integral(t, k, N, r)
+	return values
+
+
+def logistic_equation_and_integral(t, k, N, r) -> Tuple[Any, Any]:
+	"""
+		Evaluates `logistic_equation` and `logistic_equation_integral` at the same time, since both are based on log(A + exp(r*t)).
+		Broadcasts over arrays of timepoints and parameters.
+	"""
+	A = (k - N) / N
+	rt = r * t
+	L = _log_add_exp(A, rt)
+	return k * numpy.exp(rt - L), k * L / r
+
+
+def logistic_equation_jacobian(t, k, N, r) -> numpy.ndarray:
+	""" The partial derivatives of `logistic_equation` with respect to k, N, and r. The last axis of the result is (k, N, r)."""
 	A = (k - N) / N
 	E = numpy.exp(-r * t)
+	D = 1 + (A * E)
+
+	dk = 1 / D - (k * E) / (N * D ** 2)
+	dN = (k ** 2 * E) / (N ** 2 * D ** 2)
+	dr = (k * A * t * E) / D ** 2
+	return numpy.stack(numpy.broadcast_arrays(dk, dN, dr), axis = -1)
+
+
+def _estimate_plateau(t, y, window: int = 5) -> numpy.ndarray:
+	"""
+		Estimates the plateau of each sample. Curves are often still approaching the plateau at the last timepoint, so the largest
+		observed value underestimates it. The specific growth rate of the logistic curve, d(log y)/dt = r - (r/k)*y, is a straight line
+		in y, so a line fit to the specific growth rate between 20% and 90% of the largest value is extended to where the growth stops.
+		The estimate is limited to between the mean of the last `window` timepoints and 1.25 times the largest value.
+		Samples where the line can't be fit use the largest value instead.
+	Parameters
+	----------
+	t: The timepoints. Shape (timepoints,)
+	y: The observed values. Shape (samples, timepoints)
+	window: The number of timepoints at the end of the curve used as the lower limit of the plateau.
+	"""
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'), warnings.catch_warnings():
+		# Samples without any values are given the default guess by the caller.
+		warnings.simplefilter('ignore', RuntimeWarning)
+		largest = numpy.nanmax(y, axis = 1)
+		final = numpy.nanmean(y[:, -window:], axis = 1)
+
+		rates = numpy.diff(numpy.log(y), axis = 1) / numpy.diff(t)
+		midpoints = (y[:, :-1] + y[:, 1:]) / 2
+		fraction = y / largest[:, numpy.newaxis]
+		in_range = (fraction >= 0.2) & (fraction <= 0.9)
+		usable = in_range[:, :-1] & in_range[:, 1:] & numpy.isfinite(rates)
+
+		n = usable.sum(axis = 1)
+		sx = numpy.where(usable, midpoints, 0).sum(axis = 1)
+		sy = numpy.where(usable, rates, 0).sum(axis = 1)
+		sxx = numpy.where(usable, midpoints ** 2, 0).sum(axis = 1)
+		sxy = numpy.where(usable, midpoints * rates, 0).sum(axis = 1)
+		slope = (n * sxy - sx * sy) / (n * sxx - sx ** 2)
+		intercept = (sy - slope * sx) / n
+		extrapolated = -intercept / slope
+
+	found = (n >= 3) & (slope < 0) & (intercept > 0) & numpy.isfinite(extrapolated)
+	plateau = numpy.clip(extrapolated, numpy.minimum(final, largest), 1.25 * largest)
+	return numpy.where(found, plateau, largest)
 
-	result = k / (1 + (A * E))
-	return result
+
+def _estimate_growth_phase(t, y) -> Tuple[numpy.ndarray, ...]:
+	"""
+		Estimates the plateau, starting value, maximum specific growth rate and lag time of each sample.
+		- k: The plateau. See `_estimate_plateau`.
+		- N: The first observed value. Normalized data usually starts at 0, so this is limited to a small fraction of k.
+		- mu: The steepest slope of log(y), using only the points between 2% and 50% of k where the growth is still exponential
+			and the log isn't dominated by noise.
+		- lag: Where the tangent to log(y) at the steepest point crosses log(N).
+	Parameters
+	----------
+	t: The timepoints. Shape (timepoints,)
+	y: The observed values. Shape (samples, timepoints)
+	"""
+	k = _estimate_plateau(t, y)
+	k = numpy.where(numpy.isfinite(k) & (k > 0), k, default_guess[0])
+	N = numpy.maximum(numpy.nan_to_num(y[:, 0]), k * 1E-3)
+
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		logy = numpy.log(y)
+		slopes = numpy.diff(logy, axis = 1) / numpy.diff(t)
+		fraction = y / k[:, numpy.newaxis]
+		in_range = (fraction >= 0.02) & (fraction <= 0.5)
+		usable = in_range[:, :-1] & in_range[:, 1:] & numpy.isfinite(slopes)
+	slopes = numpy.where(usable, slopes, -numpy.inf)
+	steepest = slopes.argmax(axis = 1) if slopes.shape[1] else numpy.zeros(len(y), dtype = int)
+	mu = slopes.max(axis = 1, initial = -numpy.inf)
+	found = numpy.isfinite(mu) & (mu > 0)
+	mu = numpy.where(found, mu, default_guess[2])
+
+	rows = numpy.arange(len(y))
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		lag = t[steepest] - (logy[rows, steepest] - numpy.log(N)) / mu
+	lag = numpy.where(found & numpy.isfinite(lag), numpy.maximum(lag, 0), 0)
+	return k, N, mu, lag
+
+
+def _format_estimate(columns: List[numpy.ndarray], is_single: bool) -> numpy.ndarray:
+	result = numpy.stack(columns, axis = 1)
+	return result[0] if is_single else result
+
+
+def estimate_logistic_parameters(t, y) -> numpy.ndarray:
+	"""
+		Estimates starting values for k, N, and r from the data rather than using a fixed guess.
+		`r` is the maximum specific growth rate. See `_estimate_growth_phase`.
+	Parameters
+	----------
+	t: The timepoints. Shape (timepoints,)
+	y: The observed values. Either a single sample or an array of shape (samples, timepoints).
+
+	Returns
+	-------
+	An array with the (k, N, r) estimates for each sample. Shape (samples, 3), or (3,) if `y` is a single sample.
+	"""
+	t = numpy.asarray(t, dtype = float)
+	y = numpy.asarray(y, dtype = float)
+	k, N, r, lag = _estimate_growth_phase(t, numpy.atleast_2d(y))
+	return _format_estimate([k, N, r], y.ndim == 1)
 
 
 def logistic_equation_integral(t, k, N, r) -> float:
+	""" An antiderivative of `logistic_equation`, k/r * log(A + exp(r*t)). Uses `_log_add_exp` so that long runs with fast growth don't overflow."""
+	A = (k - N) / N
+	return k * _log_add_exp(A, r * t) / r
+
+
+
+def gompertz_equation(t, k, N, r):
+	""" The gompertz curve, parameterized so that it starts at `N` and approaches `k`."""
+	return k * numpy.exp(numpy.log(N / k) * numpy.exp(-r * t))
+
+
+def gompertz_equation_jacobian(t, k, N, r) -> numpy.ndarray:
+	""" The partial derivatives of `gompertz_equation` with respect to k, N, and r."""
+	b = numpy.log(N / k)
+	E = numpy.exp(-r * t)
+	y = k * numpy.exp(b * E)
+
+	dk = y * (1 - E) / k
+	dN = y * E / N
+	dr = -y * b * t * E
+	return numpy.stack(numpy.broadcast_arrays(dk, dN, dr), axis = -1)
+
+
+def gompertz_equation_integral(t, k, N, r):
+	""" An antiderivative of `gompertz_equation`, in terms of the exponential integral."""
+	b = numpy.log(N / k)
+	return -k / r * special.expi(b * numpy.exp(-r * t))
+
+
+def estimate_gompertz_parameters(t, y) -> numpy.ndarray:
+	""" Same as `estimate_logistic_parameters`. The maximum specific growth rate of the gompertz curve is r*log(k/N)."""
+	t = numpy.asarray(t, dtype = float)
+	y = numpy.asarray(y, dtype = float)
+	k, N, mu, lag = _estimate_growth_phase(t, numpy.atleast_2d(y))
+	r = mu / numpy.log(k / N)
+	return _format_estimate([k, N, r], y.ndim == 1)
+
+
+def richards_equation(t, k, N, r, v):
+	""" The generalized logistic (richards) curve. `v` controls where the inflection point is, and `v` = 1 is the logistic curve."""
+	Q = (k / N) ** v - 1
+	return k * (1 + Q * numpy.exp(-r * v * t)) ** (-1 / v)
+
+
+def richards_equation_jacobian(t, k, N, r, v) -> numpy.ndarray:
+	""" The partial derivatives of `richards_equation` with respect to k, N, r, and v."""
+	ratio = (k / N) ** v
+	Q = ratio - 1
+	E = numpy.exp(-r * v * t)
+	D = 1 + Q * E
+	y = k * D ** (-1 / v)
+
+	dk = y * (1 / k - E * ratio / (k * D))
+	dN = y * E * ratio / (N * D)
+	dr = y * Q * t * E / D
+	dv = y * (numpy.log(D) / v ** 2 - E * (ratio * numpy.log(k / N) - Q * r * t) / (v * D))
+	return numpy.stack(numpy.broadcast_arrays(dk, dN, dr, dv), axis = -1)
+
+
+def richards_equation_integral(t, k, N, r, v):
+	"""
+		An antiderivative of `richards_equation`. With u = 1 / (1 + Q*exp(-r*v*t)) and m = 1/v the integral is
+		k/(r*v) * u^m/m * 2F1(m, 1; m+1; u).
+	"""
+	m = 1 / v
+	u = 1 / (1 + ((k / N) ** v - 1) * numpy.exp(-r * v * t))
+	return k / (r * v) * u ** m / m * special.hyp2f1(m, 1, m + 1, u)
+
+
+def estimate_richards_parameters(t, y) -> numpy.ndarray:
+	""" Same as `estimate_logistic_parameters`, starting from the logistic curve (v = 1)."""
+	t = numpy.asarray(t, dtype = float)
+	y = numpy.asarray(y, dtype = float)
+	k, N, r, lag = _estimate_growth_phase(t, numpy.atleast_2d(y))
+	return _format_estimate([k, N, r, numpy.ones_like(k)], y.ndim == 1)
+
+
+def baranyi_equation(t, k, N, r, lag):
+	"""
+		The baranyi model with a logistic growth phase (m = 1), using the lag time rather than h0 = r*lag.
+		Written in terms of exp(-r*t) so it doesn't overflow at later timepoints.
+	"""
+	A = (k - N) / N
+	q = numpy.exp(-r * lag)
+	E = numpy.exp(-r * t)
+	H = (1 - q + A) * E + q
+	return k - k * A * E / H
+
+
+def baranyi_equation_jacobian(t, k, N, r, lag) -> numpy.ndarray:
+	""" The partial derivatives of `baranyi_equation` with respect to k, N, r, and lag."""
 	A = (k - N) / N
-	numerator = k * numpy.log(A + numpy.exp(r * t))
-	result = numerator / r
-	if result < 0 and False:
-		logger.warning(f"The calculated AUC is negative: {result}. Using a value of {very_small_number} instead.")
-		result = very_small_number
-	return result
+	q = numpy.exp(-r * lag)
+	E = numpy.exp(-r * t)
+	d = 1 - q + A
+	H = d * E + q
+
+	dk = 1 - A * E / H - k * E * (H - A * E) / (N * H ** 2)
+	dN = k ** 2 * E * (H - A * E) / (N ** 2 * H ** 2)
+	dE = -t * E
+	dH = lag * q * E + d * dE - lag * q
+	dr = -k * A * (dE * H - E * dH) / H ** 2
+	dlag = k * A * E * r * q * (E - 1) / H ** 2
+	return numpy.stack(numpy.broadcast_arrays(dk, dN, dr, dlag), axis = -1)
+
+
+def baranyi_equation_integral(t, k, N, r, lag):
+	""" An antiderivative of `baranyi_equation`."""
+	A = (k - N) / N
+	q = numpy.exp(-r * lag)
+	d = 1 - q + A
+	# log(1 + q/d * exp(r*t)) without overflowing.
+	log_term = numpy.logaddexp(0, r * t + numpy.log(q / d))
+	return k * t - k * A / d * (t - log_term / r)
+
+
+def estimate_baranyi_parameters(t, y) -> numpy.ndarray:
+	""" Same as `estimate_logistic_parameters`, with the lag time from `_estimate_growth_phase`."""
+	t = numpy.asarray(t, dtype = float)
+	y = numpy.asarray(y, dtype = float)
+	k, N, r, lag = _estimate_growth_phase(t, numpy.atleast_2d(y))
+	return _format_estimate([k, N, r, lag], y.ndim == 1)
 
 
 if __name__ == "__main__":
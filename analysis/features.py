@@ -0,0 +1,105 @@
+"""
+	Describes the growth phases of each sample directly from the growth values rather than from a fitted model.
+	Every feature is calculated for all samples at once from the samples x timepoints matrix.
+"""
+from typing import *
+
+import numpy
+import pandas
+
+# The columns added by `calculate_growth_features`.
+FEATURE_COLUMNS = ['lag_time', 'mu_max', 'doubling_time', 'time_to_max', 'time_to_threshold']
+
+
+def smooth(values: numpy.ndarray, window: int) -> numpy.ndarray:
+	"""
+		Centered moving average along the last axis. Missing values are ignored, and the window is truncated at the first and last timepoints.
+	"""
+	if window <= 1:
+		return values
+	observed = ~numpy.isnan(values)
+	zeros = numpy.zeros(values.shape[:-1] + (1,))
+	cumulative_sum = numpy.concatenate([zeros, numpy.cumsum(numpy.where(observed, values, 0), axis = -1)], axis = -1)
+	cumulative_count = numpy.concatenate([zeros, numpy.cumsum(observed, axis = -1)], axis = -1)
+
+	positions = numpy.arange(values.shape[-1])
+	lower = numpy.maximum(positions - window // 2, 0)
+	upper = numpy.minimum(positions + window // 2 + 1, values.shape[-1])
+	count = cumulative_count[..., upper] - cumulative_count[..., lower]
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		return (cumulative_sum[..., upper] - cumulative_sum[..., lower]) / count
+
+
+def calculate_growth_features(table: pandas.DataFrame, threshold: float = 0.1, window: int = 5, minimum_fraction: float = 0.02) -> pandas.DataFrame:
+	"""
+		Calculates the lag time, maximum specific growth rate, doubling time, time to the maximum value and time to reach `threshold`.
+	Parameters
+	----------
+	table: pandas.DataFrame
+		The growth values. Each row is a sample and each column is a timepoint. Each sample is normalized by its minimum value,
+		the same as `growthcurver.summarize_growth`.
+	threshold: float
+		The value used for `time_to_threshold`.
+	window: int
+		The number of timepoints in the moving average used to smooth each sample before taking any derivatives.
+	minimum_fraction: float
+		The specific growth rate is only calculated where the smoothed value is at least this fraction of the maximum value,
+		since the log of values near 0 is dominated by noise.
+
+	Returns
+	-------
+	A table indexed by sample with the columns
+	- `lag_time`: Where the tangent to log(y) at the maximum specific growth rate crosses the starting value.
+	- `mu_max`: The maximum specific growth rate, d(log y)/dt.
+	- `doubling_time`: log(2) / `mu_max`
+	- `time_to_max`: The timepoint with the largest smoothed value.
+	- `time_to_threshold`: When the smoothed values first reach `threshold`, interpolated between timepoints. Missing if they never do.
+	"""
+	t = table.columns.values.astype(float)
+	values = table.values.astype(float)
+	values = values - numpy.nanmin(values, axis = 1, keepdims = True)
+	smoothed = smooth(values, window)
+	rows = numpy.arange(len(smoothed))
+	has_values = ~numpy.isnan(smoothed).all(axis = 1)
+
+	maximum_index = numpy.where(numpy.isnan(smoothed), -numpy.inf, smoothed).argmax(axis = 1)
+	maximum = smoothed[rows, maximum_index]
+
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		floor = minimum_fraction * maximum[:, numpy.newaxis]
+		logy = numpy.log(numpy.where(smoothed >= floor, smoothed, numpy.nan))
+		rates = numpy.gradient(logy, t, axis = 1) if len(t) > 1 else numpy.full_like(logy, numpy.nan)
+	rates = numpy.where(numpy.isfinite(rates), rates, -numpy.inf)
+	steepest = rates.argmax(axis = 1)
+	mu_max = rates[rows, steepest]
+	grows = has_values & numpy.isfinite(mu_max) & (mu_max > 0)
+
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		mu_max = numpy.where(grows, mu_max, numpy.nan)
+		starting_value = numpy.maximum(numpy.nan_to_num(smoothed[:, 0]), 1E-3 * maximum)
+		lag_time = t[steepest] - (logy[rows, steepest] - numpy.log(starting_value)) / mu_max
+		lag_time = numpy.where(grows, numpy.maximum(lag_time, t[0]), numpy.nan)
+		doubling_time = numpy.log(2) / mu_max
+
+	# Interpolate between the last timepoint below the threshold and the first timepoint at or above it.
+	reached = smoothed >= threshold
+	first = reached.argmax(axis = 1)
+	previous = numpy.maximum(first - 1, 0)
+	y0, y1 = smoothed[rows, previous], smoothed[rows, first]
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		fraction = numpy.where(first > 0, (threshold - y0) / (y1 - y0), 0)
+	time_to_threshold = t[previous] + numpy.clip(numpy.nan_to_num(fraction), 0, 1) * (t[first] - t[previous])
+	time_to_threshold = numpy.where(reached.any(axis = 1), time_to_threshold, numpy.nan)
+
+	df = pandas.DataFrame(
+		{
+			'lag_time':          lag_time,
+			'mu_max':            mu_max,
+			'doubling_time':     doubling_time,
+			'time_to_max':       numpy.where(has_values, t[maximum_index], numpy.nan),
+			'time_to_threshold': time_to_threshold
+		},
+		index = table.index,
+		columns = FEATURE_COLUMNS
+	)
+	return df
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import *
+
+import numpy
+import pandas
+from loguru import logger
+
+try:
+	import pyarrow
+except ImportError:
+	# Feather files need pyarrow. Fall back to a pickle file if it isn't available.
+	pyarrow = None
+
+
+class FitCache:
+	"""
+		Saves the fitted model for each sample so that unchanged samples don't have to be refit on the next run.
+		Each fit is keyed by a hash of the sample's timepoints and values along with the fit settings (time limit, model, solver, etc.),
+		so editing a sample or changing how it is fit results in a cache miss rather than a stale fit.
+		Every fit is kept in a single table since each one is only a single row.
+	Parameters
+	----------
+	folder: Path
+		The folder to save the cache to.
+	maximum_size: int
+		The maximum number of fits to keep. The least recently used fits are removed once the cache grows larger than this.
+	"""
+	key_column = 'key'
+	time_column = 'lastused'
+
+	def __init__(self, folder: Path, maximum_size: int = 1_000_000):
+		self.folder = Path(folder)
+		self.folder.mkdir(parents = True, exist_ok = True)
+		self.maximum_size = maximum_size
+		suffix = '.feather' if pyarrow is not None else '.pkl'
+		self.filename = self.folder / f"fits{suffix}"
+		self.table = self._load()
+
+	def _load(self) -> pandas.DataFrame:
+		if not self.filename.exists():
+			return pandas.DataFrame(columns = [self.key_column, self.time_column]).set_index(self.key_column)
+		try:
+			if self.filename.suffix == '.feather':
+				table = pandas.read_feather(self.filename)
+			else:
+				table = pandas.read_pickle(self.filename)
+		except Exception as exception:
+			logger.warning(f"Could not read the fit cache {self.filename}: {exception}")
+			return pandas.DataFrame(columns = [self.key_column, self.time_column]).set_index(self.key_column)
+		return table.set_index(self.key_column)
+
+	@staticmethod
+	def get_keys(table: pandas.DataFrame, settings: Dict[str, Any]) -> pandas.Series:
+		"""
+			Calculates the key for each sample (row) in `table`.
+		Parameters
+		----------
+		table: pandas.DataFrame
+			The growth values. Each row is a sample and each column is a timepoint.
+		settings: Dict[str,Any]
+			Anything else which changes the result of the fit.
+		"""
+		settings_text = json.dumps(settings, sort_keys = True, default = str).encode()
+		timepoints = numpy.ascontiguousarray(table.columns.values, dtype = float).tobytes()
+		values = numpy.ascontiguousarray(table.values, dtype = float)
+
+		keys = list()
+		for row in values:
+			digest = hashlib.sha256(settings_text)
+			digest.update(timepoints)
+			digest.update(row.tobytes())
+			keys.append(digest.hexdigest())
+		return pandas.Series(keys, index = table.index)
+
+	def get(self, keys: pandas.Series) -> pandas.DataFrame:
+		""" Returns the cached fits for `keys`, indexed the same way as `keys`. Keys which have not been cached are left out."""
+		found = keys[keys.isin(self.table.index)]
+		self.table.loc[found.values, self.time_column] = time.time()
+		result = self.table.loc[found.values].drop(columns = self.time_column)
+		result.index = found.index
+		return result
+
+	def put(self, keys: pandas.Series, fits: pandas.DataFrame):
+		""" Adds the fits for `keys` to the cache. `fits` should be indexed the same way as `keys`."""
+		rows = fits.loc[keys.index].copy()
+		rows.index = pandas.Index(keys.values, name = self.key_column)
+		rows[self.time_column] = time.time()
+		rows = rows[~rows.index.duplicated()]
+		if len(self.table) == 0:
+			self.table = rows
+		else:
+			self.table = pandas.concat([self.table.drop(rows.index, errors = 'ignore'), rows])
+
+	def evict(self):
+		""" Removes the least recently used fits until the cache holds at most `self.maximum_size` fits."""
+		if len(self.table) > self.maximum_size:
+			logger.debug(f"Removing {len(self.table) - self.maximum_size} fits from the fit cache.")
+			self.table = self.table.sort_values(self.time_column).iloc[-self.maximum_size:] if self.maximum_size > 0 else self.table.iloc[:0]
+
+	def save(self):
+		""" Evicts old fits and writes the cache to disk."""
+		self.evict()
+		table = self.table.reset_index()
+		table[self.time_column] = table[self.time_column].astype(float)
+		if self.filename.suffix == '.feather':
+			table.to_feather(self.filename)
+		else:
+			table.to_pickle(self.filename)
@@ -0,0 +1,191 @@
+from pathlib import Path
+from typing import *
+
+import numpy
+import pandas
+import patsy
+from loguru import logger
+from scipy import stats
+
+from analysis import anovacalc
+
+try:
+	import pyarrow
+except ImportError:
+	# Feather files need pyarrow. Fall back to a pickle file if it isn't available.
+	pyarrow = None
+
+
+class GroupStatisticsStore:
+	"""
+		Keeps the count, sum and sum of squares of one column of the auc statistics table for every strain/condition/plate group,
+		so the ANOVA, group means and Tukey comparisons can be regenerated when new samples are added without reading the earlier samples again.
+		The sum of squares of each group is taken about the group mean, which keeps it accurate when the values are large.
+		The samples which have been added are saved as well, so adding the same sample twice doesn't count it twice.
+		The store doesn't know how the values were calculated, so use a separate folder for each set of analysis settings (time limit, models, etc.).
+	Parameters
+	----------
+	folder: Path
+		The folder to save the store to.
+	column: str
+		The column of the auc statistics table to keep the statistics of (ex. 'auc_e').
+	"""
+	keys = ['strain', 'condition', 'plate']
+	statistics_columns = ['count', 'sum', 'sum_of_squares']
+
+	def __init__(self, folder: Path, column: str):
+		self.folder = Path(folder)
+		self.folder.mkdir(parents = True, exist_ok = True)
+		self.column = column
+		suffix = '.feather' if pyarrow is not None else '.pkl'
+		self.filename = self.folder / f"groups.{column}{suffix}"
+		self.filename_samples = self.folder / f"samples.{column}{suffix}"
+		self.table = self._load(self.filename, self.keys + self.statistics_columns)
+		self.samples = set(self._load(self.filename_samples, ['sample'])['sample'])
+
+	@staticmethod
+	def _load(filename: Path, columns: List[str]) -> pandas.DataFrame:
+		if not filename.exists():
+			return pandas.DataFrame(columns = columns)
+		try:
+			if filename.suffix == '.feather':
+				return pandas.read_feather(filename)
+			return pandas.read_pickle(filename)
+		except Exception as exception:
+			logger.warning(f"Could not read the group statistics {filename}: {exception}")
+			return pandas.DataFrame(columns = columns)
+
+	@staticmethod
+	def _combine(table: pandas.DataFrame, keys: List[str]) -> pandas.DataFrame:
+		"""
+			Combines the rows of `table` which share the same `keys`. The sums of squares are combined with the parallel
+			variance formula, so they stay relative to the mean of the combined group.
+		"""
+		table = table.assign(mean = table['sum'] / table['count'])
+		grouped = table.groupby(keys, sort = True)
+		result = grouped[['count', 'sum']].sum()
+		group_means = (result['sum'] / result['count'])
+		table = table.join(group_means.rename('group_mean'), on = keys)
+		between = table['count'] * (table['mean'] - table['group_mean']) ** 2
+		result['sum_of_squares'] = (table['sum_of_squares'] + between).groupby([table[key] for key in keys]).sum()
+		return result
+
+	def update(self, table: pandas.DataFrame):
+		"""
+			Adds the samples in `table` which haven't been added yet. Only reads the new rows.
+		Parameters
+		----------
+		table: pandas.DataFrame
+			The auc statistics table, indexed by sample. Needs the `strain`, `condition` and `plate` columns and `self.column`.
+		"""
+		is_new = ~table.index.isin(self.samples)
+		if not is_new.all():
+			logger.info(f"Skipping {(~is_new).sum()} samples which are already in the group statistics.")
+		rows = table.loc[is_new, self.keys + [self.column]]
+		rows = rows[rows[self.column].notna()]
+		if len(rows) == 0:
+			return
+		values = rows[self.column].astype(float)
+		grouped = values.groupby([rows[key] for key in self.keys])
+		new_groups = pandas.DataFrame({
+			'count':          grouped.count(),
+			'sum':            grouped.sum(),
+			'sum_of_squares': grouped.var(ddof = 0) * grouped.count()
+		}).reset_index()
+
+		combined = pandas.concat([self.table, new_groups], ignore_index = True)
+		combined[self.statistics_columns] = combined[self.statistics_columns].astype(float)
+		self.table = self._combine(combined, self.keys).reset_index()
+		self.samples.update(rows.index)
+
+	def save(self):
+		samples = pandas.DataFrame({'sample': sorted(self.samples)})
+		for table, filename in [(self.table, self.filename), (samples, self.filename_samples)]:
+			if filename.suffix == '.feather':
+				table.reset_index(drop = True).to_feather(filename)
+			else:
+				table.to_pickle(filename)
+
+	def group_statistics(self, subject: Union[str, List[str]]) -> pandas.DataFrame:
+		"""
+			The `tukey.group_statistics` table for `subject`, which is any combination of 'strain', 'condition', and 'plate'.
+			Combinations are labeled by joining the group names with '-' (ex. ['condition', 'strain'] gives 'RKS-WT').
+		"""
+		subject = [subject] if isinstance(subject, str) else list(subject)
+		table = self._combine(self.table, subject)
+		if len(subject) > 1:
+			table.index = ["-".join(str(label) for label in labels) for labels in table.index]
+		else:
+			table.index = table.index.get_level_values(0)
+		table['mean'] = table['sum'] / table['count']
+		return table[['count', 'mean', 'sum_of_squares']].sort_index()
+
+	def anova(self) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
+		"""
+			Regenerates the `anovanested` ANOVA from the condition/plate groups. The normal equations of the linear model only depend
+			on the count and sum of each group, and the residual sum of squares also needs the sums of squares.
+		Returns
+		-------
+		The regression table and the ANOVA table, formatted the same way as `anovacalc.anova_multiple`.
+		"""
+		cells = self._combine(self.table, ['condition', 'plate']).reset_index()
+		formula = anovacalc._get_anova_formula(cells)
+		design = patsy.dmatrix(formula, cells, return_type = 'dataframe')
+		X = design.values
+		counts = cells['count'].values
+		# Center the values on the grand mean so the sums of squares don't lose precision.
+		grand_mean = cells['sum'].sum() / counts.sum()
+		sums = cells['sum'].values - counts * grand_mean
+		total_sum_of_squares = (cells['sum_of_squares'].values + sums ** 2 / counts).sum()
+		XtX = X.T @ (counts[:, numpy.newaxis] * X)
+		Xty = X.T @ sums
+
+		def fit(columns: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray, int, float]:
+			inverse = numpy.linalg.pinv(XtX[numpy.ix_(columns, columns)], hermitian = True)
+			coefficients = inverse @ Xty[columns]
+			rank = numpy.linalg.matrix_rank(XtX[numpy.ix_(columns, columns)], hermitian = True)
+			return coefficients, inverse, rank, total_sum_of_squares - coefficients @ Xty[columns]
+
+		# The sequential (type 1) sum of squares of each term is the drop in the residual sum of squares when it is added to the model.
+		rows = list()
+		columns = numpy.zeros(X.shape[1], dtype = bool)
+		previous_rank, previous_residual = 0, total_sum_of_squares
+		for term_name, term_slice in design.design_info.term_name_slices.items():
+			columns[term_slice] = True
+			coefficients, inverse, rank, residual = fit(columns)
+			if term_name != 'Intercept':
+				rows.append([term_name, rank - previous_rank, previous_residual - residual])
+			previous_rank, previous_residual = rank, residual
+
+		degrees_of_freedom = counts.sum() - previous_rank
+		residual_mean_square = previous_residual / degrees_of_freedom
+		anova_table = pandas.DataFrame(rows, columns = ['term', 'df', 'sum_sq']).set_index('term')
+		anova_table.index.name = None
+		anova_table['mean_sq'] = anova_table['sum_sq'] / anova_table['df']
+		anova_table['F'] = anova_table['mean_sq'] / residual_mean_square
+		anova_table['PR(>F)'] = stats.f.sf(anova_table['F'], anova_table['df'], degrees_of_freedom)
+		anova_table.loc['Residual'] = [degrees_of_freedom, previous_residual, residual_mean_square, numpy.nan, numpy.nan]
+		anova_table['df'] = anova_table['df'].astype(float)
+
+		# Undo the centering.
+		coefficients[design.columns.get_loc('Intercept')] += grand_mean
+		standard_errors = numpy.sqrt(numpy.diag(inverse) * residual_mean_square)
+		t = coefficients / standard_errors
+		t_critical = stats.t.ppf(0.975, degrees_of_freedom)
+		regression_table = pandas.DataFrame({
+			'coef':    coefficients,
+			'std err': standard_errors,
+			't':       t,
+			'P>|t|':   2 * stats.t.sf(numpy.abs(t), degrees_of_freedom),
+			'[0.025':  coefficients - t_critical * standard_errors,
+			'0.975]':  coefficients + t_critical * standard_errors
+		}, index = design.columns)
+		return regression_table, anova_table
+
+	def tukey_table(self, alpha: float = 0.05, controls: Optional[Dict[str, str]] = None) -> pandas.DataFrame:
+		""" Regenerates `anovacalc.tukey_table` from the stored groups."""
+		subjects = ['plate', 'strain', 'condition'] if self.table['condition'].nunique() != 1 else ['plate', 'strain']
+		group_statistics = {subject: self.group_statistics(subject) for subject in subjects}
+		group_statistics = {subject: table for subject, table in group_statistics.items() if len(table) > 2}
+		group_statistics['condition_strain'] = self.group_statistics(['condition', 'strain'])
+		return anovacalc.compare_subjects(group_statistics, alpha, controls)
@@ -1,5 +1,7 @@
+import functools
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import *
 
 import numpy
 import pandas
@@ -7,53 +9,591 @@ from loguru import logger
 from scipy.integrate import trapz
 from scipy.optimize import curve_fit
 
-from analysis import equations
+from analysis import batchfit, equations
+from analysis.fitcache import FitCache
+from analysis.models import GrowthModel, get_model
 
 
-def summarize_growth(table: pandas.DataFrame, time_limit: Optional[int] = None) -> pandas.DataFrame:
+# The columns describing how each fit went. See `summarize_growth`.
+FIT_RECORD_COLUMNS = ['converged', 'status', 'iterations', 'message']
+# The `status` of samples which `screen_samples` kept away from the optimizer.
+SCREENED_STATUSES = ['no-growth', 'saturated']
+
+
+def summarize_growth(table: pandas.DataFrame, time_limit: Optional[int] = None, method: str = 'scipy', jobs: int = 1,
+		estimate_guess: bool = True, analytic_jacobian: bool = True, fault_tolerant: bool = False, cache: Optional[FitCache] = None,
+		models: Union[str, List[str]] = 'logistic', minimum_growth: Optional[float] = None) -> pandas.DataFrame:
 	"""
-		Fits the growth values to a logistic function.
+		Fits the growth values to a growth model (the logistic function by default).
 		Assumes that `table` is formatted so that each row is indexed by sample.
+	Parameters
+	----------
+	table: pandas.DataFrame
+	time_limit: Optional[int]
+		Timepoints after this are ignored.
+	method: {'scipy', 'batch', 'fast'}
+		'scipy' calls `scipy.optimize.curve_fit` for each sample. 'batch' fits every sample at once with `batchfit.levenberg_marquardt`.
+		'fast' doesn't fit the curves at all, and instead estimates the logistic parameters with `estimate_logistic_fast`.
+	jobs: int
+		The number of processes used by the 'scipy' method.
+	estimate_guess: bool
+		Whether to estimate the initial guess for each sample from the data (ex. `equations.estimate_logistic_parameters`)
+		rather than using the model's default guess for every sample.
+	analytic_jacobian: bool
+		Whether to use the model's jacobian (ex. `equations.logistic_equation_jacobian`) rather than a finite-difference approximation.
+	fault_tolerant: bool
+		If a sample can't be fit, retry it with alternate starting values and then with a bounded solver rather than
+		raising an error. Samples which still fail are given missing values and a 'failed' status.
+	cache: Optional[FitCache]
+		If given, samples which were already fit with the same values and settings are loaded from the cache rather than refit.
+	models: Union[str, List[str]]
+		The names of the growth models to fit (see `analysis.models`). If more than one model is given, every model is fit to every
+		sample and each sample keeps the model with the lowest AIC.
+
+	Returns
+	-------
+	A table indexed by sample with the fitted parameters (`k`, `N`, `r`, plus any extra parameters of the fitted models),
+	the fit statistics (`auc_l`, `auc_e`, `sigma`, `aic`), the name of the selected `model`, and a record of each fit:
+	- `converged`: Whether the fit converged.
+	- `status`: One of 'converged', 'retried' (converged after a retry), 'failed', or the `screen_samples` category of samples which skipped the fit.
+	- `iterations`: The solver iterations (batch) or the function evaluations (scipy) used for the fit, including retries.
+	- `message`: Describes why the first attempt failed, if it did.
 	"""
 	if time_limit:
 		table = table[[i for i in table.columns if i <= time_limit]]
 
+	if method not in {'scipy', 'batch', 'fast'}:
+		message = f"Unknown fitting method: '{method}'. Expected one of 'scipy', 'batch' or 'fast'."
+		raise ValueError(message)
+	model_names = [get_model(name).name for name in ([models] if isinstance(models, str) else models)]
+	if method == 'fast' and model_names != ['logistic']:
+		message = f"The 'fast' method only estimates the logistic model. Got {model_names}"
+		raise ValueError(message)
+
+	fit = functools.partial(
+		_fit_models, models = model_names, method = method, jobs = jobs, estimate_guess = estimate_guess, analytic_jacobian = analytic_jacobian,
+		fault_tolerant = fault_tolerant, minimum_growth = minimum_growth
+	)
+	if cache is None:
+		df = fit(table)
+	else:
+		settings = {
+			'time_limit':        time_limit,
+			'model':             model_names,
+			'method':            method,
+			'estimate_guess':    estimate_guess,
+			'analytic_jacobian': analytic_jacobian,
+			'fault_tolerant':    fault_tolerant,
+			'minimum_growth':    minimum_growth
+		}
+		keys = cache.get_keys(table, settings)
+		cached = cache.get(keys)
+		missing = ~table.index.isin(cached.index)
+		logger.debug(f"Loaded {len(table) - missing.sum()} of {len(table)} fits from the fit cache.")
+		if missing.any():
+			fitted = fit(table[missing])
+			cache.put(keys[missing], fitted)
+			df = pandas.concat([cached, fitted]).loc[table.index]
+		else:
+			df = cached.loc[table.index]
+		cache.save()
+		# The cache holds the columns for every model, not just the ones which were fit.
+		df = df.reindex(columns = get_output_columns(model_names))
+
+	df.index.name = 'sample'
+	return df
+
+
+def _fit_models(table: pandas.DataFrame, models: List[str], method: str, jobs: int, estimate_guess: bool, analytic_jacobian: bool,
+		fault_tolerant: bool, minimum_growth: Optional[float] = None) -> pandas.DataFrame:
+	""" Fits every model in `models` and picks the best model for each sample. See `summarize_growth`."""
+	if minimum_growth is None:
+		categories = pandas.Series('normal', index = table.index)
+	else:
+		categories = screen_samples(table, minimum_growth)
+	is_normal = (categories == 'normal').values
+	screened = describe_screened_samples(table[~is_normal], categories[~is_normal], models)
+	if not is_normal.any():
+		return screened
+	table = table[is_normal]
+
+	normalized_table = table.sub(table.min(axis = 1), axis = 0)
 	results = list()
+	for name in models:
+		model = get_model(name)
+		if method == 'fast':
+			parameters = estimate_logistic_fast(table)
+		elif method == 'batch':
+			parameters = fit_batch(table, model.name, estimate_guess, analytic_jacobian, fault_tolerant)
+		else:
+			parameters = fit_scipy(table, model.name, jobs, estimate_guess, analytic_jacobian, fault_tolerant)
+		statistics = calculate_fit_statistics(normalized_table, parameters, model.name)
+		result = pandas.concat([parameters[model.parameters], statistics], axis = 1)
+		result['model'] = model.name
+		results.append(pandas.concat([result, parameters[FIT_RECORD_COLUMNS]], axis = 1))
+	df = select_models(results, models)
+	if len(screened) > 0:
+		df = pandas.concat([df, screened]).loc[categories.index]
+	return df
+
+
+def screen_samples(table: pandas.DataFrame, minimum_growth: float = 0.1, saturation_fraction: float = 0.9) -> pandas.Series:
+	"""
+		Sorts the samples into the ones which can't be fit to a growth curve and the ones which should be fit.
+		- 'no-growth': The sample never grows more than `minimum_growth` above its minimum value.
+			Unlike `ValidateTable._check_maximum_growth`, this ignores the background absorbance of the sample.
+		- 'saturated': The first few timepoints are already at least `saturation_fraction` of the maximum, so there is no growth phase to fit.
+		- 'normal': Everything else.
+	Parameters
+	----------
+	table: pandas.DataFrame
+		The growth values. Each row is a sample and each column is a timepoint.
+
+	Returns
+	-------
+	The category of each sample.
+	"""
+	values = table.values.astype(float)
+	with numpy.errstate(invalid = 'ignore'):
+		values = values - numpy.nanmin(values, axis = 1, keepdims = True, initial = numpy.inf)
+		growth = numpy.nanmax(values, axis = 1, initial = -numpy.inf)
+		starting_value = numpy.nanmean(values[:, :3], axis = 1)
+	no_growth = growth < minimum_growth
+	saturated = ~no_growth & (starting_value >= saturation_fraction * growth)
+
+	categories = numpy.where(no_growth, SCREENED_STATUSES[0], numpy.where(saturated, SCREENED_STATUSES[1], 'normal'))
+	for category in SCREENED_STATUSES:
+		samples = table.index[categories == category]
+		if len(samples) > 0:
+			logger.info(f"Skipping the fit for {len(samples)} '{category}' samples: {list(samples)}")
+	return pandas.Series(categories, index = table.index)
+
+
+def describe_screened_samples(table: pandas.DataFrame, categories: pandas.Series, models: List[str]) -> pandas.DataFrame:
+	"""
+		Describes the samples which skipped the fit (see `screen_samples`) with a flat line at their mean value rather than a growth curve.
+		`k` and `N` are the mean value, `r` is 0 for 'no-growth' samples and missing for 'saturated' samples (the growth happened before
+		the first timepoint), and `auc_l` is the area under the flat line. The `status` column holds the category.
+	"""
+	normalized_table = table.sub(table.min(axis = 1), axis = 0)
+	t = table.columns.values.astype(float)
+	values = normalized_table.values.astype(float)
+	with numpy.errstate(invalid = 'ignore'):
+		level = numpy.nanmean(values, axis = 1) if values.size else numpy.zeros(len(values))
+	fitted_values = level[:, numpy.newaxis]
+
+	df = pandas.DataFrame(index = table.index, columns = get_output_columns(models))
+	df['k'] = level
+	df['N'] = level
+	df['r'] = numpy.where(categories.values == 'no-growth', 0, numpy.nan)
+	df['auc_l'] = level * t.max() if len(t) else numpy.nan
+	df['auc_e'] = trapz(values, t, axis = 1) if len(t) else numpy.nan
+	df['sigma'] = _calculate_sigma(values, fitted_values)
+	df['aic'] = _calculate_aic(values, fitted_values, 1)
+	df['model'] = models[0]
+	df['converged'] = False
+	df['status'] = categories.values
+	df['iterations'] = 0
+	df['message'] = [f"Skipped the fit since the sample was classified as '{category}'." for category in categories.values]
+	df.index.name = 'sample'
+	return df
+
+
+def get_output_columns(models: List[str]) -> List[str]:
+	""" The columns of the `summarize_growth` table when fitting `models`."""
+	parameter_columns = list()
+	for name in models:
+		parameter_columns += [i for i in get_model(name).parameters if i not in parameter_columns]
+	return parameter_columns + ['auc_l', 'auc_e', 'sigma', 'aic', 'model'] + FIT_RECORD_COLUMNS
+
+
+def select_models(results: List[pandas.DataFrame], models: List[str]) -> pandas.DataFrame:
+	"""
+		Combines the results of fitting each of `models` to the same samples, keeping the model with the lowest AIC for each sample.
+		Samples which could not be fit by any model keep the result from the first model.
+	"""
+	columns = get_output_columns(models)
+	results = [result.reindex(columns = columns) for result in results]
+
+	aic = numpy.stack([numpy.nan_to_num(result['aic'].values.astype(float), nan = numpy.inf) for result in results], axis = 1)
+	best = aic.argmin(axis = 1)
+	df = results[0].copy()
+	for index, result in enumerate(results[1:], start = 1):
+		df.loc[best == index] = result.loc[best == index]
+	return df
+
+
+def get_failure_report(table: pandas.DataFrame) -> pandas.DataFrame:
+	""" Returns the samples from a `summarize_growth` table which failed or had to be retried. Screened samples were never fit, so they aren't included."""
+	failed = (table['status'] != 'converged') & ~table['status'].isin(SCREENED_STATUSES)
+	return table.loc[failed, ['k', 'N', 'r'] + FIT_RECORD_COLUMNS]
+
+
+def get_alternate_guesses(p0: Sequence[float], model: str = 'logistic') -> List[numpy.ndarray]:
+	""" Starting values to retry a failed fit with. Most failures come from a poor guess for the growth rate."""
+	model = get_model(model)
+	rate = model.parameters.index('r')
+	slower = numpy.array(p0, dtype = float)
+	slower[rate] /= 2
+	faster = numpy.array(p0, dtype = float)
+	faster[rate] *= 2
+	return [numpy.array(model.default_guess, dtype = float), slower, faster]
+
+
+def _curve_fit(xdata: numpy.ndarray, ydata: numpy.ndarray, p0: Sequence[float], model: GrowthModel, analytic_jacobian: bool = True,
+		bounded: bool = False, evaluations: Optional[List[int]] = None) -> numpy.ndarray:
+	"""
+		Calls `curve_fit`. The number of function evaluations is added to `evaluations[0]`, even if the fit fails.
+		If `bounded` is set, the parameters are limited to `model.lower_bounds` and the 'trf' solver is used.
+	"""
+	if evaluations is None:
+		evaluations = [0]
+
+	def function(t, *parameters):
+		evaluations[0] += 1
+		return model.function(t, *parameters)
+
+	jacobian = model.jacobian if analytic_jacobian else None
+	if bounded:
+		lower = model.lower_bounds
+		p0 = numpy.clip(p0, lower, numpy.inf)
+		parameters, pcov = curve_fit(function, xdata, ydata, p0 = p0, jac = jacobian, bounds = (lower, numpy.inf), method = 'trf')
+	else:
+		parameters, pcov = curve_fit(function, xdata, ydata, p0 = p0, jac = jacobian)
+		if not model.within_bounds(parameters):
+			return _curve_fit(xdata, ydata, parameters, model, analytic_jacobian, True, evaluations)
+	return parameters
+
+
+def _retry_scipy(xdata: numpy.ndarray, ydata: numpy.ndarray, p0: Sequence[float], model: GrowthModel, analytic_jacobian: bool,
+		evaluations: List[int]) -> Optional[numpy.ndarray]:
+	""" Retries a failed fit with alternate starting values, then with a bounded solver. Returns `None` if every attempt fails."""
+	attempts = [(guess, False) for guess in get_alternate_guesses(p0, model.name)] + [(p0, True)]
+	for guess, bounded in attempts:
+		try:
+			return _curve_fit(xdata, ydata, guess, model, analytic_jacobian, bounded, evaluations)
+		except (RuntimeError, ValueError):
+			continue
+	return None
+
+
+def fit_scipy(table: pandas.DataFrame, model: str = 'logistic', jobs: int = 1, estimate_guess: bool = True, analytic_jacobian: bool = True,
+		fault_tolerant: bool = False) -> pandas.DataFrame:
+	"""
+		Fits each sample (row) in `table` to the growth model using `curve_fit`.
+		If `jobs` is greater than 1 the samples are split into chunks and fit in a process pool.
+		The chunks are combined in their original order, so the result is identical to the serial version.
+	"""
+	fit_chunk = functools.partial(
+		_fit_scipy_chunk, model = model, estimate_guess = estimate_guess, analytic_jacobian = analytic_jacobian, fault_tolerant = fault_tolerant
+	)
+	if jobs <= 1 or len(table) < 2:
+		return fit_chunk(table)
+
+	# Use a few chunks per process so that one slow chunk doesn't leave the other processes idle.
+	number_of_chunks = min(len(table), jobs * 4)
+	chunks = [table.iloc[indicies] for indicies in numpy.array_split(numpy.arange(len(table)), number_of_chunks)]
+	with ProcessPoolExecutor(max_workers = jobs) as executor:
+		results = list(executor.map(fit_chunk, chunks))
+	return pandas.concat(results)
+
 
+def _fit_scipy_chunk(table: pandas.DataFrame, model: str = 'logistic', estimate_guess: bool = True, analytic_jacobian: bool = True,
+		fault_tolerant: bool = False) -> pandas.DataFrame:
+	""" Fits each sample in `table` one at a time. Defined at the module level so it can be sent to a process pool."""
+	model = get_model(model)
+	results = list()
 	for sample_name, sample_data in table.iterrows():
 		normalized_data = sample_data - sample_data.min()
-		xdata = normalized_data.index.values
+		xdata = normalized_data.index.values.astype(float)
 		ydata = normalized_data.values
+		# Include an initial guess for the parameters
+		# This helps the curve fit to find the correct parameters without failing.
+		p0 = model.estimate(xdata, ydata) if estimate_guess else model.default_guess
+		evaluations = [0]
 		try:
-			# Include an initial guess for the parameters
-			# This helps the curve fit to find the correct parameters without failing.
-			(k, N, r), pcov = curve_fit(equations.logistic_equation, xdata, ydata, p0 = [1, .001, .004])
-		except RuntimeError as exception:
-			logger.warning(f"Could not process '{sample_name}'")
-			raise exception
-
-		result = {
-			'sample': sample_name,
-			'k':      k,
-			'N':      N,
-			'r':      r,
-			'auc_l':  calculate_area_under_curve_ideal(max(normalized_data.index), k, N, r),
-			'auc_e':  calculate_area_under_curve_empirical(normalized_data),
-			'sigma':  calculate_goodness_of_fit(normalized_data, k, N, r)
-		}
-		results.append(result)
-	df = pandas.DataFrame(results).set_index('sample')
+			parameters = _curve_fit(xdata, ydata, p0, model, analytic_jacobian, evaluations = evaluations)
+			record = {'converged': True, 'status': 'converged', 'message': ''}
+		except (RuntimeError, ValueError) as exception:
+			if not fault_tolerant:
+				logger.warning(f"Could not process '{sample_name}'")
+				raise exception
+			parameters = _retry_scipy(xdata, ydata, p0, model, analytic_jacobian, evaluations)
+			if parameters is None:
+				logger.warning(f"Could not fit '{sample_name}' after retrying: {exception}")
+				parameters = numpy.full(len(model.parameters), numpy.nan)
+				record = {'converged': False, 'status': 'failed', 'message': str(exception)}
+			else:
+				record = {'converged': True, 'status': 'retried', 'message': str(exception)}
+		record['iterations'] = evaluations[0]
+		results.append({'sample': sample_name, **dict(zip(model.parameters, parameters)), **record})
+	return pandas.DataFrame(results, columns = ['sample'] + model.parameters + FIT_RECORD_COLUMNS).set_index('sample')
+
+
+def fit_batch(table: pandas.DataFrame, model: str = 'logistic', estimate_guess: bool = True, analytic_jacobian: bool = True,
+		fault_tolerant: bool = False) -> pandas.DataFrame:
+	"""
+		Fits every sample (row) in `table` to the growth model at the same time.
+		If `fault_tolerant` is set, samples which don't converge are fit again as a batch from each of the alternate starting values,
+		and any samples which still fail are fit individually with a bounded solver.
+	"""
+	model = get_model(model)
+	normalized_table = table.sub(table.min(axis = 1), axis = 0)
+	xdata = table.columns.values.astype(float)
+	ydata = normalized_table.values
+	p0 = model.estimate(xdata, ydata) if estimate_guess else model.default_guess
+	p0 = numpy.array(numpy.broadcast_to(p0, (len(ydata), len(model.parameters))))
+	jacobian = model.jacobian if analytic_jacobian else None
+	parameters, converged, iterations, messages = batchfit.levenberg_marquardt(
+		model.function, xdata, ydata, p0, jacobian = jacobian, lower_bounds = model.lower_bounds
+	)
+	status = numpy.where(converged, 'converged', 'failed').astype(object)
+
+	if fault_tolerant:
+		alternate_guesses = [get_alternate_guesses(guess, model.name) for guess in p0]
+		for guess_index in range(len(alternate_guesses[0]) if alternate_guesses else 0):
+			failed = numpy.flatnonzero(~converged)
+			if len(failed) == 0: break
+			guesses = numpy.array([alternate_guesses[index][guess_index] for index in failed])
+			retry_parameters, retry_converged, retry_iterations, _ = batchfit.levenberg_marquardt(
+				model.function, xdata, ydata[failed], guesses, jacobian = jacobian, lower_bounds = model.lower_bounds
+			)
+			iterations[failed] += retry_iterations
+			fixed = failed[retry_converged]
+			parameters[fixed] = retry_parameters[retry_converged]
+			converged[fixed] = True
+			status[fixed] = 'retried'
+
+		for index in numpy.flatnonzero(~converged):
+			mask = ~numpy.isnan(ydata[index])
+			evaluations = [0]
+			try:
+				parameters[index] = _curve_fit(
+					xdata[mask], ydata[index][mask], p0[index], model, analytic_jacobian, bounded = True, evaluations = evaluations
+				)
+			except (RuntimeError, ValueError) as exception:
+				messages[index] = f"{messages[index]} {exception}"
+				continue
+			finally:
+				iterations[index] += evaluations[0]
+			converged[index] = True
+			status[index] = 'retried'
+	# The parameters of a failed fit are wherever the solver stopped, so they shouldn't be used to calculate anything else.
+	parameters[~converged] = numpy.nan
+
+	for sample_name in normalized_table.index[~converged]:
+		logger.warning(f"The {model.name} fit for '{sample_name}' did not converge.")
+
+	df = pandas.DataFrame(parameters, columns = model.parameters, index = table.index)
+	df['converged'] = converged
+	df['status'] = status
+	df['iterations'] = iterations
+	df['message'] = messages
+	df.index.name = 'sample'
 	return df
 
+
+def estimate_logistic_fast(table: pandas.DataFrame, window: int = 5, minimum_fraction: float = 0.05,
+		maximum_fraction: float = 0.5) -> pandas.DataFrame:
+	"""
+		Estimates the logistic parameters without any nonlinear fitting. Meant for a quick first look at a large number of plates.
+		- k: The largest observed value (the plateau).
+		- r: The median slope of straight lines fit to log(y) over `window` consecutive timepoints of the exponential phase.
+			The slope of log(y) for the logistic curve is r*(1 - y/k), so each slope is divided by (1 - y/k) to correct for the slowdown near the plateau.
+		- N: The median starting value of the logistic curves which pass through the middle of each window with growth rate r.
+		The values are smoothed with a moving average of `window` timepoints before taking the log, since the slopes of short windows
+		are sensitive to noise. Every window of every sample is fit at once using cumulative sums of the least-squares terms.
+	Parameters
+	----------
+	table: pandas.DataFrame
+		The growth values. Each row is a sample and each column is a timepoint.
+	window: int
+		The number of timepoints in the moving average and in each regression.
+	minimum_fraction, maximum_fraction: float
+		Only values between these fractions of k are used. The log of values near 0 is dominated by noise and
+		the slope correction near the plateau amplifies it, so only the middle of the exponential phase is used.
+
+	Returns
+	-------
+	A table with the same columns as `fit_batch`. Samples without an exponential phase are given the 'failed' status.
+	"""
+	normalized_table = table.sub(table.min(axis = 1), axis = 0)
+	t = table.columns.values.astype(float)
+	values = normalized_table.values.astype(float)
+	with numpy.errstate(invalid = 'ignore'):
+		k = numpy.nanmax(values, axis = 1, initial = -numpy.inf)
+
+	# Smooth with a moving average. The timepoints are averaged the same way so each average stays at the middle of its window.
+	observed = ~numpy.isnan(values)
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		counts = _window_sums(observed.astype(float), window)
+		smoothed = _window_sums(numpy.where(observed, values, 0), window) / counts
+		smoothed[counts < window] = numpy.nan
+	# Center the timepoints so the sums don't lose precision.
+	offset = t.mean() if len(t) else 0
+	x = numpy.broadcast_to(_window_sums(t - offset, window) / max(min(window, len(t)), 1), smoothed.shape)
+
+	is_exponential = (smoothed >= minimum_fraction * k[:, numpy.newaxis]) & (smoothed <= maximum_fraction * k[:, numpy.newaxis])
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		logy = numpy.log(numpy.where(is_exponential, smoothed, numpy.nan))
+	observed = ~numpy.isnan(logy)
+	terms = [observed, x * observed, numpy.where(observed, logy, 0), x ** 2 * observed, numpy.where(observed, x * logy, 0)]
+	n, sx, sy, sxx, sxy = (_window_sums(term.astype(float), window) for term in terms)
+
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore', over = 'ignore'):
+		slopes = (n * sxy - sx * sy) / (n * sxx - sx ** 2)
+		# The middle of each window, which every line passes through.
+		window_t = sx / n + offset
+		window_y = numpy.exp(sy / n)
+		rates = slopes / (1 - window_y / k[:, numpy.newaxis])
+	# Only use windows where every timepoint could be used.
+	rates = numpy.where((n == window) & numpy.isfinite(rates) & (rates > 0), rates, numpy.nan)
+	found = numpy.isfinite(rates).any(axis = 1) if rates.size else numpy.zeros(len(values), dtype = bool)
+	r = numpy.full(len(values), numpy.nan)
+	N = numpy.full(len(values), numpy.nan)
+	if found.any():
+		r[found] = numpy.nanmedian(rates[found], axis = 1)
+		with numpy.errstate(divide = 'ignore', invalid = 'ignore', over = 'ignore'):
+			# k / (1 + A*exp(-r*t)) passes through (window_t, window_y) when log(A) = log(k / window_y - 1) + r * window_t.
+			log_A = numpy.log(k[:, numpy.newaxis] / window_y - 1) + r[:, numpy.newaxis] * window_t
+			log_A = numpy.where(numpy.isfinite(rates), log_A, numpy.nan)
+			N[found] = numpy.clip(k[found] / (1 + numpy.exp(numpy.nanmedian(log_A[found], axis = 1))), 1E-3 * k[found], k[found])
+
+	parameters = numpy.stack([k, N, r], axis = 1)
+	parameters[~found] = numpy.nan
+	df = pandas.DataFrame(parameters, columns = ['k', 'N', 'r'], index = table.index)
+	df['converged'] = found
+	df['status'] = numpy.where(found, 'converged', 'failed')
+	df['iterations'] = 0
+	df['message'] = numpy.where(found, '', 'Could not find an exponential growth phase.')
+	df.index.name = 'sample'
+	return df
+
+
+def _window_sums(values: numpy.ndarray, window: int) -> numpy.ndarray:
+	""" The sum of every `window` consecutive values along the last axis. Shape (samples, timepoints - window + 1)"""
+	window = min(window, values.shape[-1])
+	cumulative = numpy.concatenate([numpy.zeros(values.shape[:-1] + (1,)), numpy.cumsum(values, axis = -1)], axis = -1)
+	return cumulative[..., window:] - cumulative[..., :-window]
+
+
+def calculate_fit_statistics(table: pandas.DataFrame, parameters: pandas.DataFrame, model: str = 'logistic') -> pandas.DataFrame:
+	"""
+		Calculates the goodness of fit and the area under the curve for every sample at once.
+	Parameters
+	----------
+	table: pandas.DataFrame
+		The normalized growth values. Each row is a sample and each column is a timepoint.
+	parameters: pandas.DataFrame
+		The fitted parameters for each sample in `table`. Should have a column for each of the model's parameters.
+	model: str
+		The name of the growth model the parameters describe.
+
+	Returns
+	-------
+	A table indexed by sample with the `auc_l`, `auc_e`, `sigma`, and `aic` columns.
+	"""
+	model = get_model(model)
+	t = table.columns.values.astype(float)
+	values = table.values
+	columns = [parameters.loc[table.index, column].values.astype(float)[:, numpy.newaxis] for column in model.parameters]
+	fitted_values, integral = model.evaluate(t, *columns)
+
+	result = pandas.DataFrame(index = table.index)
+	result['auc_l'] = integral[:, t.argmax()] - model.integral(0, *columns)[:, 0]
+	result['auc_e'] = trapz(values, t, axis = 1)
+	result['sigma'] = _calculate_sigma(values, fitted_values, len(model.parameters))
+	result['aic'] = _calculate_aic(values, fitted_values, len(model.parameters))
+	return result
+
+
+def _calculate_sigma(values: numpy.ndarray, fitted_values: numpy.ndarray, number_of_parameters: int = 3) -> numpy.ndarray:
+	"""
+		Calculates the residual standard error along the last axis. Missing values are ignored, but still count towards the degrees of freedom.
+		The result is missing if every residual is missing (i.e. the fit failed).
+	"""
+	rdf = values.shape[-1] - number_of_parameters
+	residuals = (values - fitted_values) ** 2 / rdf
+	is_missing = numpy.isnan(residuals).all(axis = -1)
+	return numpy.where(is_missing, numpy.nan, numpy.sqrt(numpy.nansum(residuals, axis = -1)))[()]
+
+
+def _calculate_aic(values: numpy.ndarray, fitted_values: numpy.ndarray, number_of_parameters: int) -> numpy.ndarray:
+	"""
+		Calculates the Akaike information criterion of a least-squares fit along the last axis. Missing values are ignored.
+		The result is missing if the fitted values are missing (i.e. the fit failed).
+	"""
+	observed = ~numpy.isnan(values)
+	count = observed.sum(axis = -1)
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		rss = numpy.where(observed, (values - fitted_values) ** 2, 0).sum(axis = -1)
+		return count * numpy.log(rss / count) + 2 * number_of_parameters
+
+
+def calculate_cumulative_auc(table: pandas.DataFrame, cutoffs: Optional[Sequence[float]] = None) -> pandas.DataFrame:
+	"""
+		Calculates the empirical AUC (`auc_e`) of every sample at every cutoff in a single pass.
+		The result at each cutoff is the same as running `summarize_growth` with `time_limit` set to that cutoff: only timepoints at or
+		before the cutoff are included and each sample is normalized by its minimum value up to the cutoff.
+	Parameters
+	----------
+	table: pandas.DataFrame
+		The growth values. Each row is a sample and each column is a timepoint.
+	cutoffs: Optional[Sequence[float]]
+		The time limits to calculate the AUC at. Defaults to every timepoint.
+
+	Returns
+	-------
+	A table with a row for each sample and a column for each cutoff.
+	"""
+	t = table.columns.values.astype(float)
+	values = table.values.astype(float)
+	cutoffs = t if cutoffs is None else numpy.asarray(cutoffs, dtype = float)
+
+	# The trapezoid rule is a sum of the area between each pair of timepoints, so the AUC at every timepoint is a prefix sum.
+	areas = (values[:, 1:] + values[:, :-1]) / 2 * numpy.diff(t)
+	cumulative_area = numpy.concatenate([numpy.zeros((len(values), 1)), numpy.cumsum(areas, axis = 1)], axis = 1)
+	# Normalizing by the minimum shifts the curve down, which removes a rectangle with the same width as the time range.
+	cumulative_minimum = numpy.fmin.accumulate(values, axis = 1)
+	cumulative_auc = cumulative_area - cumulative_minimum * (t - t[0])
+
+	# The last timepoint at or before each cutoff.
+	index = numpy.searchsorted(t, cutoffs, side = 'right') - 1
+	result = numpy.where(index >= 0, cumulative_auc[:, numpy.maximum(index, 0)], numpy.nan)
+	return pandas.DataFrame(result, index = table.index, columns = cutoffs)
+
+
+def calculate_cumulative_auc_ideal(parameters: pandas.DataFrame, cutoffs: Sequence[float]) -> pandas.DataFrame:
+	"""
+		Calculates the area under each fitted curve (`auc_l`) between 0 and each cutoff.
+	Parameters
+	----------
+	parameters: pandas.DataFrame
+		The `summarize_growth` table. Samples without a `model` column are assumed to use the logistic model.
+	cutoffs: Sequence[float]
+
+	Returns
+	-------
+	A table with a row for each sample and a column for each cutoff.
+	"""
+	cutoffs = numpy.asarray(cutoffs, dtype = float)
+	model_names = parameters['model'] if 'model' in parameters.columns else pandas.Series('logistic', index = parameters.index)
+	result = pandas.DataFrame(numpy.nan, index = parameters.index, columns = cutoffs)
+	for name in model_names.unique():
+		model = get_model(name)
+		selected = (model_names == name).values
+		columns = [parameters.loc[selected, column].values.astype(float)[:, numpy.newaxis] for column in model.parameters]
+		result.loc[selected] = model.area_under_curve(cutoffs, *columns)
+	if 'status' in parameters.columns:
+		# Samples which skipped the fit are described by a flat line at `k`.
+		screened = parameters['status'].isin(SCREENED_STATUSES).values
+		result.loc[screened] = parameters.loc[screened, 'k'].values.astype(float)[:, numpy.newaxis] * cutoffs
+	return result
+
+
 def calculate_goodness_of_fit(empirical_data: pandas.Series, k: float, N: float, r: float) -> float:
-	total = 0
-	rdf = len(empirical_data) - 3
-	for xpoint, ypoint in empirical_data.items():
-		ipoint = equations.logistic_equation(xpoint, k, N, r)
-		residual = (ypoint - ipoint) ** 2 / rdf
-		if numpy.isnan(residual): continue
-		total += residual
-	return numpy.sqrt(total)
+	fitted_values = equations.logistic_equation(empirical_data.index.values.astype(float), k, N, r)
+	return _calculate_sigma(empirical_data.values, fitted_values)
 
 
 def calculate_area_under_curve_empirical(data: pandas.Series) -> float:
@@ -62,6 +602,7 @@ def calculate_area_under_curve_empirical(data: pandas.Series) -> float:
 
 
 def calculate_area_under_curve_ideal(t: int, k: float, N: float, r: float) -> float:
+	""" Calculates the area under the logistic curve between 0 and `t`. Also works with arrays of parameters."""
 	area_under_curve = equations.logistic_equation_integral(t, k, N, r) - equations.logistic_equation_integral(0, k, N, r)
 	return area_under_curve
 
@@ -0,0 +1,111 @@
+"""
+	The growth models which can be fit to the growth curves.
+	Every model shares the (k, N, r) parameters (plateau, starting value and growth rate) so that the output tables keep the same
+	columns regardless of which model was used. Models with extra shape parameters add them after `r`.
+	New models can be added with `register_model`.
+"""
+from typing import *
+
+import numpy
+
+from analysis import equations
+
+
+class GrowthModel:
+	"""
+		Describes a growth model.
+	Parameters
+	----------
+	name: str
+	parameters: List[str]
+		The names of the parameters, in the order `function` takes them. Should start with 'k', 'N', and 'r'.
+	function: Callable
+		Called as `function(t, *parameters)`. Must broadcast over arrays of parameters.
+	integral: Callable
+		An antiderivative of `function`, called the same way. Used to calculate the area under the fitted curve.
+	jacobian: Callable
+		The partial derivatives of `function`. The last axis of the result should match `parameters`.
+	estimate: Callable
+		Called as `estimate(t, y)` to estimate the starting values for each sample. Should return an array of shape (samples, parameters).
+	default_guess: List[float]
+		The starting values to use if the parameters aren't estimated from the data.
+	lower_bounds: List[float]
+		The smallest allowed value of each parameter. The batched solver keeps the parameters at or above these, and the
+		scipy solver uses them when a fit has to be retried with bounds.
+	function_and_integral: Optional[Callable]
+		Evaluates `function` and `integral` together, if sharing the work between them is cheaper than calling each one.
+	"""
+
+	def __init__(self, name: str, parameters: List[str], function: Callable, integral: Callable, jacobian: Callable, estimate: Callable,
+			default_guess: List[float], lower_bounds: List[float], function_and_integral: Optional[Callable] = None):
+		self.name = name
+		self.parameters = parameters
+		self.function = function
+		self.integral = integral
+		self.jacobian = jacobian
+		self.estimate = estimate
+		self.default_guess = default_guess
+		self.lower_bounds = lower_bounds
+		self.function_and_integral = function_and_integral
+
+	def __repr__(self) -> str:
+		return f"GrowthModel('{self.name}', {self.parameters})"
+
+	def evaluate(self, t, *parameters) -> Tuple[Any, Any]:
+		""" Returns the values of `function` and `integral` at `t`."""
+		if self.function_and_integral is not None:
+			return self.function_and_integral(t, *parameters)
+		return self.function(t, *parameters), self.integral(t, *parameters)
+
+	def within_bounds(self, parameters) -> Any:
+		"""
+			Whether the shape parameters (the ones after `r`) are at or above `lower_bounds`. `curve_fit` without bounds can move them somewhere
+			the model is meaningless (ex. a negative lag), so those fits are redone with bounds.
+			`parameters` can be a single set of parameters or an array of shape (samples, parameters).
+		"""
+		parameters = numpy.asarray(parameters, dtype = float)
+		return numpy.all(parameters[..., 3:] >= numpy.asarray(self.lower_bounds[3:]), axis = -1)
+
+	def area_under_curve(self, t, *parameters):
+		""" The area under the curve between 0 and `t`."""
+		return self.integral(t, *parameters) - self.integral(0, *parameters)
+
+
+MODELS: Dict[str, GrowthModel] = dict()
+
+
+def register_model(model: GrowthModel):
+	MODELS[model.name] = model
+
+
+def get_model(name: Union[str, GrowthModel]) -> GrowthModel:
+	if isinstance(name, GrowthModel):
+		return name
+	try:
+		return MODELS[name]
+	except KeyError:
+		message = f"Unknown growth model: '{name}'. Expected one of {sorted(MODELS)}"
+		raise ValueError(message)
+
+
+# N can't be 0 since every model divides by it.
+register_model(GrowthModel(
+	'logistic', ['k', 'N', 'r'],
+	equations.logistic_equation, equations.logistic_equation_integral, equations.logistic_equation_jacobian, equations.estimate_logistic_parameters,
+	equations.default_guess, [0, 1E-12, 0], equations.logistic_equation_and_integral
+))
+register_model(GrowthModel(
+	'gompertz', ['k', 'N', 'r'],
+	equations.gompertz_equation, equations.gompertz_equation_integral, equations.gompertz_equation_jacobian, equations.estimate_gompertz_parameters,
+	equations.default_guess_gompertz, [0, 1E-12, 0]
+))
+register_model(GrowthModel(
+	'richards', ['k', 'N', 'r', 'v'],
+	equations.richards_equation, equations.richards_equation_integral, equations.richards_equation_jacobian, equations.estimate_richards_parameters,
+	equations.default_guess_richards, [0, 1E-12, 0, 1E-3]
+))
+register_model(GrowthModel(
+	'baranyi', ['k', 'N', 'r', 'lag'],
+	equations.baranyi_equation, equations.baranyi_equation_integral, equations.baranyi_equation_jacobian, equations.estimate_baranyi_parameters,
+	equations.default_guess_baranyi, [0, 1E-12, 0, 0]
+))
@@ -0,0 +1,287 @@
+"""
+	Tukey's honestly significant difference test, calculated for every pair of groups at once.
+	The groups are reduced to their counts, means and sums of squares first, so the pairwise statistics only depend on the
+	number of groups rather than the number of samples.
+	The p-values and critical values come from an interpolated table of the studentized range distribution which is built
+	the first time each (groups, degrees of freedom) pair is needed.
+	`compare_to_control` only compares each group to a control group (Dunnett's test), which needs k - 1 rather than k(k - 1) / 2 comparisons.
+"""
+import functools
+from typing import *
+
+import numpy
+import pandas
+from scipy import special, stats
+from scipy.interpolate import CubicSpline
+from scipy.optimize import brentq
+
+try:
+	from scipy.stats import studentized_range
+except ImportError:
+	# Older versions of scipy don't have the studentized range distribution, so fall back to statsmodels' approximation.
+	# It is only accurate for p-values between 0.001 and 0.9.
+	studentized_range = None
+	from statsmodels.stats.libqsturng import psturng
+
+# The columns of the tables returned by `tukey_hsd` and `compare_groups`. Matches the summary table from statsmodels' `tukeyhsd`.
+TUKEY_COLUMNS = ['group1', 'group2', 'meandiff', 'p-adj', 'lower', 'upper', 'reject', 'std_pair', 'q']
+# The columns of the table returned by `group_statistics`.
+GROUP_COLUMNS = ['count', 'mean', 'sum_of_squares']
+
+# The columns of the tables returned by `compare_to_control`. `group1` is always the control.
+DUNNETT_COLUMNS = ['group1', 'group2', 'meandiff', 'p-adj', 'lower', 'upper', 'reject', 'std_pair', 't']
+# The number of quadrature points used for each of the two integrals in `_dunnett_probability`.
+DUNNETT_POINTS = 48
+# The number of points in each studentized range lookup table.
+LOOKUP_POINTS = 160
+# The lookup tables stop where the survival function drops below this value, so smaller p-values are reported as this value.
+MINIMUM_PVALUE = 1E-12
+
+
+def _studentized_range_sf(q: numpy.ndarray, k: int, df: float) -> numpy.ndarray:
+	""" Evaluates the survival function of the studentized range distribution directly. Slow, so only used to build the lookup tables."""
+	if studentized_range is not None:
+		return studentized_range.sf(q, k, df)
+	return numpy.atleast_1d(psturng(numpy.maximum(q, 1E-8), k, df)).astype(float)
+
+
+@functools.lru_cache(maxsize = None)
+def _get_lookup(k: int, df: float) -> Tuple[CubicSpline, float]:
+	"""
+		Builds the lookup table for `k` groups and `df` degrees of freedom. Memoized, so each table is only built once per process.
+		The log of the survival function is smooth in q, so a cubic spline through `LOOKUP_POINTS` points keeps the relative error
+		of the p-values below 1E-4.
+
+	Returns
+	-------
+	The interpolated log survival function and the largest q in the table.
+	"""
+	# Find where the survival function reaches `MINIMUM_PVALUE`, so the table doesn't waste points on the flat part of the tail.
+	is_above_minimum = lambda value: _studentized_range_sf(numpy.array([value]), k, df)[0] > MINIMUM_PVALUE
+	q_maximum = 4.0
+	while is_above_minimum(q_maximum) and q_maximum < 1E3:
+		q_maximum *= 2
+	lower, upper = q_maximum / 2, q_maximum
+	for _ in range(6):
+		middle = (lower + upper) / 2
+		lower, upper = (middle, upper) if is_above_minimum(middle) else (lower, middle)
+	q_maximum = upper
+	q = numpy.linspace(0, q_maximum, LOOKUP_POINTS)
+	with numpy.errstate(divide = 'ignore'):
+		log_sf = numpy.log(numpy.clip(_studentized_range_sf(q, k, df), MINIMUM_PVALUE, 1))
+	return CubicSpline(q, log_sf), q_maximum
+
+
+def studentized_range_sf(q: numpy.ndarray, k: int, df: float) -> numpy.ndarray:
+	"""
+		The probability that the studentized range of `k` groups with `df` degrees of freedom is larger than `q` (the Tukey p-value).
+		Uses a memoized lookup table (see `_get_lookup`). Values below `MINIMUM_PVALUE` are reported as `MINIMUM_PVALUE`.
+	"""
+	log_sf, q_maximum = _get_lookup(int(k), float(df))
+	q = numpy.asarray(q, dtype = float)
+	result = numpy.exp(numpy.minimum(log_sf(numpy.clip(q, 0, q_maximum)), 0))
+	return numpy.where(numpy.isnan(q), numpy.nan, numpy.clip(result, MINIMUM_PVALUE, 1))
+
+
+def studentized_range_quantile(p: float, k: int, df: float) -> float:
+	"""
+		The value of the studentized range of `k` groups with `df` degrees of freedom which is only exceeded with probability `1 - p`.
+		`studentized_range_quantile(1 - alpha, k, df)` is Tukey's critical value. Uses the same lookup table as `studentized_range_sf`.
+	"""
+	log_sf, q_maximum = _get_lookup(int(k), float(df))
+	target = numpy.log(numpy.clip(1 - p, MINIMUM_PVALUE, 1))
+	if log_sf(q_maximum) >= target:
+		return q_maximum
+	return brentq(lambda q: log_sf(q) - target, 0, q_maximum)
+
+
+def group_statistics(values: pandas.Series, groups: pandas.Series) -> pandas.DataFrame:
+	"""
+		Reduces each group to the statistics the comparisons need.
+	Parameters
+	----------
+	values: pandas.Series
+		The measured values (ex. `auc_e`). Missing values are ignored.
+	groups: pandas.Series
+		The group of each value.
+
+	Returns
+	-------
+	A table indexed by group (sorted) with the `count`, `mean` and `sum_of_squares` (about the group mean) of each group.
+	"""
+	values = pandas.Series(numpy.asarray(values, dtype = float))
+	groups = pandas.Series(numpy.asarray(groups))
+	observed = values.notna().values
+	grouped = values[observed].groupby(groups[observed].values)
+	df = pandas.DataFrame({
+		'count':          grouped.count(),
+		'mean':           grouped.mean(),
+		'sum_of_squares': grouped.var(ddof = 0) * grouped.count()
+	})
+	return df.sort_index()[GROUP_COLUMNS]
+
+
+def compare_groups(statistics: pandas.DataFrame, alpha: float = 0.05) -> pandas.DataFrame:
+	"""
+		Runs the Tukey-Kramer test on every pair of groups from their summary statistics.
+	Parameters
+	----------
+	statistics: pandas.DataFrame
+		The `group_statistics` table.
+	alpha: float
+		The family-wise error rate used for `reject` and the confidence intervals.
+
+	Returns
+	-------
+	A table with a row for each pair of groups, in the same order as statsmodels (`group1` comes before `group2` in the index of
+	`statistics`), and the columns in `TUKEY_COLUMNS`. `meandiff` is the mean of `group2` minus the mean of `group1`,
+	`std_pair` is the standard error of `meandiff` and `q` is the studentized range statistic.
+	"""
+	counts = statistics['count'].values.astype(float)
+	means = statistics['mean'].values.astype(float)
+	number_of_groups = len(statistics)
+	degrees_of_freedom = counts.sum() - number_of_groups
+	variance = statistics['sum_of_squares'].values.sum() / degrees_of_freedom
+
+	first, second = numpy.triu_indices(number_of_groups, 1)
+	meandiff = means[second] - means[first]
+	std_pair = numpy.sqrt(variance / 2 * (1 / counts[first] + 1 / counts[second]))
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		q = numpy.abs(meandiff) / std_pair
+
+	if len(q) > 0:
+		q_crit = studentized_range_quantile(1 - alpha, number_of_groups, degrees_of_freedom)
+		pvalues = studentized_range_sf(q, number_of_groups, degrees_of_freedom)
+	else:
+		q_crit = numpy.nan
+		pvalues = numpy.empty(0)
+
+	df = pandas.DataFrame({
+		'group1':   statistics.index.values[first],
+		'group2':   statistics.index.values[second],
+		'meandiff': meandiff,
+		'p-adj':    pvalues,
+		'lower':    meandiff - q_crit * std_pair,
+		'upper':    meandiff + q_crit * std_pair,
+		'reject':   q > q_crit,
+		'std_pair': std_pair,
+		'q':        q
+	}, columns = TUKEY_COLUMNS)
+	return df
+
+
+def tukey_hsd(values: pandas.Series, groups: pandas.Series, alpha: float = 0.05) -> pandas.DataFrame:
+	"""
+		Compares every pair of groups with Tukey's HSD test. A vectorized version of statsmodels' `MultiComparison(values, groups).tukeyhsd()`.
+	Parameters
+	----------
+	values: pandas.Series
+		The measured values (ex. `auc_e`).
+	groups: pandas.Series
+		The group of each value.
+	alpha: float
+
+	Returns
+	-------
+	See `compare_groups`.
+	"""
+	return compare_groups(group_statistics(values, groups), alpha)
+
+
+def _dunnett_probability(c: numpy.ndarray, weights: numpy.ndarray, df: float) -> numpy.ndarray:
+	"""
+		The probability that none of the Dunnett t statistics is larger than `c` in absolute value.
+		The comparisons share the control group, so their correlation is `weights[i] * weights[j]`. That lets each statistic be written as
+		`weights[i] * Z + sqrt(1 - weights[i]**2) * E[i]` for independent standard normal Z and E[i], divided by a shared chi / sqrt(df) scale,
+		and the probability becomes a two dimensional integral over Z and the scale. Both integrals use Gaussian quadrature.
+	Parameters
+	----------
+	c: numpy.ndarray
+		The thresholds.
+	weights: numpy.ndarray
+		sqrt(n[i] / (n[i] + n[control])) for each group compared to the control.
+	df: float
+		The degrees of freedom of the pooled variance.
+	"""
+	z, z_weights = numpy.polynomial.hermite_e.hermegauss(DUNNETT_POINTS)
+	z_weights = z_weights / numpy.sqrt(2 * numpy.pi)
+	if numpy.isfinite(df) and df < 1E5:
+		u, scale_weights = numpy.polynomial.legendre.leggauss(DUNNETT_POINTS)
+		scale = numpy.sqrt(stats.chi2.ppf((u + 1) / 2, df) / df)
+		scale_weights = scale_weights / 2
+	else:
+		scale, scale_weights = numpy.ones(1), numpy.ones(1)
+
+	c = numpy.atleast_1d(numpy.asarray(c, dtype = float))
+	shift = weights * z[:, numpy.newaxis]
+	spread = numpy.sqrt(1 - weights ** 2)
+	result = numpy.empty(len(c))
+	# Limit the size of the (thresholds, scale, z, groups) arrays.
+	for start in range(0, len(c), 8):
+		threshold = c[start:start + 8, numpy.newaxis, numpy.newaxis, numpy.newaxis] * scale[:, numpy.newaxis, numpy.newaxis]
+		inside = special.ndtr((threshold - shift) / spread) - special.ndtr((-threshold - shift) / spread)
+		result[start:start + 8] = numpy.einsum('csz,s,z->c', inside.prod(axis = -1), scale_weights, z_weights)
+	return result
+
+
+def compare_to_control(statistics: pandas.DataFrame, control: Any, alpha: float = 0.05) -> pandas.DataFrame:
+	"""
+		Compares each group to `control` with Dunnett's test, which adjusts the p-values for the k - 1 comparisons with the control
+		rather than for every pair of groups.
+	Parameters
+	----------
+	statistics: pandas.DataFrame
+		The `group_statistics` table.
+	control: Any
+		The control group. Must be in the index of `statistics`.
+	alpha: float
+		The family-wise error rate used for `reject` and the confidence intervals.
+
+	Returns
+	-------
+	A table with a row for each group other than the control and the columns in `DUNNETT_COLUMNS`. `meandiff` is the mean of
+	`group2` minus the mean of the control, `std_pair` is the standard error of `meandiff` and `t` is `meandiff / std_pair`.
+	"""
+	if control not in statistics.index:
+		message = f"The control group '{control}' is not one of the groups: {list(statistics.index)}"
+		raise ValueError(message)
+	counts = statistics['count'].values.astype(float)
+	means = statistics['mean'].values.astype(float)
+	degrees_of_freedom = counts.sum() - len(statistics)
+	variance = statistics['sum_of_squares'].values.sum() / degrees_of_freedom
+
+	is_control = (statistics.index == control)
+	control_count, control_mean = counts[is_control][0], means[is_control][0]
+	counts, means = counts[~is_control], means[~is_control]
+	meandiff = means - control_mean
+	std_pair = numpy.sqrt(variance * (1 / counts + 1 / control_count))
+	with numpy.errstate(divide = 'ignore', invalid = 'ignore'):
+		t = meandiff / std_pair
+	weights = numpy.sqrt(counts / (counts + control_count))
+
+	if len(t) > 0:
+		t_crit = brentq(lambda c: _dunnett_probability(c, weights, degrees_of_freedom)[0] - (1 - alpha), 0, 100)
+		pvalues = numpy.clip(1 - _dunnett_probability(numpy.abs(t), weights, degrees_of_freedom), 0, 1)
+	else:
+		t_crit = numpy.nan
+		pvalues = numpy.empty(0)
+
+	df = pandas.DataFrame({
+		'group1':   control,
+		'group2':   statistics.index.values[~is_control],
+		'meandiff': meandiff,
+		'p-adj':    pvalues,
+		'lower':    meandiff - t_crit * std_pair,
+		'upper':    meandiff + t_crit * std_pair,
+		'reject':   numpy.abs(t) > t_crit,
+		'std_pair': std_pair,
+		't':        t
+	}, columns = DUNNETT_COLUMNS)
+	return df
+
+
+def dunnett(values: pandas.Series, groups: pandas.Series, control: Any, alpha: float = 0.05) -> pandas.DataFrame:
+	"""
+		Compares each group to `control` with Dunnett's test. See `compare_to_control`.
+	"""
+	return compare_to_control(group_statistics(values, groups), control, alpha)
@@ -3,12 +3,14 @@ from typing import *
 
 import pandas
 from loguru import logger
-from statsmodels.sandbox.stats.multicomp import TukeyHSDResults  # Used to add a typing annotation to tukeyhsd()
+from statsmodels.regression import linear_model
 
 import analysis
 import projectoutput
 import utilities
-from analysis import growthcurver
+from analysis import bootstrap, features, growthcurver
+from analysis.groupstore import GroupStatisticsStore
+from analysis.fitcache import FitCache
 from projectpaths import Filenames
 
 TRACE = True
@@ -51,9 +53,43 @@ def _extract_columns_by_media(columns: List[str], group: List[str]) -> List[str]
 
 
 class GrowthCurveAnalysis:
-	def __init__(self, treatments: List[str] = None, strains: List[str] = None, time_limit: Optional[int] = None):
+	def __init__(self, treatments: List[str] = None, strains: List[str] = None, time_limit: Optional[int] = None, table_format: str = '.parquet',
+			fit_method: str = 'scipy', jobs: int = 1, fault_tolerant: bool = False, cache_folder: Optional[Path] = None,
+			models: List[str] = None, cutoffs: List[float] = None, threshold: float = 0.1, bootstrap_replicates: int = 0,
+			minimum_growth: Optional[float] = None, comparisons: str = 'all', responses: List[str] = None,
+			statistics_folder: Optional[Path] = None):
 		self.time_limit = time_limit
 		self.time_column = 'Time'
+		# The file format used to save the output tables.
+		self.table_format = table_format
+		# How the logistic curves are fit. See `growthcurver.summarize_growth`.
+		self.fit_method = fit_method
+		# The number of processes used to fit the curves.
+		self.jobs = jobs
+		# Whether samples which can't be fit are dropped from the analysis rather than raising an error.
+		self.fault_tolerant = fault_tolerant
+		# Where to save the fitted curves so they can be reused on the next run. The cache is not used if this is `None`.
+		self.cache_folder = cache_folder
+		# The growth models to fit. Each sample uses the model with the lowest AIC. See `analysis.models`.
+		self.models = models if models else ['logistic']
+		# If given, the AUC and ANOVA are also calculated at each of these time limits.
+		self.cutoffs = cutoffs
+		# The value used to calculate the `time_to_threshold` growth feature.
+		self.threshold = threshold
+		# The number of bootstrap replicates used for the confidence intervals of each sample. The bootstrap is skipped if this is 0.
+		self.bootstrap_replicates = bootstrap_replicates
+		# Samples which grow less than this skip the fit, as do samples which are saturated from the start. See `growthcurver.screen_samples`.
+		self.minimum_growth = minimum_growth
+		# Either 'all' (Tukey's test on every pair of groups) or 'control' (Dunnett's test against the groups in `Filenames.controls`).
+		if comparisons not in {'all', 'control'}:
+			message = f"Unknown comparison mode: '{comparisons}'. Expected 'all' or 'control'."
+			raise ValueError(message)
+		self.comparisons = comparisons
+		# Extra columns of the auc statistics table (ex. 'k', 'r', 'mu_max') to run the ANOVA on, in addition to the AUC column.
+		self.responses = responses
+		# If given, the group statistics of every sample analyzed so far are kept in this folder, and the ANOVA and Tukey tables are
+		# generated from them. This includes samples from earlier runs which aren't in the current table. See `GroupStatisticsStore`.
+		self.statistics_folder = statistics_folder
 
 		self.treatments = treatments
 		self.strains = strains
@@ -73,7 +109,7 @@ class GrowthCurveAnalysis:
 		return table[passed_columns]
 
 	def set_paths(self, folder: Path):
-		self.filenames = Filenames(folder)
+		self.filenames = Filenames(folder, self.table_format)
 
 	def prepare_table(self, table: pandas.DataFrame) -> pandas.DataFrame:
 		"""
@@ -120,16 +156,16 @@ class GrowthCurveAnalysis:
 		return growthcurve_timeseries_table
 
 	def save_results_tables(self, auc_statistics_table: pandas.DataFrame, anovaresults: pandas.DataFrame,
-			regression: Any, tukey_results: Dict[str, TukeyHSDResults]):
+			regression: Union[linear_model.RegressionResults, pandas.DataFrame], tukey_results: pandas.DataFrame):
 		# projectoutput.save_table_info(table_info, self.filenames.filename_table_info)
 		# projectoutput.save_maximum_growth(timeseries_table.max(), self.filenames.filename_table_maximum_growth)
 		projectoutput.save_auc_statistics_table(auc_statistics_table, self.filenames.filename_table_auc_statistics)
 		projectoutput.save_anova(anovaresults, self.filenames.filename_table_anova)
 		projectoutput.save_regression(regression, self.filenames.filename_table_regression_model)
 
-		tukey_table = projectoutput.save_table_tukey(tukey_results, self.filenames.filename_table_tukey, self.filenames.filename_data_tukey)
-		projectoutput.save_tukey_matrix(tukey_table, self.filenames.folder_tables_tukey)
-		projectoutput.plot_tukey(tukey_results, self.filenames.folder_figures_tukey, controls = {})
+		tukey_table = projectoutput.save_tukey_table(tukey_results, self.filenames.filename_table_tukey)
+		projectoutput.save_tukey_matrix(tukey_table, self.filenames.folder_tables_tukey, self.filenames.table_format)
+		projectoutput.plot_tukey_table(tukey_results, self.filenames.folder_figures_tukey, controls = {})
 
 	def info(self, columns: List[str]) -> Dict[str, List[str]]:
 		unique_strains = set(i.split('.')[0] for i in columns)
@@ -151,26 +187,103 @@ class GrowthCurveAnalysis:
 		growthcurve_timeseries_table = self.generate_growthcurve_table(table)
 
 		logger.info("Summarizing growth...")
-		growthcurve_model_table = growthcurver.summarize_growth(growthcurve_timeseries_table.T, time_limit = self.time_limit)
+		cache = FitCache(self.cache_folder) if self.cache_folder is not None else None
+		growthcurve_model_table = growthcurver.summarize_growth(
+			growthcurve_timeseries_table.T,
+			time_limit = self.time_limit,
+			method = self.fit_method,
+			jobs = self.jobs,
+			fault_tolerant = self.fault_tolerant,
+			cache = cache,
+			models = self.models,
+			minimum_growth = self.minimum_growth
+		)
+		logger.info("Calculating growth features...")
+		timeseries = growthcurve_timeseries_table.T
+		if self.time_limit:
+			timeseries = timeseries[[i for i in timeseries.columns if i <= self.time_limit]]
+		growth_features = features.calculate_growth_features(timeseries, threshold = self.threshold)
+		growthcurve_model_table = growthcurve_model_table.join(growth_features)
+
+		normalized_timeseries = timeseries.sub(timeseries.min(axis = 1), axis = 0)
+		standard_errors = bootstrap.calculate_standard_errors(normalized_timeseries, growthcurve_model_table)
+		growthcurve_model_table = growthcurve_model_table.join(standard_errors)
+		if self.bootstrap_replicates:
+			logger.info(f"Calculating confidence intervals from {self.bootstrap_replicates} bootstrap replicates...")
+			confidence_intervals = bootstrap.bootstrap_confidence_intervals(
+				normalized_timeseries, growthcurve_model_table, replicates = self.bootstrap_replicates, jobs = self.jobs
+			)
+			growthcurve_model_table = growthcurve_model_table.join(confidence_intervals)
 
 		return growthcurve_model_table
 
+	def run_cutoff_sweep(self, table: pandas.DataFrame, auc_statistics_table: pandas.DataFrame, auc_column: str):
+		"""
+			Calculates the AUC of every sample at each of `self.cutoffs` and runs the ANOVA at each cutoff.
+			The curves are not refit at each cutoff, so `auc_l` uses the curves fit with `self.time_limit`.
+		"""
+		logger.info(f"Calculating the AUC at {len(self.cutoffs)} cutoffs...")
+		growthcurve_timeseries_table = self.generate_growthcurve_table(table).T.loc[auc_statistics_table.index]
+		auc_empirical = growthcurver.calculate_cumulative_auc(growthcurve_timeseries_table, self.cutoffs)
+		auc_ideal = growthcurver.calculate_cumulative_auc_ideal(auc_statistics_table, self.cutoffs)
+		anova_table = analysis.anova_sweep(auc_statistics_table, auc_empirical if auc_column == 'auc_e' else auc_ideal)
+
+		projectoutput.save_auc_cutoffs(auc_empirical, self.filenames.filename_table_auc_cutoffs_empirical)
+		projectoutput.save_auc_cutoffs(auc_ideal, self.filenames.filename_table_auc_cutoffs_ideal)
+		projectoutput.save_anova(anova_table.set_index('cutoff'), self.filenames.filename_table_anova_cutoffs)
+
+	def run_anova_responses(self, auc_statistics_table: pandas.DataFrame, auc_column: str):
+		"""
+			Runs the ANOVA on `auc_column` and each of `self.responses` with a single factorization of the design matrix.
+		"""
+		columns = [auc_column] + [column for column in self.responses if column != auc_column]
+		logger.info(f"Running the ANOVA for {columns}...")
+		results = analysis.anova_multiple(auc_statistics_table, columns)
+		projectoutput.save_anova_responses(results, self.filenames.folder_tables_anova, self.filenames.table_format)
+
 	def run(self, table: pandas.DataFrame, auc_column: str, project_folder: Path = None):
-		self.filenames = Filenames(project_folder)
+		self.filenames = Filenames(project_folder, self.table_format)
 
 		growthcurve_model_table = self.summarize_growth(table)
+		failures = growthcurver.get_failure_report(growthcurve_model_table)
+		if len(failures) > 0:
+			logger.warning(
+				f"{(failures['status'] == 'failed').sum()} samples could not be fit and {(failures['status'] == 'retried').sum()} had to be retried."
+			)
+			projectoutput.save_fit_failures(failures, self.filenames.filename_table_fit_failures)
+		# The failed samples don't have any parameters, so they can't be included in the statistics.
+		growthcurve_model_table = growthcurve_model_table[growthcurve_model_table['status'] != 'failed']
 		sample_metadata_table = utilities.extract_sample_metadata(growthcurve_model_table.index)
 
 		logger.info("Calculating auc statistics...")
 		auc_statistics_table = sample_metadata_table.merge(growthcurve_model_table, left_index = True, right_index = True)
 
-		regression, anova_result = analysis.anovanested(auc_statistics_table, auc_column)
+		if self.statistics_folder is None:
+			store = None
+			regression, anova_result = analysis.anovanested(auc_statistics_table, auc_column)
 
 		# Need to fix the labels in the AUC statistics table so they correctly formatted for the figures.
 		auc_statistics_table = self.convert_letter_case(auc_statistics_table)
 
+		if self.statistics_folder is not None:
+			# The store is keyed by the corrected labels so that `Filenames.controls` matches its groups.
+			logger.info("Updating the group statistics...")
+			store = GroupStatisticsStore(self.statistics_folder, auc_column)
+			store.update(auc_statistics_table)
+			store.save()
+			regression, anova_result = store.anova()
+
+		if self.responses:
+			self.run_anova_responses(auc_statistics_table, auc_column)
+		if self.cutoffs:
+			self.run_cutoff_sweep(table, auc_statistics_table, auc_column)
+
 		logger.info("Running tukey...")
-		tukey_results = analysis.tukeyhsd(auc_statistics_table, auc_column)
+		controls = self.filenames.controls if self.comparisons == 'control' else None
+		if store is None:
+			tukey_results = analysis.tukey_table(auc_statistics_table, auc_column, controls = controls)
+		else:
+			tukey_results = store.tukey_table(controls = controls)
 
 		logger.info("Saving tables...")
 
@@ -180,6 +293,9 @@ class GrowthCurveAnalysis:
 			regression = regression,
 			tukey_results = tukey_results,
 		)
-		figure_workflow = projectoutput.FigureWorkflow(project_folder, self.treatments, self.strains)
+		# The figures need an explicit order for the labels, so fall back to the labels in the table when none were given.
+		treatments = self.treatments if self.treatments is not None else sorted(auc_statistics_table['condition'].unique())
+		strains = self.strains if self.strains is not None else sorted(auc_statistics_table['strain'].unique())
+		figure_workflow = projectoutput.FigureWorkflow(project_folder, treatments, strains, self.table_format)
 
 		figure_workflow.run(ylimits = (0, auc_statistics_table['auc_e'].max()))
@@ -84,7 +84,7 @@ class AnovaPlotNested:
 		"""
 
 		groups = auc_statistics_table.groupby(by = self.indexby)
-		result = groups.mean()[y]
+		result = groups[y].mean()
 		group_means_x_values = set(i[0] for i in result.index)
 		group_means_hue_values = set(i[1] for i in result.index)
 		# if group_means_x_values == group_means_hue_values:
@@ -9,7 +9,7 @@ import seaborn
 import utilities
 
 plt.style.use('ggplot')
-from analysis import equations
+from analysis import models
 
 from tqdm import tqdm
 
@@ -53,7 +53,9 @@ class PlotGrowthcurves:
 			xdata = sample_timeseries.index
 			ydata_empirical = sample_timeseries.values
 			coefficients = fit_data.loc[sample_id]
-			ydata_fit = [equations.logistic_equation(t, coefficients['k'], coefficients['N'], coefficients['r']) for t in sample_timeseries.index]
+			# Tables from before the model registry only have logistic fits.
+			model = models.get_model(coefficients.get('model', 'logistic'))
+			ydata_fit = model.function(xdata.values.astype(float), *coefficients[model.parameters].values.astype(float))
 
 			ax.scatter(xdata, ydata_empirical, color = colormap[index], label = sample_id)
 			ax.plot(xdata, ydata_fit, color = colormap[index + 1])
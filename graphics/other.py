@@ -15,28 +15,37 @@ def plot_sigmas(sigmas: pandas.Series, filename: Path):
 	plt.savefig(filename)
 
 
-def plot_tukey(tukey_results: Dict[str, Any], folder: Path, controls:Dict[str,str]) -> Optional[plt.Axes]:
+def plot_tukey_table(tukey_table: pandas.DataFrame, folder: Path, controls: Dict[str, str]) -> Optional[plt.Axes]:
 	"""
-		Plots the various tukey plots.
+		Plots the difference in means and the confidence interval of each comparison in a table from `analysis.tukey_table`.
 	Parameters
 	----------
-	tukey_results
-	folder
+	tukey_table: pandas.DataFrame
+	folder: Path
 	controls: Dict[str,str]
-		Maps the current subject to the control for that subject.
-
-	Returns
-	-------
-
+		Maps the current subject to the control for that subject. Only the comparisons with the control are plotted, if one is given.
 	"""
-
-	for name, tukey_result in tukey_results.items():
+	ax = None
+	for name, table in tukey_table.groupby('name'):
+		control = controls.get(name)
+		if control is not None:
+			table = table[(table['group1'] == control) | (table['group2'] == control)]
 		filename = folder / f"tukey.{name}.png"
+		labels = table['group1'].astype(str) + " - " + table['group2'].astype(str)
+		positions = list(range(len(table)))
+
+		plt.close()
+		fig, ax = plt.subplots(figsize = (8, max(4, len(table) * 0.2)))
+		errors = [table['meandiff'] - table['lower'], table['upper'] - table['meandiff']]
+		colors = ['red' if reject else 'black' for reject in table['reject']]
+		ax.errorbar(table['meandiff'], positions, xerr = errors, fmt = 'none', ecolor = colors)
+		ax.scatter(table['meandiff'], positions, c = colors, s = 10)
+		ax.axvline(0, linestyle = '--', color = 'gray')
+		ax.set_yticks(positions)
+		ax.set_yticklabels(labels)
+		ax.set_title(f"Tukey HSD: {name}")
 		try:
-			ax = tukey_result.plot_simultaneous(comparison_name = controls.get(name))
 			plt.savefig(str(filename))
 		except Exception as exception:
 			logger.error(exception)
-			ax = None
-
 	return ax
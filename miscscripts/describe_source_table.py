@@ -8,6 +8,7 @@ from pathlib import Path
 from typing import *
 import pandas
 from platereader.plateparser import PlateReaderParser
+from platereader.platereaderparser import find_table_blocks
 
 def get_columns(table:pandas.DataFrame)->List[str]:
 	""" Looks for the `columns` row within a table and returns the strain/condition fields."""
@@ -15,29 +16,23 @@ def get_columns(table:pandas.DataFrame)->List[str]:
 	table = pandas.read_excel()
 
 def get_header_row(table:pandas.DataFrame)->int:
-	""" Returns the index of the row that contains the fieldnames."""
+	""" Returns the index of the row that contains the fieldnames.
+		`table` should be the whole sheet, read with `header = None` so that the header row is kept as a row.
+	"""
 	# This is the very first field in the column names.
 	key_value = "Cycle Nr."
 
-	# So, locate the `key_value` in the first (leftmost) column
 	# Since the column names are not the first row in the source tables we have to locate it using the column values.
-	# Also, since the column names added by pandas are based on the first row they will basically just be
-	# placeholders, so use the `columns` attribute to figure out where the first row is.
-
-	first_column_label = table.columns[0]
-	first_column = table[first_column_label]
-
-	# It turns out that there's a *lot* of shitespace in the first column and it's not formatted well (.strip() won't work),
-	# so instead just check if the `key_value` is contained in the cell.
-	first_column = first_column.apply(lambda s: key_value in s if isinstance(s, str) else False)
-	# There should only be one `True` value.
-	index_of_header_row = first_column[first_column].index[0]
-	return index_of_header_row
+	# `find_table_blocks` already deals with the whitespace the plate reader pads the first column with.
+	blocks = find_table_blocks(table, key_value)
+	# The first table in the sheet holds the fieldnames used by every other table.
+	start_position, _ = blocks[0]
+	return table.index[start_position]
 
 
 def main():
 	filename = "/media/cld100/FA86364B863608A1/Users/cld100/Storage/projects/tils/growthcurves/2020-04-06-growthcurves/source_tables/2.7.20.Asp.Phe.Rep1.xlsx"
-	df = pandas.read_excel(filename)
+	df = pandas.read_excel(filename, header = None)
 	result = get_header_row(df)
 
 	print(result)
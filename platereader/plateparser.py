@@ -1,14 +1,30 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import *
 
+import numpy
 import pandas
 from loguru import logger
 
+import utilities
+
 from platereader.platereaderparser import PlateReaderParser
+from platereader.tablecache import TableCache
 
 FORMAT = "[strain].[condition].[plate].[replicate}]"
 
+def _read_plate(parser: PlateReaderParser, filename: Path, plate_number: int) -> Tuple[Optional[pandas.DataFrame], Optional[Exception]]:
+	""" Parses a single plate reader table. Defined at the module level so it can be sent to a process pool.
+		Any error is returned rather than raised so that one bad plate doesn't abort the whole batch.
+	"""
+	try:
+		result = parser.read_table(filename, plate_number).reset_index(drop = True)
+	except Exception as exception:
+		return None, exception
+	return result, None
+
+
 def patch_to_remove_old_arg(table:pandas.DataFrame)->pandas.DataFrame:
 	table = table[[i for i in table if ('Arg' not in i and 'arg' not in i)]]
 	return table
@@ -17,9 +33,14 @@ class Application:
 
 	def __init__(self):
 		self.parser = PlateReaderParser()
+		# The file format used for the consolidated table.
+		self.table_format = '.parquet'
 		self.allowed_strains = []
 		self.allowed_media = []
 
+		# Maps tables which could not be parsed to the error that was raised.
+		self.errors: Dict[Path, Exception] = dict()
+
 		self.labelmap = {
 			'arg': 'Arg',
 			'asp': 'Asp',
@@ -32,16 +53,75 @@ class Application:
 			'trp': 'Trp'
 		}
 
-	def parse_tables(self, tables: List[Path], starting_plate: int = 0) -> List[pandas.DataFrame]:
-		parsed_tables = list()
-		for index, filename in enumerate(tables):
-			plate_number = index + 1 + starting_plate
+	def get_settings(self) -> Dict[str, Any]:
+		""" Collects the settings which change how a table is parsed. Used as part of the key for cached tables."""
+		settings = {
+			'time_offset':             self.parser.time_offset,
+			'labelmap':                self.labelmap,
+			'correct_rks':             self.parser.cleaner.correct_rks,
+			'rename_columns_manually': self.parser.cleaner.rename_columns_manually
+		}
+		return settings
+
+	def parse_tables(self, tables: List[Path], starting_plate: int = 0, jobs: int = 1, cache: Optional[TableCache] = None) -> List[pandas.DataFrame]:
+		"""
+			Parses each plate reader table. Plates are numbered by their position in `tables`.
+		Parameters
+		----------
+		tables: List[Path]
+			The plate reader files to parse.
+		starting_plate: int
+			Added to the plate number of every table.
+		jobs: int
+			The number of processes used to parse the tables. Parsing is done serially if `jobs` is 1.
+		cache: Optional[TableCache]
+			If given, tables which were already parsed with the same settings are loaded from the cache.
+
+		Returns
+		-------
+		The parsed tables in the same order as `tables`. Tables which could not be parsed are skipped and
+		the errors are saved to `self.errors`.
+		"""
+		self.errors = dict()
+		plate_numbers = [index + 1 + starting_plate for index in range(len(tables))]
+		for filename, plate_number in zip(tables, plate_numbers):
 			logger.info(f"Converting {filename} representing plate {plate_number} to the required format...")
-			result = self.parser.read_table(filename, plate_number).reset_index(drop = True)
-			logger.warning(f"Patch to remove old Arg columns.")
-			_patch_files = ["1.24.20.Fe3.Arg.Rep1.xlsx", "2.3.20.Fe3.Arg.Rep2.xlsx", "2.5.20.Fe3.Arg.Rep3.xlsx"]
-			#if filename.name in _patch_files:
-			#	result = patch_to_remove_old_arg(result)
+
+		results: List[Optional[Tuple[Optional[pandas.DataFrame], Optional[Exception]]]] = [None] * len(tables)
+		keys: Dict[int, str] = dict()
+		if cache is not None:
+			settings = self.get_settings()
+			for index, (filename, plate_number) in enumerate(zip(tables, plate_numbers)):
+				try:
+					keys[index] = cache.get_key(filename, plate_number, settings)
+				except OSError:
+					# The table can't be read, so let the parser report the error.
+					continue
+				cached_table = cache.get(keys[index])
+				if cached_table is not None:
+					logger.debug(f"Loaded {filename.name} from the table cache.")
+					results[index] = (cached_table, None)
+
+		remaining = [index for index, result in enumerate(results) if result is None]
+		if jobs > 1 and len(remaining) > 1:
+			with ProcessPoolExecutor(max_workers = jobs) as executor:
+				futures = [executor.submit(_read_plate, self.parser, tables[index], plate_numbers[index]) for index in remaining]
+				# Collect the results in submission order so the plate order is identical to the serial path.
+				parsed = [future.result() for future in futures]
+		else:
+			parsed = [_read_plate(self.parser, tables[index], plate_numbers[index]) for index in remaining]
+
+		for index, (result, exception) in zip(remaining, parsed):
+			results[index] = (result, exception)
+			if cache is not None and exception is None and index in keys:
+				cache.put(keys[index], result)
+
+		parsed_tables = list()
+		for filename, (result, exception) in zip(tables, results):
+			if exception is not None:
+				logger.error(f"Could not parse {filename}: {exception}")
+				self.errors[filename] = exception
+				continue
 			parsed_tables.append(result)
 		return parsed_tables
 
@@ -80,17 +160,29 @@ class Application:
 			cols.append(column)
 		return cols
 
-	def run(self, project_folder: Path, table_folder: Path, project_name: str = None):
+	def run(self, project_folder: Path, table_folder: Path, project_name: str = None, jobs: int = 1, use_cache: bool = True):
 		""" Provides the entrypoint for the platereader parser. This code here will likely be modified based on the current run."""
 		# TODO: Add a way to specify the expected strains and test for typos.
 		if project_name is None:
 			project_name = project_folder.name
-		output_filename = project_folder / f"{project_name}.tsv"
+		output_filename = project_folder / f"{project_name}{self.table_format}"
+
+		# Sort the files so that the plate numbers don't depend on the order returned by the filesystem.
+		tables_other = sorted(i for i in table_folder.iterdir() if i.suffix == '.xlsx')
 
-		tables_other = list(i for i in table_folder.iterdir() if i.suffix == '.xlsx')
+		cache = TableCache(project_folder / ".cache" / "tables") if use_cache else None
+		parsed_tables = self.parse_tables(tables_other, jobs = jobs, cache = cache)
+		if self.errors:
+			logger.warning(f"{len(self.errors)} of {len(tables_other)} tables could not be parsed: {sorted(i.name for i in self.errors)}")
 
-		parsed_tables = self.parse_tables(tables_other)
+		combined_table = self.combine_tables(parsed_tables)
+		self.summarize_table(combined_table)
+		check_for_duplicate_columns(combined_table)
 
+		utilities.save_table(combined_table, output_filename, index = False)
+
+	def combine_tables(self, parsed_tables: List[pandas.DataFrame]) -> pandas.DataFrame:
+		""" Combines the parsed tables into a single table with one `time` column and corrects the column labels."""
 		combined_table = pandas.concat(parsed_tables, axis = 1)
 		combined_table = self.parser.cleaner.remove_redundant_time_columns(combined_table)
 
@@ -104,46 +196,150 @@ class Application:
 		combined_table.columns = self.format_fields(combined_table.columns)
 		# remove `N/A` values
 		combined_table = combined_table[[i for i in combined_table.columns if 'N/A' not in i]]
-		self.summarize_table(combined_table)
-		check_for_duplicate_columns(combined_table)
-
-		combined_table.to_csv(output_filename, sep = '\t', index = False)
+		return combined_table
 
+	def append(self, table_filename: Path, tables: List[Path], output_filename: Optional[Path] = None, jobs: int = 1,
+			use_cache: bool = True) -> pandas.DataFrame:
+		"""
+			Adds new plates to an existing consolidated table without parsing the plates which are already in the table.
+		Parameters
+		----------
+		table_filename: Path
+			The consolidated table generated by `Application.run`.
+		tables: List[Path]
+			The new plate reader tables. These are numbered after the last plate in the existing table.
+		output_filename: Optional[Path]
+			Where to save the merged table. Overwrites `table_filename` if not given.
+		jobs, use_cache
+			Passed to `parse_tables`.
+		"""
+		if output_filename is None:
+			output_filename = table_filename
+		existing_table = utilities.read_table(table_filename)
+		existing_plates = [int(i.split('.')[2]) for i in existing_table.columns if i != 'time']
+		starting_plate = max(existing_plates) if existing_plates else 0
+
+		cache = TableCache(table_filename.parent / ".cache" / "tables") if use_cache else None
+		parsed_tables = self.parse_tables(tables, starting_plate = starting_plate, jobs = jobs, cache = cache)
+		if self.errors:
+			logger.warning(f"{len(self.errors)} of {len(tables)} tables could not be parsed: {sorted(i.name for i in self.errors)}")
+		if not parsed_tables:
+			message = f"None of the new tables could be parsed."
+			raise ValueError(message)
+		new_table = self.combine_tables(parsed_tables)
+
+		collisions = sorted(set(new_table.columns) & set(existing_table.columns) - {'time'})
+		if collisions:
+			message = f"The new tables contain labels which are already in '{table_filename}': {collisions}"
+			raise ValueError(message)
+
+		# The plates are aligned on the timepoints rather than the row number, since the new plates may have been read for a different length of time.
+		missing_timepoints = set(new_table['time']) ^ set(existing_table['time'])
+		if missing_timepoints:
+			logger.warning(f"{len(missing_timepoints)} timepoints are only present in one of the tables and will have missing values.")
+		combined_table = existing_table.merge(new_table, on = 'time', how = 'outer').sort_values('time').reset_index(drop = True)
+
+		self.summarize_table(new_table)
+		check_for_duplicate_columns(combined_table)
 
-def lists_are_equal(left: List[float], right: List[float]) -> bool:
-	import math
-	results = list()
-	for left_value, right_value in zip(left, right):
-		result = math.isclose(left_value, right_value)
-		results.append(result)
-
-	return all(results)
-
-
-def check_for_duplicate_columns(table: pandas.DataFrame):
-	columns = table.columns
-	seen = set()
-	for left in columns:
-		series_left = table[left].tolist()
-		for right in columns:
-			if left == right or (left, right) in seen: continue
-			seen.add((left, right))
-			seen.add((right, left))
-			series_right = table[right].tolist()
-
-			result = lists_are_equal(series_left, series_right)
-			if result:
-				print(f"Duplicate: '{left}' & '{right}'")
-
-
-def main():
-	# Correct some typos in the labels.
-
-	project_name = "2020-07-03-growthcurves"
-	project_folder = Path.home() / "storage" / "projects" / "tils" / "growthcurves" / project_name
-	table_folder = project_folder / "tables" / "original_tables"
-	table_folder = Path("/home/cld100/storage/projects/tils/growthcurves/2020-07-03-growthcurves/original_tables")
-	Application().run(project_folder, table_folder)
+		utilities.save_table(combined_table, output_filename, index = False)
+		return combined_table
+
+
+def lists_are_equal(left: numpy.ndarray, right: numpy.ndarray, rel_tol: float = 1E-9) -> numpy.ndarray:
+	""" Vectorized version of `math.isclose`. `right` may be a 2D array, in which case each column is compared to `left`."""
+	if right.ndim == 2:
+		left = left[:, numpy.newaxis]
+	with numpy.errstate(invalid = 'ignore'):
+		result = numpy.abs(left - right) <= rel_tol * numpy.maximum(numpy.abs(left), numpy.abs(right))
+	return result.all(axis = 0)
+
+
+def find_duplicate_columns(table: pandas.DataFrame, rel_tol: float = 1E-9) -> pandas.DataFrame:
+	"""
+		Finds columns whose values are all close to the values in another column.
+		Rather than comparing every pair of columns, each column is assigned to a bucket based on its quantized sum.
+		Two columns can only be close if their sums are close, so only columns in the same or neighboring buckets are compared.
+	Parameters
+	----------
+	table: pandas.DataFrame
+	rel_tol: float
+		The relative tolerance used to compare values. Same as `math.isclose`.
+
+	Returns
+	-------
+	A table with a `group` column and a `column` column. Each group lists a set of duplicate columns. The table is empty if there are no duplicates.
+	"""
+	columns = list(table.columns)
+	values = table.to_numpy(dtype = float)
+	sums = values.sum(axis = 0)
+	absolute_sums = numpy.abs(values).sum(axis = 0)
+
+	# Columns with missing values are never equal to another column.
+	candidates = numpy.flatnonzero(~numpy.isnan(sums))
+	if len(candidates) < 2:
+		return pandas.DataFrame(columns = ['group', 'column'])
+
+	# The sums of two close columns can differ by at most `rel_tol * (absolute_sum_left + absolute_sum_right)`.
+	# Use this as the bucket width so that close columns are always in the same or adjacent buckets.
+	width = max(2 * rel_tol * absolute_sums[candidates].max(), numpy.finfo(float).tiny)
+	buckets = numpy.floor(sums[candidates] / width).astype(numpy.int64)
+	order = numpy.argsort(buckets, kind = 'stable')
+	candidates, buckets = candidates[order], buckets[order]
+	unique_buckets, starts = numpy.unique(buckets, return_index = True)
+	stops = numpy.append(starts[1:], len(buckets))
+
+	# Use a union-find structure to combine the matched pairs into groups.
+	parents = list(range(len(columns)))
+
+	def find(index: int) -> int:
+		while parents[index] != index:
+			parents[index] = parents[parents[index]]
+			index = parents[index]
+		return index
+
+	for position, (bucket, start, stop) in enumerate(zip(unique_buckets, starts, stops)):
+		# Include the next bucket if it is adjacent to this one.
+		if position + 1 < len(unique_buckets) and unique_buckets[position + 1] == bucket + 1:
+			stop = stops[position + 1]
+		members = candidates[start:stop]
+		for offset, left in enumerate(members[:stops[position] - start]):
+			right = members[offset + 1:]
+			if len(right) == 0: continue
+			matches = right[lists_are_equal(values[:, left], values[:, right], rel_tol)]
+			for match in matches:
+				parents[find(match)] = find(left)
+
+	groups: Dict[int, List[str]] = dict()
+	for index, column in enumerate(columns):
+		root = find(index)
+		groups.setdefault(root, list()).append(column)
+	duplicates = [group for group in groups.values() if len(group) > 1]
+
+	report = [{'group': number, 'column': column} for number, group in enumerate(duplicates) for column in group]
+	return pandas.DataFrame(report, columns = ['group', 'column'])
+
+
+def check_for_duplicate_columns(table: pandas.DataFrame) -> pandas.DataFrame:
+	""" Logs any columns which are duplicates of another column. Returns the report from `find_duplicate_columns`."""
+	report = find_duplicate_columns(table)
+	for number, group in report.groupby('group'):
+		logger.warning(f"Duplicate columns: {group['column'].tolist()}")
+	return report
+
+
+def main(args: Optional[List[str]] = None):
+	args = create_parser(args)
+	application = Application()
+	application.table_format = f".{args.tableformat}"
+
+	if args.append is not None:
+		# Sort the files so that the plate numbers don't depend on the order returned by the filesystem.
+		tables = sorted(i for i in args.folder.iterdir() if i.suffix == '.xlsx')
+		application.append(args.append, tables, jobs = args.jobs, use_cache = args.usecache)
+	else:
+		# The consolidated table is saved next to the folder with the platereader tables.
+		application.run(args.folder.parent, args.folder, project_name = args.name, jobs = args.jobs, use_cache = args.usecache)
 
 
 def create_parser(args: Optional[List[str]] = None) -> argparse.Namespace:
@@ -151,7 +347,7 @@ def create_parser(args: Optional[List[str]] = None) -> argparse.Namespace:
 
 	parser.add_argument(
 		"folder",
-		help = "The folder with the platereader tables.",
+		help = "The folder with the platereader tables. The consolidated table is saved to the parent folder.",
 		type = Path
 	)
 
@@ -161,6 +357,31 @@ def create_parser(args: Optional[List[str]] = None) -> argparse.Namespace:
 		type = str,
 		default = None
 	)
+	parser.add_argument(
+		"--jobs",
+		help = "The number of processes used to parse the platereader tables.",
+		type = int,
+		default = 1
+	)
+	parser.add_argument(
+		"--table-format",
+		help = "The file format of the consolidated table.",
+		choices = ['parquet', 'feather', 'tsv'],
+		default = 'parquet',
+		dest = "tableformat"
+	)
+	parser.add_argument(
+		"--append",
+		help = "An existing consolidated table. Only the tables in `folder` are parsed and are added to this table as new plates.",
+		type = Path,
+		default = None
+	)
+	parser.add_argument(
+		"--no-cache",
+		help = "Parse every platereader table again rather than loading previously parsed tables from the cache.",
+		action = "store_false",
+		dest = "usecache"
+	)
 
 	args = parser.parse_args(args)
 
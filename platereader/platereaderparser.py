@@ -1,6 +1,7 @@
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy
 import pandas
 from loguru import logger
 from platereader.platereadercleaner import TableCleaner
@@ -8,6 +9,51 @@ from platereader.platereadercleaner import TableCleaner
 FORMAT = "[strain].[condition].[plate].[replicate}]"
 
 
+def find_table_blocks(table: pandas.DataFrame, header_value: str = 'Cycle Nr.', time_column_name: Optional[str] = None) -> List[Tuple[int, int]]:
+	"""
+		Locates every table in the raw cell grid of a plate reader output file in a single pass over its rows.
+		A header row is any row whose first cell is `header_value`, ignoring the whitespace the plate reader pads some labels with.
+	Parameters
+	----------
+	table: pandas.DataFrame
+		The raw table. Only the first column and the time column are read.
+	header_value: str
+		The value in the first cell of each header row.
+	time_column_name: Optional[str]
+		The label of the time column in the header rows. If given, a table also ends at the first row without a timepoint.
+
+	Returns
+	-------
+	A list of (header row, end row) positions for each table. The end row is the first blank line after
+	the header row (or the next header row / end of the table) and is not part of the table.
+	"""
+	def is_blank(column: pandas.Series) -> numpy.ndarray:
+		return (column.isna() | (column.astype(str).str.strip() == '')).to_numpy(dtype = bool)
+
+	first_column = table.iloc[:, 0]
+	# Numeric cells (the cycle numbers) can never match the header, so it's safe to compare everything as text.
+	is_header = (first_column.astype(str).str.strip() == header_value).to_numpy(dtype = bool)
+	is_end = is_blank(first_column)
+
+	starts = numpy.flatnonzero(is_header)
+	if time_column_name is not None and len(starts) != 0:
+		# Every table in a file has the same columns, so the time column is found from the first header row.
+		header = table.iloc[starts[0]].astype(str).str.strip()
+		time_columns = numpy.flatnonzero((header == time_column_name).to_numpy(dtype = bool))
+		if len(time_columns) != 0:
+			is_end |= is_blank(table.iloc[:, time_columns[0]])
+
+	ends = numpy.flatnonzero(is_end)
+	# The first blank line after each header row marks the end of that table.
+	positions = numpy.searchsorted(ends, starts, side = 'right')
+	stops = numpy.append(ends, len(table))[positions]
+	# Tables can't overlap, so a table also ends at the next header row.
+	next_starts = numpy.append(starts[1:], len(table))
+	stops = numpy.minimum(stops, next_starts)
+
+	return [(int(start), int(stop)) for start, stop in zip(starts, stops)]
+
+
 class PlateReaderParser:
 	def __init__(self):
 		self.plate: Optional[int] = None
@@ -68,36 +114,50 @@ class PlateReaderParser:
 
 		return new_table
 
+	def _get_table_blocks(self, table: pandas.DataFrame) -> List[Tuple[int, int]]:
+		""" Finds the header row and the end of every table in a plate reader output file."""
+		return find_table_blocks(table, self.header_value, self.time_column_name_original)
+
 	def _get_table_indicies(self, table: pandas.DataFrame) -> List[int]:
 		""" Extracts all tables from a plate reader output file, ignoring any metadata."""
-		table_indicies_start = list()
-		# Iterate over the dataframe explicitly
-		# Quick to implement, and not slow enough to cause a problem.
-		for index, row in table.iterrows():
-			# Use the index value to skip the metadata rows.
-			if row[0] == self.header_value:
-				table_indicies_start.append(index)
-
-		return table_indicies_start
-
-	def _remove_blank_lines(self, minor_table: pandas.DataFrame) -> pandas.DataFrame:
-		blank_lines = minor_table[self.time_column_name_original].isna()
-		try:
-			first_blank_line = blank_lines[blank_lines].index[0]
-			minor_table = minor_table.iloc[0:first_blank_line]
-		except IndexError:
-			pass
-		return minor_table
-
-	def _extract_tables(self, filename: Path, indicies: List[int]) -> List[pandas.DataFrame]:
-		""" Extracts all tables from a plate reader output file."""
-		table_list = list()
+		return [start for start, stop in self._get_table_blocks(table)]
 
-		for start_index in indicies:
-			minor_table = pandas.read_excel(filename, skiprows = start_index + 1)  # `skiprows` is 1-based rather than 0-based like the index.
-			# The first NAN value in any of the columns indicates the end of the table.
-			nonblank_table = self._remove_blank_lines(minor_table)
-			table_list.append(nonblank_table)
+	@staticmethod
+	def _load_sheet(filename: Path) -> pandas.DataFrame:
+		""" Loads the raw cell grid of a plate reader output file a single time.
+			`pandas.read_excel` opens the workbook in read-only mode, and `header = None` keeps every row
+			(metadata included) so that all sub-tables can be sliced out of the same grid.
+		"""
+		return pandas.read_excel(filename, header = None)
+
+	@staticmethod
+	def _format_header(values: List[Any]) -> List[str]:
+		""" Converts a raw header row into column labels the same way `pandas.read_excel` would.
+			Blank cells become 'Unnamed: {index}' and repeated labels get a '.{count}' suffix.
+		"""
+		columns = list()
+		counts: Dict[str, int] = dict()
+		for index, value in enumerate(values):
+			label = f"Unnamed: {index}" if pandas.isna(value) else value
+			if label in counts:
+				counts[label] += 1
+				label = f"{label}.{counts[label]}"
+			else:
+				counts[label] = 0
+			columns.append(label)
+		return columns
+
+	def _extract_tables(self, sheet: pandas.DataFrame, blocks: List[Tuple[int, int]]) -> List[pandas.DataFrame]:
+		""" Extracts all tables from the raw grid of a plate reader output file.
+			Each table starts at the header row of one of the `blocks` from `_get_table_blocks` and ends at the first blank line after it.
+		"""
+		table_list = list()
+		for start_index, stop_index in blocks:
+			minor_table = sheet.iloc[start_index + 1:stop_index].reset_index(drop = True)
+			minor_table.columns = self._format_header(sheet.iloc[start_index].tolist())
+			# The grid is read without a header, so each column still has an `object` dtype.
+			minor_table = minor_table.infer_objects()
+			table_list.append(minor_table)
 		return table_list
 
 	def read_table(self, filename: Path, plate: int):
@@ -108,12 +168,13 @@ class PlateReaderParser:
 			need to be combined together.
 		"""
 		#logger.info(f"Reading {filename}")
-		garbage_table = pandas.read_excel(filename)
-		# Go through the first column and find the index of `Cycle Nr.`, which indicates the header row.
+		# Only parse the workbook once. Every sub-table is sliced out of the same grid.
+		garbage_table = self._load_sheet(filename)
+		# Go through the first column and find the rows with `Cycle Nr.`, which indicates the header row, and the end of each table.
 		# There may also be multiple tables.
-		table_indicies_start = self._get_table_indicies(garbage_table)
+		table_blocks = self._get_table_blocks(garbage_table)
 
-		table_list = self._extract_tables(filename, table_indicies_start)
+		table_list = self._extract_tables(garbage_table, table_blocks)
 		combined_table = self._combine_tables(table_list)
 
 		# Clean up the table
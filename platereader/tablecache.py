@@ -0,0 +1,93 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import *
+
+import pandas
+from loguru import logger
+
+try:
+	import pyarrow
+except ImportError:
+	# Feather files need pyarrow. Fall back to pickle files if it isn't available.
+	pyarrow = None
+
+
+class TableCache:
+	"""
+		Saves the parsed table for each plate reader file so it doesn't have to be parsed again on the next run.
+		Each table is keyed by a hash of the file contents, the plate number, and the parser settings, so
+		modifying a file or changing how it is parsed will result in a cache miss rather than a stale table.
+	Parameters
+	----------
+	folder: Path
+		The folder to save the cached tables to.
+	maximum_size: int
+		The maximum total size (in bytes) of the cache. The least recently used tables are removed once the cache grows larger than this.
+	"""
+
+	def __init__(self, folder: Path, maximum_size: int = 500 * 1024 ** 2):
+		self.folder = Path(folder)
+		self.folder.mkdir(parents = True, exist_ok = True)
+		self.maximum_size = maximum_size
+		self.suffix = '.feather' if pyarrow is not None else '.pkl'
+
+	@staticmethod
+	def hash_file(filename: Path, chunk_size: int = 2 ** 20) -> str:
+		""" Calculates the sha256 hash of the file contents."""
+		digest = hashlib.sha256()
+		with Path(filename).open('rb') as file:
+			for chunk in iter(lambda: file.read(chunk_size), b''):
+				digest.update(chunk)
+		return digest.hexdigest()
+
+	def get_key(self, filename: Path, plate: int, settings: Dict[str, Any]) -> str:
+		""" Combines the file hash, plate number and parser settings into a single key."""
+		data = {
+			'file':     self.hash_file(filename),
+			'plate':    plate,
+			'settings': settings
+		}
+		text = json.dumps(data, sort_keys = True, default = str)
+		return hashlib.sha256(text.encode()).hexdigest()
+
+	def _get_filename(self, key: str) -> Path:
+		return self.folder / f"{key}{self.suffix}"
+
+	def get(self, key: str) -> Optional[pandas.DataFrame]:
+		""" Returns the cached table, or `None` if the table has not been cached."""
+		filename = self._get_filename(key)
+		if not filename.exists():
+			return None
+		try:
+			if self.suffix == '.feather':
+				table = pandas.read_feather(filename)
+			else:
+				table = pandas.read_pickle(filename)
+		except Exception as exception:
+			logger.warning(f"Could not read the cached table {filename.name}: {exception}")
+			filename.unlink()
+			return None
+		# Update the modification time so that eviction is based on when the table was last used.
+		filename.touch()
+		return table
+
+	def put(self, key: str, table: pandas.DataFrame):
+		""" Saves the table to the cache and evicts old tables if the cache is too large."""
+		filename = self._get_filename(key)
+		if self.suffix == '.feather':
+			table.reset_index(drop = True).to_feather(filename)
+		else:
+			table.to_pickle(filename)
+		self.evict()
+
+	def evict(self):
+		""" Removes the least recently used tables until the cache is smaller than `self.maximum_size`."""
+		filenames = sorted((i for i in self.folder.iterdir() if i.suffix == self.suffix), key = lambda s: s.stat().st_mtime)
+		total_size = sum(i.stat().st_size for i in filenames)
+		for filename in filenames:
+			if total_size <= self.maximum_size:
+				break
+			total_size -= filename.stat().st_size
+			logger.debug(f"Removing {filename.name} from the table cache.")
+			filename.unlink()
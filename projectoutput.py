@@ -1,5 +1,3 @@
-import json
-from io import StringIO
 from pathlib import Path
 from typing import *
 
@@ -10,6 +8,7 @@ from statsmodels.regression import linear_model
 import utilities
 from graphics import AnovaPanelPlot, AnovaPlotNested, PlotGrowthcurves, other
 from projectpaths import Filenames
+from table_schema import DTYPES_AUC_STATISTICS
 
 
 class CleanTukey:
@@ -119,8 +118,8 @@ class CleanTukey:
 class FigureWorkflow:
 	""" Generates figures using the data from `GrowthCurveAnalysis."""
 
-	def __init__(self, folder: Path, label_order: List[str] = None, groups: List[str] = None):
-		self.filenames = Filenames(folder)
+	def __init__(self, folder: Path, label_order: List[str] = None, groups: List[str] = None, table_format: str = '.parquet'):
+		self.filenames = Filenames(folder, table_format)
 
 		self.label_order = label_order
 		self.groups = groups
@@ -135,7 +134,7 @@ class FigureWorkflow:
 		)
 
 	def load(self):
-		auc_statistics_table = pandas.read_csv(self.filenames.filename_table_auc_statistics, sep = "\t")
+		auc_statistics_table = utilities.read_table(self.filenames.filename_table_auc_statistics, DTYPES_AUC_STATISTICS)
 
 		return auc_statistics_table
 
@@ -173,59 +172,35 @@ def plot_growthcurves(table: pandas.DataFrame, timeseries: pandas.DataFrame, fol
 
 
 def save_auc_statistics_table(table: pandas.DataFrame, filename: Path):
-	table.to_csv(filename, sep = "\t")
-
-
-def save_table_tukey(tukey_results: Dict[str, Any], filename: Path, filename_json: Path):
-	_temp = {key: utilities.tukey_to_json(value) for key, value in tukey_results.items()}
-
-	filename_json.write_text(json.dumps(_temp, indent = 4, sort_keys = True))
-
-	tables = list()
-	metatable = list() # Stores metadata about each table. Things like how many pass/fail items were present, etc.
-	for name, tukey_result in tukey_results.items():
-		text = tukey_result.summary().as_csv()
-		# Remove the header
-		contents = StringIO("\n".join(text.split('\n')[1:]))
-		df = pandas.read_csv(contents)
-		df.columns = [i.strip() for i in df.columns]
-		df['name'] = name
-		try:
-			df['pvalues'] = tukey_result.pvalues
-		except AttributeError:
-			message = "The version of TukeyHSD currently implemented in statsmodels does not have a `pvalues` attribute, so that will be missing from the result."
-			logger.warning(message)
-			df['pvalues'] = None
-		# Append a version of the tables with `group` and `group2` swapped for easier filtering since you only need to filter on one column.
-
-		if name == 'condition_strain':
-			get_treatment = lambda s: s.split('-')[0].strip()
-			get_strain = lambda s: s.split('-')[1].strip()
-			df['treatments'] = [f"{get_treatment(i)}-{get_treatment(j)}" for i, j in zip(df['group1'].tolist(), df['group2'].tolist())]
-			df['strains'] = [f"{get_strain(i)}-{get_strain(j)}" for i, j in zip(df['group1'].tolist(), df['group2'].tolist())]
-
-		elif name == 'condition':
-			pass
-
-		tables.append(df)
-	newtable = pandas.concat(tables)
-	# Add duplicates for each series with reversed group1/group2 keys. This will make is easier to lookup a specific group or row.
-	cleaner_tukey = CleanTukey()
-	fulltable = cleaner_tukey.clean(newtable)
-	# Add a couple of columns for easier inspection
-
-	fulltable.to_csv(filename, sep = '\t', index = False)
-
-	# Also save a version with duplicate rows for easier parsing.
+	utilities.save_table(table, filename)
+
+
+def save_tukey_table(tukey_table: pandas.DataFrame, filename: Path) -> pandas.DataFrame:
+	"""
+		Saves the table from `analysis.tukey_table`, along with a copy where `group1` and `group2` are swapped for easier filtering.
+	"""
+	table = tukey_table.copy()
+	# Kept for anything reading tables saved before the `p-adj` column was added.
+	table['pvalues'] = table['p-adj']
+	is_combined = table['name'] == 'condition_strain'
+	groups1 = table.loc[is_combined, 'group1'].str.split('-', n = 1, expand = True)
+	groups2 = table.loc[is_combined, 'group2'].str.split('-', n = 1, expand = True)
+	if is_combined.any():
+		table.loc[is_combined, 'treatments'] = groups1[0] + "-" + groups2[0]
+		table.loc[is_combined, 'strains'] = groups1[1] + "-" + groups2[1]
+
+	fulltable = CleanTukey().clean(table)
+	utilities.save_table(fulltable, filename, index = False)
+
 	newtable = fulltable.copy(deep = True)
 	newtable['group1'], newtable['group2'] = newtable['group2'], newtable['group1']
 	newtable = newtable.sort_values(by = ['name', 'group1', 'group2'])
-	newtable.to_csv(filename.with_suffix('.duplicated.tsv'), sep = "\t", index = False)
+	utilities.save_table(newtable, filename.with_suffix('.duplicated' + filename.suffix), index = False)
 	return fulltable
 
 
-def plot_tukey(tukey_results: Dict[str, Any], folder: Path, controls: Dict[str, str]):
-	other.plot_tukey(tukey_results, folder, controls)
+def plot_tukey_table(tukey_table: pandas.DataFrame, folder: Path, controls: Dict[str, str]):
+	other.plot_tukey_table(tukey_table, folder, controls)
 
 
 def save_tukey_matrix(table: pandas.DataFrame, folder_tukey, ext: str = '.tsv'):
@@ -238,11 +213,12 @@ def save_tukey_matrix(table: pandas.DataFrame, folder_tukey, ext: str = '.tsv'):
 		df = group
 		# df = pandas.concat([group, reverse_group])
 		matrix = df.pivot(index = 'group1', columns = 'group2', values = 'meandiff').fillna(0)
-		matrix.to_csv(filename, sep = "\t")
+		utilities.save_table(matrix, filename)
 
 
 def save_anova(anova_table: pandas.DataFrame, filename: Path):
-	anova_table.to_csv(filename, sep = '\t', index = True)
+	# The index holds the model terms. Name it so it isn't saved as a column called `index` in the parquet/feather tables.
+	utilities.save_table(anova_table.rename_axis('term'), filename, index = True)
 
 
 def save_maximum_growth(maximum_growth: pandas.Series, filename: Path):
@@ -250,11 +226,28 @@ def save_maximum_growth(maximum_growth: pandas.Series, filename: Path):
 
 
 def save_table_growthcurve_models(table: pandas.DataFrame, filename: Path):
-	table.to_csv(filename, sep = "\t")
+	utilities.save_table(table, filename)
+
+
+def save_auc_cutoffs(table: pandas.DataFrame, filename: Path):
+	utilities.save_table(table, filename)
+
+
+def save_fit_failures(table: pandas.DataFrame, filename: Path):
+	utilities.save_table(table, filename)
+
+
+def save_regression(regression: Union[linear_model.RegressionResults, pandas.DataFrame], filename: Path):
+	# The ANOVA from `GroupStatisticsStore` only has the coefficient table of the regression.
+	text = regression.to_string() if isinstance(regression, pandas.DataFrame) else str(regression.summary())
+	filename.write_text(text)
 
 
-def save_regression(regression: linear_model.RegressionResults, filename: Path):
-	filename.write_text(str(regression.summary()))
+def save_anova_responses(results: Dict[str, Tuple[pandas.DataFrame, pandas.DataFrame]], folder: Path, ext: str = '.tsv'):
+	""" Saves the regression and ANOVA tables from `analysis.anova_multiple` for each response."""
+	for column, (regression_table, anova_table) in results.items():
+		utilities.save_table(anova_table.rename_axis('term'), folder / f"anova.{column}{ext}", index = True)
+		utilities.save_table(regression_table.rename_axis('term'), folder / f"regression.{column}{ext}", index = True)
 
 
 def save_table_info(table_info: Dict[str, List[str]], filename: Path):
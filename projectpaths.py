@@ -21,8 +21,9 @@ class Filenames:
 
 	"""
 
-	def __init__(self, folder: Path):
-		self.table_format = '.tsv'
+	def __init__(self, folder: Path, table_format: str = '.parquet'):
+		# The format used for the larger tables. Can be one of '.parquet', '.feather', or '.tsv'.
+		self.table_format = table_format
 		self.figure_format = '.pdf'
 		# TODO: Make sure these options are actually
 		folder = utilities.checkdir(folder)
@@ -55,16 +56,23 @@ class Filenames:
 		self.filename_table_regression_model = self.folder_data / "regression.txt"
 		# Summarizes the results from the ANOVA analysis.
 		self.filename_table_anova = self.folder_data / ("anova" + self.table_format)
+		# The ANOVA and regression tables for each of the extra response columns. See `GrowthCurveAnalysis.run_anova_responses`.
+		self.folder_tables_anova = utilities.checkdir(self.folder_data / "anova")
 
 		# Contains all paired tukey calulations. Tukey operates as a pairwise calculation of the difference in means for each variable pair.
 		self.folder_tables_tukey = utilities.checkdir(self.folder_data / "tukey")
 		self.filename_table_tukey = self.folder_tables_tukey / ("tukey" + self.table_format)
-		self.filename_data_tukey = self.folder_data / "tukeyhsdresults.json"
 		# Add a table with the maximum observed growth for each sample, aorted in ascending order. This should help
 		# identify samples with little to no growth
 		self.filename_table_maximum_growth = self.folder_data / "maximumgrowth.txt"
-		self.filename_table_auc_statistics = self.folder_data / "auc_statistics.tsv"
-		self.filename_table_growthcurve_models = self.folder_data / "growthcurve.model.tsv"
+		self.filename_table_auc_statistics = self.folder_data / ("auc_statistics" + self.table_format)
+		self.filename_table_growthcurve_models = self.folder_data / ("growthcurve.model" + self.table_format)
+		# The AUC of every sample (rows) at each time limit (columns), and the ANOVA results at each time limit.
+		self.filename_table_auc_cutoffs_empirical = self.folder_data / ("auc_cutoffs.empirical" + self.table_format)
+		self.filename_table_auc_cutoffs_ideal = self.folder_data / ("auc_cutoffs.logistic" + self.table_format)
+		self.filename_table_anova_cutoffs = self.folder_data / ("anova.cutoffs" + self.table_format)
+		# Lists the samples which could not be fit to the logistic model or which had to be refit with different starting values.
+		self.filename_table_fit_failures = self.folder_data / ("fitfailures" + self.table_format)
 
 		# Figures
 		self.folder_figures_growthcurves = utilities.checkdir(self.folder_figure / "growthcurves")
@@ -32,6 +32,15 @@ def get_run_label() -> str:
 	return label
 
 
+def parse_cutoffs(text: str) -> List[float]:
+	""" Parses either a comma-separated list of cutoffs or a range formatted as 'start:stop:step'. The range includes `stop`."""
+	if ':' in text:
+		start, stop, step = [float(i) for i in text.split(':')]
+		number_of_cutoffs = int(round((stop - start) / step)) + 1
+		return [start + step * i for i in range(number_of_cutoffs)]
+	return [float(i) for i in text.split(',')]
+
+
 def create_parser(args: List[str] = None):
 	import argparse
 	parser = argparse.ArgumentParser()
@@ -59,6 +68,21 @@ def create_parser(args: List[str] = None):
 		type = int
 	)
 
+	parser.add_argument(
+		"--cutoffs",
+		help = "Also calculates the AUC and the ANOVA at each of these time limits (in minutes) without refitting the curves. "
+			   "Either a comma-separated list or a range formatted as start:stop:step (inclusive).",
+		type = str,
+		default = None
+	)
+
+	parser.add_argument(
+		"--threshold",
+		help = "The population used for the `time_to_threshold` column of the auc statistics table.",
+		type = float,
+		default = 0.1
+	)
+
 	parser.add_argument(
 		"--control",
 		help = "The label applied to the control condition",
@@ -83,6 +107,86 @@ def create_parser(args: List[str] = None):
 		type = str,
 		default = None
 	)
+	parser.add_argument(
+		"--table-format",
+		help = "The file format used for the output tables. 'parquet' and 'feather' are much faster to read and write than 'tsv'.",
+		choices = ['parquet', 'feather', 'tsv'],
+		default = 'parquet',
+		dest = "tableformat"
+	)
+	parser.add_argument(
+		"--fit-method",
+		help = "How to fit the logistic curves. 'scipy' fits each sample separately while 'batch' fits every sample at the same time. "
+			   "'fast' estimates the logistic parameters from the data without fitting the curves.",
+		choices = ['scipy', 'batch', 'fast'],
+		default = 'scipy',
+		dest = "fitmethod"
+	)
+	parser.add_argument(
+		"--fast",
+		help = "Same as `--fit-method fast`. Useful for a quick first look at a large number of plates.",
+		action = "store_true"
+	)
+	parser.add_argument(
+		"--models",
+		help = "A comma-separated list of the growth models to fit. If more than one model is given, each sample uses the model with the lowest AIC. "
+			   "Available models: logistic, gompertz, richards, baranyi",
+		type = str,
+		default = 'logistic'
+	)
+	parser.add_argument(
+		"--bootstrap",
+		help = "The number of bootstrap replicates used to calculate confidence intervals for k, N, r, auc_l and auc_e. "
+			   "Skipped by default, in which case only the standard errors from the fit covariance are reported.",
+		type = int,
+		default = 0
+	)
+	parser.add_argument(
+		"--screen",
+		help = "Skip the fit for samples which show no growth or which are already saturated at the first timepoint, "
+			   "and describe them by a flat line instead. By default every sample is fit.",
+		action = 'store_true'
+	)
+	parser.add_argument(
+		"--responses",
+		help = "A comma-separated list of other columns of the auc statistics table to run the ANOVA on (ex. 'auc_l,k,r,mu_max'). "
+			   "The ANOVA and regression tables for each one are saved to the `data/anova` folder.",
+		type = str,
+		default = None
+	)
+	parser.add_argument(
+		"--group-statistics",
+		help = "A folder to keep the count, sum and sum of squares of each strain/condition/plate group in. New samples are added to it "
+			   "on each run, and the ANOVA and Tukey tables are generated from every sample in it rather than only the current table.",
+		type = Path,
+		default = None,
+		dest = 'groupstatistics'
+	)
+	parser.add_argument(
+		"--comparisons",
+		help = "Which groups to compare after the ANOVA. 'all' compares every pair of groups with Tukey's test. 'control' only compares "
+			   "each strain to WT and each condition to RKS with Dunnett's test, which is much faster for large designs.",
+		choices = ['all', 'control'],
+		default = 'all'
+	)
+	parser.add_argument(
+		"--jobs",
+		help = "The number of processes used to fit the growth curves.",
+		type = int,
+		default = 1
+	)
+	parser.add_argument(
+		"--fault-tolerant",
+		help = "Retry samples which can't be fit with different starting values. Samples which still fail are excluded from the analysis rather than stopping it.",
+		action = "store_true",
+		dest = "faulttolerant"
+	)
+	parser.add_argument(
+		"--no-cache",
+		help = "Fit every growth curve again rather than loading previously fitted curves from the cache next to the input table.",
+		action = "store_false",
+		dest = "usecache"
+	)
 	parser.add_argument(
 		"--plot-growthcurves",
 		help = "Whether to plot the measured values and fitted logistic equation for every sample. This may take a very long time.",
@@ -97,32 +201,41 @@ def create_parser(args: List[str] = None):
 		args.treatments = args.treatments.split(',')
 	if args.strains is not None:
 		args.strains = args.strains.split(',')
+	args.models = args.models.split(',')
+	if args.fast:
+		args.fitmethod = 'fast'
+	if args.cutoffs is not None:
+		args.cutoffs = parse_cutoffs(args.cutoffs)
 	return args
 
 
-def main():
-	project_folder = Path.home() / "storage" / "projects" / "tils" / "growthcurves" / "2020-03-11-growthcurves"
-	filename_table = project_folder / "2020-03-11-growthcurves.tsv"
-	output_folder = utilities.checkdir(project_folder / "ungrouped2")
-	current_args = [
-		'--output', str(output_folder),
-		'--control', 'RKS',
-		'--timelimit', '2400',
-		# '--plot-growthcurves',
-		'--empirical',
-		'--treatments', "RKS,Lys,Arg,Asp,Fe3+,Ile,Met,Phe,Trp",
-		'--strains', "WT,A244T,N274Y,N455K,P421L,tRNA",
-		str(filename_table)
-	]
-	args = create_parser(current_args)
+def main(args: Optional[List[str]] = None):
+	# Reads the arguments from the command line if `args` isn't given.
+	args = create_parser(args)
+	if args.output is not None:
+		output_folder = utilities.checkdir(args.output)
+	else:
+		output_folder = utilities.checkdir(args.filename.parent / f"{args.filename.stem}.{get_run_label()}")
 
 	validator = ValidateTable()
 	table = validator.check_table(args.filename)
 	analysis_workflow = analysis.GrowthCurveAnalysis(
 		time_limit = args.timelimit,
 		treatments = args.treatments,
-		strains = args.strains
-
+		strains = args.strains,
+		table_format = '.' + args.tableformat,
+		fit_method = args.fitmethod,
+		jobs = args.jobs,
+		fault_tolerant = args.faulttolerant,
+		cache_folder = args.filename.parent / ".cache" / "fits" if args.usecache else None,
+		models = args.models,
+		cutoffs = args.cutoffs,
+		threshold = args.threshold,
+		bootstrap_replicates = args.bootstrap,
+		minimum_growth = validator.minimum_growth if args.screen else None,
+		comparisons = args.comparisons,
+		responses = args.responses.split(',') if args.responses else None,
+		statistics_folder = args.groupstatistics
 	)
 	PAIRWISE = False
 	if PAIRWISE:
@@ -132,7 +245,7 @@ def main():
 			print(treatment_table_columns)
 			treatment_table = table[['time'] + treatment_table_columns]
 			analysis_workflow.run(
-				treatment_table, 'auc_e', utilities.checkdir(project_folder / treatment)
+				treatment_table, 'auc_e', utilities.checkdir(output_folder / treatment)
 			)
 	else:
 		analysis_workflow.run(
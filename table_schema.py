@@ -1,5 +1,6 @@
 """
-	This file is only used as a reminder of how each table in the analysis is formatted
+	This file is mostly used as a reminder of how each table in the analysis is formatted.
+	It also holds the dtypes used when reading these tables back in.
 """
 from typing import Union
 
@@ -12,6 +13,21 @@ class TableSchemaGrowthcurveModel:
 	auc_l:float
 	auc_e:float
 	sigma:float
+	aic:float
+	model:str # The growth model which was selected for the sample. Models other than the logistic model add their own parameter columns (ex. `v`, `lag`).
+	# Growth features calculated from the smoothed growth values rather than the fitted model. See `analysis.features`.
+	lag_time:float
+	mu_max:float
+	doubling_time:float
+	time_to_max:float
+	time_to_threshold:float
+	# Standard errors from the covariance of each fit, and the bootstrap confidence intervals if the bootstrap was run.
+	k_se:float
+	N_se:float
+	r_se:float
+	auc_l_se:float
+	# `[column]_lower` and `[column]_upper` for `k`, `N`, `r`, `auc_l`, and `auc_e`, plus the number of replicates which converged.
+	bootstrap_replicates:int
 
 class TableSchemaAucStatistics(TableSchemaGrowthcurveModel):
 	# This table pairs the metadata for each sample with the fitted logistic curve for that sample.
@@ -22,6 +38,32 @@ class TableSchemaAucStatistics(TableSchemaGrowthcurveModel):
 	replicate: Union[str,int]
 	condition_strain:str # The actual field name is `condition:strain`
 
+# The metadata columns are always read as strings, even if they look like integers (ex. the replicate column).
+DTYPES_AUC_STATISTICS = {
+	'sample':           str,
+	'strain':           str,
+	'condition':        str,
+	'plate':            str,
+	'replicate':        str,
+	'k':                float,
+	'N':                float,
+	'r':                float,
+	'auc_l':            float,
+	'auc_e':            float,
+	'sigma':            float,
+	'aic':              float,
+	'model':            str,
+	'lag_time':         float,
+	'mu_max':           float,
+	'doubling_time':    float,
+	'time_to_max':      float,
+	'time_to_threshold': float,
+	'k_se':             float,
+	'N_se':             float,
+	'r_se':             float,
+	'auc_l_se':         float
+}
+
 class TableSchemaAnova:
 	# Contains the results of the ANOVA analysis
 	df: int
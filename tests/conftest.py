@@ -0,0 +1,20 @@
+from pathlib import Path
+
+import pandas
+import pytest
+
+
+@pytest.fixture
+def workbook(tmp_path) -> Path:
+	""" A small plate reader file with two tables and labels that `Application` can parse."""
+	header = ['Cycle Nr.', 'Time [s]', 'Temp. [°C]', 'A1', 'WT RKS 1', 'WT RKS 2', 'A244T Lys 1']
+	rows = [['Method name', 'TilSGC'] + [None] * 5, [None] * 7]
+	for offset in [0, 600]:
+		rows.append(header)
+		for cycle in range(1, 6):
+			time = offset + 600 * (cycle - 1)
+			rows.append([cycle, time, 30.0, 0.08, 0.1 * cycle, 0.11 * cycle, 0.09 * cycle])
+		rows += [[None] * 7, ['End Time', '22/08/2019'] + [None] * 5, [None] * 7]
+	filename = tmp_path / "TilSGC.Test.190822.xlsx"
+	pandas.DataFrame(rows).to_excel(filename, header = False, index = False)
+	return filename
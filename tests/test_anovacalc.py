@@ -0,0 +1,71 @@
+import numpy
+import pandas
+import pytest
+
+import projectoutput
+import utilities
+from analysis import anovacalc
+
+
+@pytest.fixture
+def statistics_table() -> pandas.DataFrame:
+	""" A small auc statistics table with condition and plate effects."""
+	generator = numpy.random.default_rng(5)
+	rows = list()
+	for plate_index, plate in enumerate(['plate1', 'plate2', 'plate3']):
+		for condition_index, condition in enumerate(['RKS', 'Lys', 'Arg']):
+			for strain in ['WT', 'A244T']:
+				for replicate in range(3):
+					rows.append({
+						'strain':    strain,
+						'condition': condition,
+						'plate':     plate,
+						'replicate': replicate,
+						'auc_e':     1000 + 100 * condition_index + 50 * plate_index + generator.normal(0, 20),
+						'auc_l':     900 + 80 * condition_index + generator.normal(0, 20),
+						'k':         1 + generator.normal(0, 0.1)
+					})
+	return pandas.DataFrame(rows)
+
+
+def test_anova_multiple_matches_anovanested(statistics_table):
+	statistics_table.loc[[2, 7], 'k'] = numpy.nan
+	columns = ['auc_e', 'auc_l', 'k']
+	result = anovacalc.anova_multiple(statistics_table, columns)
+
+	assert list(result.keys()) == columns
+	for column in columns:
+		expected_regression, expected_anova = anovacalc.anovanested(statistics_table, column)
+		regression_table, anova_table = result[column]
+
+		assert list(anova_table.index) == list(expected_anova.index)
+		numpy.testing.assert_allclose(anova_table.values, expected_anova.values, rtol = 1E-6)
+		assert list(regression_table.index) == list(expected_regression.params.index)
+		numpy.testing.assert_allclose(regression_table['coef'].values, expected_regression.params.values, rtol = 1E-6)
+		numpy.testing.assert_allclose(regression_table['std err'].values, expected_regression.bse.values, rtol = 1E-6)
+		numpy.testing.assert_allclose(regression_table['P>|t|'].values, expected_regression.pvalues.values, rtol = 1E-6, atol = 1E-12)
+
+
+def test_anova_sweep(statistics_table):
+	auc_table = pandas.DataFrame({cutoff: statistics_table['auc_e'] * cutoff / 2400 for cutoff in [1200, 2400]})
+	result = anovacalc.anova_sweep(statistics_table, auc_table)
+
+	assert list(result.columns) == ['cutoff', 'term', 'df', 'sum_sq', 'mean_sq', 'F', 'PR(>F)']
+	assert result['cutoff'].tolist() == [1200] * 3 + [2400] * 3
+	_, expected = anovacalc.anovanested(statistics_table, 'auc_e')
+	full = result[result['cutoff'] == 2400]
+	numpy.testing.assert_allclose(full[['df', 'sum_sq', 'mean_sq', 'F', 'PR(>F)']].values, expected.values, rtol = 1E-6)
+	# The F statistics don't change when the response is scaled.
+	half = result[result['cutoff'] == 1200]
+	numpy.testing.assert_allclose(half['F'].dropna().values, full['F'].dropna().values, rtol = 1E-6)
+
+
+@pytest.mark.parametrize("ext", ['.parquet', '.feather', '.tsv'])
+def test_save_anova_keeps_terms(statistics_table, tmp_path, ext):
+	_, anova_table = anovacalc.anovanested(statistics_table, 'auc_e')
+	projectoutput.save_anova(anova_table, tmp_path / f"anova{ext}")
+	result = utilities.read_table(tmp_path / f"anova{ext}")
+
+	# The model terms should be read back as their own column rather than a column named `index`.
+	assert list(result.columns) == ['term'] + list(anova_table.columns)
+	assert result['term'].tolist() == list(anova_table.index)
@@ -0,0 +1,50 @@
+import numpy
+import pandas
+import pytest
+from scipy.optimize import curve_fit
+
+from analysis import bootstrap, equations, growthcurver
+
+
+@pytest.fixture
+def timeseries() -> pandas.DataFrame:
+	generator = numpy.random.default_rng(3)
+	timepoints = numpy.arange(0, 2400, 20)
+	rows = {
+		'WT.RKS.1.1':    equations.logistic_equation(timepoints, 1.5, 0.002, 0.006),
+		'A244T.RKS.1.1': equations.logistic_equation(timepoints, 0.9, 0.004, 0.005)
+	}
+	table = pandas.DataFrame(rows, index = timepoints).T
+	return table + generator.normal(0, 0.01, table.shape)
+
+
+def test_standard_errors_match_curve_fit(timeseries):
+	parameters = growthcurver.summarize_growth(timeseries, method = 'batch')
+	normalized = timeseries.sub(timeseries.min(axis = 1), axis = 0)
+	result = bootstrap.calculate_standard_errors(normalized, parameters)
+
+	for sample_name, row in normalized.iterrows():
+		t = row.index.values.astype(float)
+		p0 = parameters.loc[sample_name, ['k', 'N', 'r']].values.astype(float)
+		fitted, pcov = curve_fit(equations.logistic_equation, t, row.values, p0 = p0)
+		expected = numpy.sqrt(numpy.diag(pcov))
+		assert result.loc[sample_name, ['k_se', 'N_se', 'r_se']].values == pytest.approx(expected, rel = 0.05)
+	assert (result['auc_l_se'] > 0).all()
+
+
+def test_bootstrap_confidence_intervals(timeseries):
+	parameters = growthcurver.summarize_growth(timeseries, method = 'batch')
+	normalized = timeseries.sub(timeseries.min(axis = 1), axis = 0)
+	result = bootstrap.bootstrap_confidence_intervals(normalized, parameters, replicates = 50, batch_size = 20)
+
+	assert (result['bootstrap_replicates'] > 40).all()
+	for column in ['k', 'N', 'r', 'auc_l']:
+		assert (result[f"{column}_lower"] <= parameters[column]).all(), column
+		assert (result[f"{column}_upper"] >= parameters[column]).all(), column
+	# The replicates are built around the fitted curve rather than the observed values, so the empirical AUC is only close to the center.
+	assert (result['auc_e_lower'] < result['auc_e_upper']).all()
+	assert ((result['auc_e_lower'] + result['auc_e_upper']) / 2).values == pytest.approx(parameters['auc_e'].values, rel = 1E-2)
+
+	# The result shouldn't depend on how the samples are split between processes.
+	parallel = bootstrap.bootstrap_confidence_intervals(normalized, parameters, replicates = 50, batch_size = 20, jobs = 2)
+	pandas.testing.assert_frame_equal(result, parallel)
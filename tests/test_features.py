@@ -0,0 +1,41 @@
+import numpy
+import pandas
+import pytest
+
+from analysis import equations, features
+
+
+@pytest.fixture
+def table() -> pandas.DataFrame:
+	t = numpy.arange(0, 2400, 10)
+	rows = {
+		'logistic': equations.logistic_equation(t, 1.5, 0.002, 0.004),
+		'lag':      equations.baranyi_equation(t, 1.5, 0.002, 0.01, 600),
+		'flat':     numpy.full(len(t), 0.05)
+	}
+	return pandas.DataFrame(rows, index = t).T
+
+
+def test_smooth():
+	values = numpy.array([[1.0, 2.0, numpy.nan, 4.0, 5.0]])
+	result = features.smooth(values, 3)
+	assert result[0] == pytest.approx([1.5, 1.5, 3.0, 4.5, 4.5])
+	assert features.smooth(values, 1) is values
+
+
+def test_calculate_growth_features(table):
+	result = features.calculate_growth_features(table, threshold = 0.5, window = 1)
+
+	assert list(result.columns) == features.FEATURE_COLUMNS
+	# The specific growth rate of a logistic curve is r*(1 - y/k), so it's highest at the start of the curve.
+	assert result.loc['logistic', 'mu_max'] == pytest.approx(0.004, rel = 0.1)
+	assert result.loc['logistic', 'doubling_time'] == pytest.approx(numpy.log(2) / result.loc['logistic', 'mu_max'])
+	assert result.loc['logistic', 'lag_time'] == pytest.approx(0, abs = 50)
+	assert result.loc['lag', 'lag_time'] == pytest.approx(600, rel = 0.1)
+	assert result.loc['lag', 'time_to_max'] == 2390
+
+	A = (1.5 - 0.002) / 0.002
+	expected_time_to_threshold = numpy.log(A * 0.5 / (1.5 - 0.5)) / 0.004
+	assert result.loc['logistic', 'time_to_threshold'] == pytest.approx(expected_time_to_threshold, rel = 1E-2)
+
+	assert result.loc['flat', ['lag_time', 'mu_max', 'doubling_time', 'time_to_threshold']].isna().all()
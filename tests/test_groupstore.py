@@ -0,0 +1,68 @@
+import numpy
+import pandas
+import pytest
+
+from analysis import anovacalc, tukey
+from analysis.groupstore import GroupStatisticsStore
+
+
+@pytest.fixture
+def statistics_table() -> pandas.DataFrame:
+	""" A small auc statistics table with condition and plate effects, indexed by sample."""
+	generator = numpy.random.default_rng(7)
+	rows = list()
+	for plate_index, plate in enumerate(['plate1', 'plate2', 'plate3']):
+		for condition_index, condition in enumerate(['RKS', 'Lys', 'Arg']):
+			for strain_index, strain in enumerate(['WT', 'A244T', 'N274Y']):
+				for replicate in range(3):
+					rows.append({
+						'sample':    f"{strain}.{condition}.{plate}.{replicate}",
+						'strain':    strain,
+						'condition': condition,
+						'plate':     plate,
+						'auc_e':     50000 + 1000 * condition_index + 500 * plate_index + 300 * strain_index + generator.normal(0, 200)
+					})
+	return pandas.DataFrame(rows).set_index('sample')
+
+
+def test_incremental_update(statistics_table, tmp_path):
+	store = GroupStatisticsStore(tmp_path, 'auc_e')
+	store.update(statistics_table[statistics_table['plate'] != 'plate3'])
+	store.save()
+
+	store = GroupStatisticsStore(tmp_path, 'auc_e')
+	# Samples which were already added are skipped.
+	store.update(statistics_table)
+
+	for subject in ['strain', 'condition', 'plate']:
+		expected = tukey.group_statistics(statistics_table['auc_e'], statistics_table[subject])
+		result = store.group_statistics(subject)
+		assert list(result.index) == list(expected.index)
+		numpy.testing.assert_allclose(result.values.astype(float), expected.values.astype(float), rtol = 1E-9)
+	assert len(store.table) == 27
+
+
+def test_anova(statistics_table, tmp_path):
+	store = GroupStatisticsStore(tmp_path, 'auc_e')
+	store.update(statistics_table)
+	regression_table, anova_table = store.anova()
+	expected_regression, expected_anova = anovacalc.anovanested(statistics_table, 'auc_e')
+
+	assert list(anova_table.index) == list(expected_anova.index)
+	numpy.testing.assert_allclose(anova_table.values.astype(float), expected_anova.values, rtol = 1E-6)
+	assert list(regression_table.index) == list(expected_regression.params.index)
+	numpy.testing.assert_allclose(regression_table['coef'].values, expected_regression.params.values, rtol = 1E-6)
+	numpy.testing.assert_allclose(regression_table['std err'].values, expected_regression.bse.values, rtol = 1E-6)
+
+
+@pytest.mark.parametrize("controls", [None, {'condition': 'RKS', 'strain': 'WT'}])
+def test_tukey_table(statistics_table, tmp_path, controls):
+	store = GroupStatisticsStore(tmp_path, 'auc_e')
+	store.update(statistics_table)
+	result = store.tukey_table(controls = controls)
+	expected = anovacalc.tukey_table(statistics_table, 'auc_e', controls = controls)
+
+	assert list(result.columns) == list(expected.columns)
+	assert result[['name', 'group1', 'group2']].values.tolist() == expected[['name', 'group1', 'group2']].values.tolist()
+	numpy.testing.assert_allclose(result['meandiff'].values, expected['meandiff'].values, rtol = 1E-9)
+	numpy.testing.assert_allclose(result['p-adj'].values, expected['p-adj'].values, rtol = 1E-6)
@@ -0,0 +1,342 @@
+import numpy
+import pandas
+import pytest
+from scipy.integrate import trapz
+
+from analysis import batchfit, equations, growthcurver, models
+from analysis.fitcache import FitCache
+
+
+@pytest.fixture
+def timeseries() -> pandas.DataFrame:
+	""" Logistic growth curves with a small amount of noise. Each row is a sample and each column is a timepoint."""
+	generator = numpy.random.default_rng(1)
+	timepoints = numpy.arange(0, 2400, 10)
+	parameters = {
+		'WT.RKS.1.1':    (1.5, 0.002, 0.004),
+		'WT.RKS.1.2':    (1.2, 0.004, 0.006),
+		'A244T.RKS.1.1': (0.8, 0.001, 0.003),
+		'A244T.Lys.1.1': (1.9, 0.003, 0.005)
+	}
+	rows = dict()
+	for sample, (k, N, r) in parameters.items():
+		values = equations.logistic_equation(timepoints, k, N, r)
+		rows[sample] = values + generator.normal(0, 0.005, len(timepoints))
+	return pandas.DataFrame(rows, index = timepoints).T
+
+
+def test_levenberg_marquardt_recovers_parameters():
+	t = numpy.linspace(0, 2000, 100)
+	expected = numpy.array([[1.5, 0.002, 0.004], [0.9, 0.01, 0.007]])
+	y = batchfit.evaluate(equations.logistic_equation, t, expected)
+
+	parameters, converged, iterations, messages = batchfit.levenberg_marquardt(equations.logistic_equation, t, y, [1, .001, .004])
+
+	assert converged.all()
+	assert numpy.allclose(parameters, expected, rtol = 1E-4)
+
+
+def test_levenberg_marquardt_lower_bounds():
+	# After subtracting the minimum, the baranyi fit can keep improving by moving the lag further below 0.
+	model = models.get_model('baranyi')
+	t = numpy.linspace(0, 2400, 2401)
+	values = model.function(t, 1.5, 0.002, 0.005, 200)
+	values = values - values.min()
+	p0 = model.estimate(t, values[numpy.newaxis])
+
+	parameters, converged, iterations, messages = batchfit.levenberg_marquardt(
+		model.function, t, values[numpy.newaxis], p0, jacobian = model.jacobian, lower_bounds = model.lower_bounds
+	)
+
+	assert converged[0]
+	assert (parameters[0] >= model.lower_bounds).all()
+	assert numpy.abs(model.function(t, *parameters[0]) - values).max() < 0.01
+
+
+def test_batch_fit_failure_messages(timeseries):
+	table = timeseries.copy()
+	# Too few observations to fit three parameters.
+	table.iloc[1, 2:] = numpy.nan
+
+	result = growthcurver.fit_batch(table, 'logistic')
+	assert result.loc[table.index[1], 'status'] == 'failed'
+	assert result.loc[table.index[1], 'iterations'] == 0
+	assert result.loc[table.index[1], 'message'] == "Only 2 observations for 3 parameters."
+	# The parameters of a failed fit shouldn't be reported even when the fit isn't fault tolerant.
+	assert result.loc[table.index[1], ['k', 'N', 'r']].isna().all()
+	assert result.drop(table.index[1])['converged'].all()
+
+	_, converged, iterations, messages = batchfit.levenberg_marquardt(
+		equations.logistic_equation, timeseries.columns.values.astype(float), timeseries.values, [1, .001, .004], max_iterations = 2
+	)
+	assert (~converged).any()
+	assert messages[~converged].tolist() == ["Did not converge after 2 iterations."] * (~converged).sum()
+
+
+def test_batch_fit_matches_scipy(timeseries):
+	expected = growthcurver.summarize_growth(timeseries, method = 'scipy')
+	result = growthcurver.summarize_growth(timeseries, method = 'batch')
+
+	assert result['converged'].all()
+	for column in ['k', 'N', 'r', 'auc_l', 'auc_e', 'sigma']:
+		assert numpy.allclose(result[column], expected[column], rtol = 1E-3), column
+
+
+def test_parallel_fit_matches_serial(timeseries):
+	expected = growthcurver.summarize_growth(timeseries, method = 'scipy', jobs = 1)
+	result = growthcurver.summarize_growth(timeseries, method = 'scipy', jobs = 2)
+
+	pandas.testing.assert_frame_equal(result, expected)
+
+
+def test_logistic_equation_jacobian():
+	t = numpy.linspace(0, 2000, 50)
+	parameters = numpy.array([1.5, 0.002, 0.004])
+	expected = batchfit.numerical_jacobian(equations.logistic_equation, t, parameters[numpy.newaxis])[0]
+	result = equations.logistic_equation_jacobian(t, *parameters)
+
+	assert result.shape == (len(t), 3)
+	assert numpy.allclose(result, expected, rtol = 1E-4, atol = 1E-6)
+
+
+def test_estimate_logistic_parameters():
+	t = numpy.arange(0, 2400, 10)
+	y = equations.logistic_equation(t, 1.5, 0.002, 0.004)
+
+	k, N, r = equations.estimate_logistic_parameters(t, y)
+
+	assert k == pytest.approx(1.5, rel = 1E-2)
+	assert N == pytest.approx(0.002, rel = 1E-2)
+	assert r == pytest.approx(0.004, rel = 0.1)
+
+
+@pytest.mark.parametrize("estimate_guess, analytic_jacobian", [(True, True), (False, False)])
+def test_initial_guess_and_jacobian_options(timeseries, estimate_guess, analytic_jacobian):
+	expected = growthcurver.summarize_growth(timeseries, estimate_guess = False, analytic_jacobian = False)
+	result = growthcurver.summarize_growth(timeseries, estimate_guess = estimate_guess, analytic_jacobian = analytic_jacobian)
+
+	for column in ['k', 'N', 'r']:
+		assert numpy.allclose(result[column], expected[column], rtol = 1E-3), column
+
+
+def test_calculate_fit_statistics_matches_single_sample(timeseries):
+	normalized_table = timeseries.sub(timeseries.min(axis = 1), axis = 0)
+	normalized_table.iloc[0, 5] = numpy.nan
+	parameters = pandas.DataFrame(
+		[equations.estimate_logistic_parameters(normalized_table.columns.values, row.values) for _, row in normalized_table.iterrows()],
+		columns = ['k', 'N', 'r'], index = normalized_table.index
+	)
+	result = growthcurver.calculate_fit_statistics(normalized_table, parameters)
+
+	for sample_name, sample_data in normalized_table.iterrows():
+		k, N, r = parameters.loc[sample_name]
+		expected_sigma = growthcurver.calculate_goodness_of_fit(sample_data, k, N, r)
+		expected_auc_l = growthcurver.calculate_area_under_curve_ideal(max(sample_data.index), k, N, r)
+		assert result.loc[sample_name, 'sigma'] == pytest.approx(expected_sigma)
+		assert result.loc[sample_name, 'auc_l'] == pytest.approx(expected_auc_l)
+	assert result['auc_e'].iloc[1:].tolist() == pytest.approx([growthcurver.calculate_area_under_curve_empirical(row) for _, row in normalized_table.iloc[1:].iterrows()])
+
+
+@pytest.mark.parametrize("method", ['scipy', 'batch'])
+def test_fault_tolerant_fit(timeseries, method):
+	timeseries.loc['WT.RKS.1.3'] = numpy.nan
+	with pytest.raises(Exception):
+		growthcurver.summarize_growth(timeseries, method = 'scipy')
+
+	result = growthcurver.summarize_growth(timeseries, method = method, fault_tolerant = True)
+
+	assert result.loc['WT.RKS.1.3', 'status'] == 'failed'
+	assert not result.loc['WT.RKS.1.3', 'converged']
+	assert numpy.isnan(result.loc['WT.RKS.1.3', 'k'])
+	assert (result.drop('WT.RKS.1.3')['status'] != 'failed').all()
+	assert list(growthcurver.get_failure_report(result).index) == ['WT.RKS.1.3']
+
+
+def test_fit_cache(timeseries, tmp_path):
+	cache = FitCache(tmp_path / "cache")
+	expected = growthcurver.summarize_growth(timeseries, method = 'batch', cache = cache)
+	assert len(cache.table) == len(timeseries)
+
+	# Only the modified sample should be refit.
+	modified = timeseries.copy()
+	modified.loc['WT.RKS.1.1'] *= 1.1
+	cache = FitCache(tmp_path / "cache")
+	result = growthcurver.summarize_growth(modified, method = 'batch', cache = cache)
+	assert len(cache.table) == len(timeseries) + 1
+	pandas.testing.assert_frame_equal(result.drop('WT.RKS.1.1'), expected.drop('WT.RKS.1.1'))
+	assert result.loc['WT.RKS.1.1', 'k'] == pytest.approx(1.1 * expected.loc['WT.RKS.1.1', 'k'], rel = 1E-2)
+
+	# Changing the fit settings should not reuse the cached fits.
+	growthcurver.summarize_growth(timeseries, method = 'scipy', cache = cache)
+	assert len(cache.table) == 2 * len(timeseries) + 1
+
+
+def test_fit_cache_eviction(timeseries, tmp_path):
+	cache = FitCache(tmp_path / "cache", maximum_size = 2)
+	keys = cache.get_keys(timeseries, {})
+	cache.put(keys.iloc[:3], pandas.DataFrame({'k': [1.0, 2.0, 3.0]}, index = keys.index[:3]))
+	# Using the first fit again means the second fit is the least recently used.
+	cache.table.loc[keys.iloc[1], cache.time_column] -= 20
+	cache.table.loc[keys.iloc[2], cache.time_column] -= 10
+	cache.get(keys.iloc[:1])
+	cache.save()
+
+	cache = FitCache(tmp_path / "cache", maximum_size = 2)
+	assert list(cache.get(keys)['k']) == [1.0, 3.0]
+
+
+@pytest.mark.parametrize("name, parameters", [
+	('logistic', [1.5, 0.002, 0.004]),
+	('gompertz', [1.5, 0.002, 0.0008]),
+	('richards', [1.5, 0.002, 0.004, 0.6]),
+	('baranyi', [1.5, 0.002, 0.005, 200])
+])
+def test_growth_models(name, parameters):
+	model = models.get_model(name)
+	t = numpy.linspace(0, 2400, 2401)
+	parameters = numpy.array(parameters)
+	values = model.function(t, *parameters)
+	assert values[0] == pytest.approx(parameters[1])
+
+	expected_jacobian = batchfit.numerical_jacobian(model.function, t, parameters[numpy.newaxis])[0]
+	assert numpy.allclose(model.jacobian(t, *parameters), expected_jacobian, rtol = 1E-3, atol = 1E-4)
+
+	expected_area = trapz(values, t)
+	assert model.area_under_curve(t.max(), *parameters) == pytest.approx(expected_area, rel = 1E-5)
+
+	# The generating parameters can be recovered from the raw values.
+	p0 = model.estimate(t, values[numpy.newaxis])
+	fitted, converged, _, _ = batchfit.levenberg_marquardt(model.function, t, values[numpy.newaxis], p0, jacobian = model.jacobian)
+	assert converged[0]
+	assert numpy.allclose(fitted[0], parameters, rtol = 1E-2)
+
+	# `fit_batch` fits the values after subtracting the minimum, so compare the fitted curve to the normalized values instead.
+	normalized = values - values.min()
+	fit = growthcurver.fit_batch(pandas.DataFrame([values], columns = t), name)
+	assert fit['status'].iloc[0] == 'converged'
+	assert model.within_bounds(fit[model.parameters].values[0])
+	fitted_values = model.function(t, *fit[model.parameters].values[0])
+	assert numpy.abs(fitted_values - normalized).max() < 0.01 * parameters[0]
+
+
+def test_select_model_by_aic():
+	t = numpy.arange(0, 2400, 10)
+	generator = numpy.random.default_rng(2)
+	noise = generator.normal(0, 0.002, (2, len(t)))
+	table = pandas.DataFrame(
+		[equations.logistic_equation(t, 1.5, 0.002, 0.004), equations.gompertz_equation(t, 1.5, 0.002, 0.0025)] + noise,
+		index = ['logistic', 'gompertz'], columns = t
+	)
+
+	result = growthcurver.summarize_growth(table, method = 'batch', models = ['logistic', 'gompertz', 'baranyi'])
+
+	assert list(result.columns) == growthcurver.get_output_columns(['logistic', 'gompertz', 'baranyi'])
+	assert result.loc['gompertz', 'model'] == 'gompertz'
+	# The curves are fit after subtracting the minimum value, which is about N.
+	assert result.loc['gompertz', 'k'] == pytest.approx(1.5 - 0.002, rel = 1E-2)
+	assert (result['lag'].dropna() >= 0).all()
+	assert numpy.isnan(result.loc['gompertz', 'lag'])
+	# The baranyi model reduces to the logistic curve when there's no lag, so it could be picked for the logistic sample as well.
+	assert result.loc['logistic', 'model'] in {'logistic', 'baranyi'}
+
+
+def test_logistic_integral_does_not_overflow():
+	t = numpy.array([0, 10, 100, 2400, 50000])
+	k, N, r = 1.5, 0.002, 0.05
+	values, integral = equations.logistic_equation_and_integral(t, k, N, r)
+
+	assert numpy.isfinite(integral).all()
+	assert numpy.allclose(values, equations.logistic_equation(t, k, N, r))
+	assert numpy.allclose(integral, equations.logistic_equation_integral(t, k, N, r))
+	# Long after the plateau the curve is just `k`.
+	assert integral[-1] - integral[-2] == pytest.approx(k * (t[-1] - t[-2]))
+
+	A = (k - N) / N
+	assert values[:3] == pytest.approx(k / (1 + A * numpy.exp(-r * t[:3])))
+	assert integral[:3] == pytest.approx(k * numpy.log(A + numpy.exp(r * t[:3])) / r)
+
+
+def test_logistic_equation_broadcasts():
+	t = numpy.linspace(0, 2400, 25)
+	parameters = numpy.array([[1.5, 0.002, 0.004], [0.8, 0.01, 0.05]])
+	values, integral = equations.logistic_equation_and_integral(t, *(parameters[:, [i]] for i in range(3)))
+
+	assert values.shape == integral.shape == (2, len(t))
+	for row, (k, N, r) in enumerate(parameters):
+		assert values[row] == pytest.approx(equations.logistic_equation(t, k, N, r))
+		assert growthcurver.calculate_area_under_curve_ideal(t[-1], k, N, r) == pytest.approx(integral[row, -1] - integral[row, 0])
+
+
+def test_cumulative_auc_matches_time_limit(timeseries):
+	timeseries = timeseries + 0.05
+	timeseries.iloc[1, 3] = 0.01
+	cutoffs = [0, 5, 500, 1205, 2390, 5000]
+	result = growthcurver.calculate_cumulative_auc(timeseries, cutoffs)
+
+	assert result.shape == (len(timeseries), len(cutoffs))
+	for cutoff in cutoffs[1:]:
+		truncated = timeseries[[i for i in timeseries.columns if i <= cutoff]]
+		normalized = truncated.sub(truncated.min(axis = 1), axis = 0)
+		expected = trapz(normalized.values, normalized.columns.values, axis = 1)
+		assert result[cutoff].values == pytest.approx(expected), cutoff
+	assert (result[0] == 0).all()
+
+
+def test_cumulative_auc_ideal(timeseries):
+	parameters = growthcurver.summarize_growth(timeseries, method = 'batch')
+	cutoffs = numpy.array([0, 100, 1000, 2400])
+	result = growthcurver.calculate_cumulative_auc_ideal(parameters, cutoffs)
+
+	for sample_name, row in parameters.iterrows():
+		expected = [growthcurver.calculate_area_under_curve_ideal(cutoff, row['k'], row['N'], row['r']) for cutoff in cutoffs]
+		assert result.loc[sample_name].values == pytest.approx(expected)
+
+
+def test_fast_estimate(timeseries):
+	timeseries.loc['WT.RKS.1.3'] = 0.05
+	expected = growthcurver.summarize_growth(timeseries.drop('WT.RKS.1.3'), method = 'batch')
+	result = growthcurver.summarize_growth(timeseries, method = 'fast')
+
+	assert list(result.columns) == list(expected.columns)
+	assert result.loc['WT.RKS.1.3', 'status'] == 'failed'
+	# This sample reaches the plateau well before the last timepoint.
+	for column in ['k', 'r']:
+		assert result.loc['WT.RKS.1.2', column] == pytest.approx(expected.loc['WT.RKS.1.2', column], rel = 0.15), column
+	assert result.loc['WT.RKS.1.2', 'auc_e'] == pytest.approx(expected.loc['WT.RKS.1.2', 'auc_e'])
+
+	with pytest.raises(ValueError):
+		growthcurver.summarize_growth(timeseries, method = 'fast', models = ['gompertz'])
+
+
+@pytest.mark.parametrize("method", ['scipy', 'batch'])
+def test_screen_samples(timeseries, method):
+	timepoints = timeseries.columns.values.astype(float)
+	timeseries.loc['WT.RKS.1.3'] = 0.05
+	timeseries.loc['WT.RKS.1.4'] = 1.2 - 0.2 * timepoints / timepoints.max()
+	categories = growthcurver.screen_samples(timeseries)
+	assert categories.to_dict() == {
+		'WT.RKS.1.1':    'normal',
+		'WT.RKS.1.2':    'normal',
+		'A244T.RKS.1.1': 'normal',
+		'A244T.Lys.1.1': 'normal',
+		'WT.RKS.1.3':    'no-growth',
+		'WT.RKS.1.4':    'saturated'
+	}
+
+	expected = growthcurver.summarize_growth(timeseries.iloc[:4], method = method)
+	result = growthcurver.summarize_growth(timeseries, method = method, minimum_growth = 0.1)
+	assert list(result.index) == list(timeseries.index)
+	assert list(result.columns) == list(expected.columns)
+	pandas.testing.assert_frame_equal(result.iloc[:4].astype(expected.dtypes), expected)
+
+	assert result.loc['WT.RKS.1.3', 'status'] == 'no-growth'
+	assert result.loc['WT.RKS.1.3', 'r'] == 0
+	assert result.loc['WT.RKS.1.3', 'k'] == pytest.approx(0)
+	assert result.loc['WT.RKS.1.4', 'status'] == 'saturated'
+	assert numpy.isnan(result.loc['WT.RKS.1.4', 'r'])
+	assert result.loc['WT.RKS.1.4', 'k'] == pytest.approx(0.1)
+	assert result.loc['WT.RKS.1.4', 'auc_l'] == pytest.approx(0.1 * timepoints.max())
+	assert result.loc['WT.RKS.1.4', 'auc_e'] == pytest.approx(trapz(0.2 - 0.2 * timepoints / timepoints.max(), timepoints))
+	assert (result.loc[['WT.RKS.1.3', 'WT.RKS.1.4'], 'iterations'] == 0).all()
+	# The screened samples weren't fit, so they didn't fail either.
+	assert growthcurver.get_failure_report(result).empty
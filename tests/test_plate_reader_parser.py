@@ -4,7 +4,9 @@ from typing import List
 import pandas
 import pytest
 
-from platereader import plateparser
+from miscscripts import describe_source_table
+from platereader import plateparser, platereaderparser
+from platereader.tablecache import TableCache
 
 
 @pytest.fixture
@@ -18,8 +20,13 @@ def plate() -> plateparser.PlateReaderParser:
 
 
 @pytest.fixture
-def subtables(filename, plate) -> List[pandas.DataFrame]:
-	return plate._extract_tables(filename, [52, 219])
+def sheet(filename, plate) -> pandas.DataFrame:
+	return plate._load_sheet(filename)
+
+
+@pytest.fixture
+def subtables(sheet, plate) -> List[pandas.DataFrame]:
+	return plate._extract_tables(sheet, [(53, 198), (220, 365)])
 
 
 DATA_FOLDER = Path(__file__).parent / "data"
@@ -32,29 +39,44 @@ def test_get_table_indicies(filename, plate):
 	assert result == expected
 
 
-def test_remove_blank_lines(filename, plate):
-	indicies = [52, 219]
+def test_get_table_indicies_from_sheet(sheet, plate):
+	# The raw grid keeps the first row of the file, so every index is shifted by one.
+	expected = [53, 220]
+	result = plate._get_table_indicies(sheet)
+	assert result == expected
+
+
+def test_get_table_blocks(filename, sheet, plate):
 	expected_index = list(range(1, 145))
 
-	first_table = pandas.read_excel(filename, skiprows = indicies[0] + 1)
+	first_table = pandas.read_excel(filename, skiprows = 53)
 	# Make sure the first table still has blank lines
 	assert first_table[plate.header_value].tolist() != expected_index
 
-	nonblank_table = plate._remove_blank_lines(first_table)
-
-	assert nonblank_table[plate.header_value].astype(int).tolist() == expected_index
+	# Each table ends at the first blank line after its header row.
+	assert plate._get_table_blocks(sheet) == [(53, 198), (220, 365)]
 
 
-def test_extract_tables(filename, plate):
-	table = pandas.read_excel(filename)
-	indicies = plate._get_table_indicies(table)
+def test_extract_tables(sheet, plate):
+	blocks = plate._get_table_blocks(sheet)
 
-	tables = plate._extract_tables(filename, indicies)
+	tables = plate._extract_tables(sheet, blocks)
 
 	assert len(tables) == 2
 
 	assert tables[0][plate.header_value].astype(int).tolist() == list(range(1, 145))
 	assert tables[1][plate.header_value].astype(int).tolist() == list(range(1, 145))
+	assert tables[0].columns[:3].tolist() == [plate.header_value, plate.time_column_name_original, 'Temp. [°C]']
+
+
+def test_extract_tables_matches_skiprows(filename, sheet, plate):
+	# Slicing the single grid should give the same values as re-reading the workbook at each header row.
+	tables = plate._extract_tables(sheet, plate._get_table_blocks(sheet))
+	for table, start_index in zip(tables, [52, 219]):
+		expected = pandas.read_excel(filename, skiprows = start_index + 1)[plate.time_column_name_original]
+		# Only keep the rows before the first blank line.
+		expected = expected[~expected.isna().cummax()]
+		assert table[plate.time_column_name_original].tolist() == expected.tolist()
 
 
 def test_clean_subtable(subtables, plate):
@@ -71,12 +93,117 @@ def test_clean_subtable(subtables, plate):
 	assert clean_subtable_second[plate.time_column_name_original].values[0] == plate.time_offset
 
 
-def test_combine_tables(filename, plate):
-	garbage_table = pandas.read_excel(filename)
-	table_indicies_start = plate._get_table_indicies(garbage_table)
-	table_list = plate._extract_tables(filename, table_indicies_start)
+def test_combine_tables(sheet, plate):
+	table_blocks = plate._get_table_blocks(sheet)
+	table_list = plate._extract_tables(sheet, table_blocks)
 
 	combined_table = plate._combine_tables(table_list)
 
 def test_scan_for_typos(filename, plate):
-	pass
\ No newline at end of file
+	pass
+
+def test_parse_tables_in_parallel(workbook, tmp_path):
+	application = plateparser.Application()
+	missing_filename = tmp_path / "missing.xlsx"
+	tables = [workbook, missing_filename, workbook]
+
+	serial = application.parse_tables(tables, jobs = 1)
+	parallel = application.parse_tables(tables, jobs = 2)
+
+	assert list(application.errors.keys()) == [missing_filename]
+	assert len(serial) == len(parallel) == 2
+	for left, right in zip(serial, parallel):
+		pandas.testing.assert_frame_equal(left, right)
+	# The plates should be numbered by their position in the input list, even when one of the tables fails.
+	assert all(i.split('.')[2] == '1' for i in parallel[0].columns if i != 'time')
+	assert all(i.split('.')[2] == '3' for i in parallel[1].columns if i != 'time')
+
+
+def test_parse_tables_with_cache(workbook, tmp_path):
+	application = plateparser.Application()
+	cache = TableCache(tmp_path / "cache")
+
+	expected = application.parse_tables([workbook], cache = cache)
+	assert len(list(cache.folder.iterdir())) == 1
+
+	result = application.parse_tables([workbook], cache = cache)
+	pandas.testing.assert_frame_equal(result[0], expected[0], check_dtype = False)
+
+	# Changing the parser settings should not reuse the cached table.
+	application.parser.time_offset = 0
+	application.parse_tables([workbook], cache = cache)
+	assert len(list(cache.folder.iterdir())) == 2
+
+
+def test_table_cache_eviction(tmp_path):
+	cache = TableCache(tmp_path / "cache", maximum_size = 0)
+	table = pandas.DataFrame({'time': [0, 10, 20], 'WT.rks.1.1': [0.1, 0.2, 0.3]})
+	cache.put('key', table)
+	assert cache.get('key') is None
+
+
+def test_append_tables(workbook, tmp_path, monkeypatch):
+	application = plateparser.Application()
+	table_filename = tmp_path / "project.tsv"
+	existing_table = application.combine_tables(application.parse_tables([workbook]))
+	existing_table.to_csv(table_filename, sep = "\t", index = False)
+
+	result = application.append(table_filename, [workbook], use_cache = False)
+	new_table = application.combine_tables(application.parse_tables([workbook], starting_plate = 1))
+
+	assert list(result.columns) == list(existing_table.columns) + [i for i in new_table.columns if i != 'time']
+	assert result['time'].tolist() == sorted(existing_table['time'].tolist())
+	# The existing plate is kept as it was and the new plate is numbered after it.
+	assert all(i.split('.')[2] == '2' for i in new_table.columns if i != 'time')
+	pandas.testing.assert_frame_equal(result[existing_table.columns], existing_table, check_dtype = False)
+	pandas.testing.assert_frame_equal(result[new_table.columns], new_table, check_dtype = False)
+	# The same workbook was added twice, so every sample in the new plate duplicates one in the existing plate.
+	report = plateparser.find_duplicate_columns(result)
+	assert report['group'].nunique() == len(new_table.columns) - 1
+
+	# Labels which are already in the table shouldn't be overwritten.
+	monkeypatch.setattr(application, 'parse_tables', lambda tables, **kwargs: plateparser.Application().parse_tables(tables))
+	with pytest.raises(ValueError):
+		application.append(table_filename, [workbook], output_filename = tmp_path / "collision.tsv", use_cache = False)
+	assert not (tmp_path / "collision.tsv").exists()
+
+
+def test_find_duplicate_columns():
+	table = pandas.DataFrame({
+		'time':        [0, 10, 20, 30],
+		'WT.RKS.1.1':  [0.1, 0.2, 0.4, 0.8],
+		'WT.RKS.1.2':  [0.1, 0.2, 0.4, 0.8],
+		'WT.Lys.1.1':  [0.1, 0.2, 0.4, 0.8 + 1E-12],
+		'WT.Lys.1.2':  [0.1, 0.3, 0.3, 0.8],  # Same sum, different values.
+		'WT.Met.1.1':  [0.1, 0.2, None, 0.8],
+		'WT.Met.1.2':  [0.1, 0.2, None, 0.8],
+		'A244T.RKS.1.1': [0, 0, 0, 0],
+		'A244T.RKS.1.2': [0, 0, 0, 0]
+	})
+	report = plateparser.find_duplicate_columns(table)
+
+	groups = sorted(sorted(group['column'].tolist()) for _, group in report.groupby('group'))
+	expected = [
+		['A244T.RKS.1.1', 'A244T.RKS.1.2'],
+		['WT.Lys.1.1', 'WT.RKS.1.1', 'WT.RKS.1.2']
+	]
+	assert groups == expected
+
+	assert plateparser.find_duplicate_columns(table[['time', 'WT.Lys.1.2']]).empty
+
+
+def test_find_table_blocks():
+	table = pandas.DataFrame({
+		'first': ['Method name', 'Cycle Nr.: 144', ' Cycle Nr.\xa0 ', 1, 2, 3, None, 'End Time', 'Cycle Nr.', 1, 2],
+		'time':  [None, None, 'Time [s]', 0, 600, None, None, None, 'Time [s]', 0, 600]
+	})
+	# Only cells which are exactly the header value (ignoring whitespace) are header rows.
+	assert platereaderparser.find_table_blocks(table) == [(2, 6), (8, 11)]
+	# A table also ends at the first row without a timepoint.
+	assert platereaderparser.find_table_blocks(table, time_column_name = 'Time [s]') == [(2, 5), (8, 11)]
+
+
+def test_describe_source_table_header_row(workbook, filename):
+	# The header row is the first `Cycle Nr.` row of the whole sheet, not of the first column.
+	assert describe_source_table.get_header_row(pandas.read_excel(workbook, header = None)) == 2
+	assert describe_source_table.get_header_row(pandas.read_excel(filename, header = None)) == 53
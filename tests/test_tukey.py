@@ -0,0 +1,91 @@
+import numpy
+import pandas
+import pytest
+from statsmodels.stats.multicomp import MultiComparison
+
+from analysis import tukey
+
+
+@pytest.fixture
+def groups() -> pandas.DataFrame:
+	""" Unbalanced groups with different means."""
+	generator = numpy.random.default_rng(3)
+	rows = list()
+	for group, mean, count in [('A', 10, 8), ('B', 11, 6), ('C', 14, 7), ('D', 10.5, 5)]:
+		for value in generator.normal(mean, 1.5, count):
+			rows.append({'group': group, 'value': value})
+	return pandas.DataFrame(rows)
+
+
+def test_group_statistics(groups):
+	result = tukey.group_statistics(groups['value'], groups['group'])
+	expected = groups.groupby('group')['value']
+
+	assert list(result.index) == ['A', 'B', 'C', 'D']
+	assert result['count'].tolist() == expected.count().tolist()
+	assert result['mean'].values == pytest.approx(expected.mean().values)
+	assert result['sum_of_squares'].values == pytest.approx((expected.var() * (expected.count() - 1)).values)
+
+
+def test_tukey_hsd_matches_statsmodels(groups):
+	expected = MultiComparison(groups['value'], groups['group']).tukeyhsd()
+	result = tukey.tukey_hsd(groups['value'], groups['group'])
+
+	assert list(result.columns) == tukey.TUKEY_COLUMNS
+	assert list(zip(result['group1'], result['group2'])) == [('A', 'B'), ('A', 'C'), ('A', 'D'), ('B', 'C'), ('B', 'D'), ('C', 'D')]
+	assert result['meandiff'].values == pytest.approx(expected.meandiffs)
+	assert result['lower'].values == pytest.approx(expected.confint[:, 0], rel = 1E-3)
+	assert result['upper'].values == pytest.approx(expected.confint[:, 1], rel = 1E-3)
+	assert result['reject'].tolist() == list(expected.reject)
+	assert result['p-adj'].values == pytest.approx(expected.pvalues, abs = 1E-6)
+
+
+def test_tukey_hsd_ignores_missing_values(groups):
+	expected = tukey.tukey_hsd(groups['value'], groups['group'])
+	groups.loc[len(groups)] = {'group': 'A', 'value': numpy.nan}
+	result = tukey.tukey_hsd(groups['value'], groups['group'])
+
+	pandas.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("k, df", [(3, 10), (9, 200), (54, 583)])
+def test_studentized_range_lookup(k, df):
+	stats = pytest.importorskip('scipy.stats')
+	if not hasattr(stats, 'studentized_range'):
+		pytest.skip("This version of scipy doesn't have the studentized range distribution.")
+	q = numpy.array([0.5, 1.5, 3.0, 4.5, 6.0, 8.0])
+	expected = stats.studentized_range.sf(q, k, df)
+	result = tukey.studentized_range_sf(q, k, df)
+	is_tabulated = expected > tukey.MINIMUM_PVALUE
+	assert result[is_tabulated] == pytest.approx(expected[is_tabulated], rel = 1E-3)
+	assert (result[~is_tabulated] == tukey.MINIMUM_PVALUE).all()
+
+	for alpha in [0.05, 0.01]:
+		assert tukey.studentized_range_quantile(1 - alpha, k, df) == pytest.approx(stats.studentized_range.ppf(1 - alpha, k, df), rel = 1E-4)
+	assert tukey._get_lookup.cache_info().currsize > 0
+
+
+def test_dunnett(groups):
+	result = tukey.dunnett(groups['value'], groups['group'], 'A')
+	means = groups.groupby('group')['value'].mean()
+
+	assert list(result.columns) == tukey.DUNNETT_COLUMNS
+	assert list(zip(result['group1'], result['group2'])) == [('A', 'B'), ('A', 'C'), ('A', 'D')]
+	assert result['meandiff'].values == pytest.approx((means[['B', 'C', 'D']] - means['A']).values)
+	# Dunnett's test only adjusts for the comparisons with the control, so it is less conservative than Tukey's test.
+	tukey_table = tukey.tukey_hsd(groups['value'], groups['group'])
+	assert (result['p-adj'].values <= tukey_table['p-adj'].values[:3] + 1E-6).all()
+	assert result['reject'].tolist() == (result['p-adj'] < 0.05).tolist()
+
+	stats = pytest.importorskip('scipy.stats')
+	if not hasattr(stats, 'dunnett'):
+		pytest.skip("This version of scipy doesn't have Dunnett's test.")
+	samples = [groups.loc[groups['group'] == group, 'value'].values for group in ['B', 'C', 'D']]
+	expected = stats.dunnett(*samples, control = groups.loc[groups['group'] == 'A', 'value'].values)
+	assert result['t'].values == pytest.approx(expected.statistic)
+	assert result['p-adj'].values == pytest.approx(expected.pvalue, abs = 5E-3)
+
+
+def test_dunnett_missing_control(groups):
+	with pytest.raises(ValueError):
+		tukey.dunnett(groups['value'], groups['group'], 'E')
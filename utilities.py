@@ -11,6 +11,61 @@ def checkdir(path:Union[str,Path])->Path:
 	if not path.exists():
 		path.mkdir()
 	return path
+
+
+def read_table(filename: Union[str, Path], dtypes: Optional[Dict[str, Any]] = None) -> pandas.DataFrame:
+	"""
+		Reads a table based on the file extension. Supports tab/comma-delimited text, excel, parquet and feather files.
+	Parameters
+	----------
+	filename: Union[str, Path]
+	dtypes: Optional[Dict[str, Any]]
+		Maps column names to the dtype to use for that column. Columns missing from the table are ignored.
+	"""
+	filename = Path(filename)
+	if filename.suffix == '.csv':
+		table = pandas.read_csv(filename, dtype = dtypes)
+	elif filename.suffix == '.tsv':
+		table = pandas.read_csv(filename, sep = '\t', dtype = dtypes)
+	elif filename.suffix == '.xlsx' or filename.suffix == '.xls':
+		table = pandas.read_excel(filename, dtype = dtypes)
+	elif filename.suffix == '.parquet':
+		table = pandas.read_parquet(filename)
+	elif filename.suffix == '.feather':
+		table = pandas.read_feather(filename)
+	else:
+		message = f"Cannot determine the filetype of '{filename}'"
+		raise ValueError(message)
+
+	# The binary formats already store the dtype of each column, but make sure they match in case an older file is read.
+	if dtypes and filename.suffix in {'.parquet', '.feather'}:
+		table = table.astype({key: value for key, value in dtypes.items() if key in table.columns})
+	return table
+
+
+def save_table(table: pandas.DataFrame, filename: Union[str, Path], index: bool = True):
+	"""
+		Saves a table based on the file extension. Supports tab/comma-delimited text, parquet and feather files.
+		The index is saved as a regular column so that each format is read back as the same table.
+	"""
+	filename = Path(filename)
+	if filename.suffix == '.csv':
+		table.to_csv(filename, index = index)
+	elif filename.suffix == '.tsv':
+		table.to_csv(filename, sep = '\t', index = index)
+	elif filename.suffix in {'.parquet', '.feather'}:
+		table = table.reset_index() if index else table.reset_index(drop = True)
+		# Both formats require string column labels.
+		table.columns = [str(i) for i in table.columns]
+		if filename.suffix == '.parquet':
+			table.to_parquet(filename, index = False)
+		else:
+			table.to_feather(filename)
+	else:
+		message = f"Cannot determine the filetype of '{filename}'"
+		raise ValueError(message)
+
+
 def get_sample_metadata(sample_label: str) -> Dict[str, str]:
 	""" Extracts metadata contained in the sample name.
 		Assume the sample name is formatted as '{strain}.{condition}.{plate}.{replicate}'
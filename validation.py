@@ -1,10 +1,12 @@
 from pathlib import Path
-from pathlib import Path
-from typing import Optional, Tuple, Union
+from typing import List, Optional, Tuple, Union
 
+import numpy
 import pandas
 from loguru import logger
 
+import utilities
+
 EXPECTED_FORMAT = "[strain].[consition].[plate].[replicate]"
 AUC_COLUMN = 'auc_e'
 
@@ -22,16 +24,7 @@ class ValidateTable:
 
 	@staticmethod
 	def read_table(filename: Union[str, Path]) -> pandas.DataFrame:
-		if filename.suffix == '.csv':
-			table = pandas.read_csv(filename)
-		elif filename.suffix == '.tsv':
-			table = pandas.read_csv(filename, sep = '\t')
-		elif filename.suffix == '.xlsx' or filename.suffix == '.xls':
-			table = pandas.read_excel(filename)
-		else:
-			message = f"Cannot determine the filetype of '{filename}'"
-			raise ValueError(message)
-		return table
+		return utilities.read_table(filename)
 
 	def check_table(self, table: Union[Path, pandas.DataFrame]) -> pandas.DataFrame:
 		if not isinstance(table, pandas.DataFrame):
@@ -57,11 +50,14 @@ class ValidateTable:
 
 		return table
 
-	def _check_maximum_growth(self, table: pandas.DataFrame) -> None:
-		for column in table.columns:
-			maximum_growth = table[column].max()
-			if maximum_growth < self.minimum_growth:
-				logger.warning(f"The sample '{column}' showed no growth ({maximum_growth} < {self.minimum_growth})")
+	def _check_maximum_growth(self, table: pandas.DataFrame) -> List[str]:
+		""" Returns the samples whose largest value is below `self.minimum_growth`."""
+		samples = table[[column for column in table.columns if column.lower() != 'time']]
+		maximum_growth = samples.max().fillna(numpy.inf)
+		no_growth = maximum_growth[maximum_growth < self.minimum_growth]
+		for column, value in no_growth.items():
+			logger.warning(f"The sample '{column}' showed no growth ({value} < {self.minimum_growth})")
+		return list(no_growth.index)
 
 	def _check_column_labels(self, table: pandas.DataFrame) -> pandas.DataFrame:
 		new_columns = list()